@@ -35,6 +35,7 @@ START USER-EDITED VARIABLES:
 run_doc_root_dir = 'run_documentation_files/'
 run_doc_dir = '0717_5pt_sweep_2/' # the name of your run folder
 dut_dir = 'DUT_runs/' # shouldn't need to change
+cideal_dir = 'Cideal_runs/' # shouldn't need to change
 operating_point = 'trap_dvdt_0.5' # the point of interest in sweep. no txt or csv extension
 
 # optional gaussian smoothing variables
@@ -78,6 +79,8 @@ show_deskewing_plot = False # whether to show plot for manual deskewing
 use_custom_deskewing = True
 vout_plus_custom_deskew = -0.1 * 1e-9 # [seconds] to right
 vout_minus_custom_deskew = 0.85 * 1e-9 # [seconds] to right
+deskew_strategy = None # None for the custom deskews above, or 'mse', 'hybrid', 'hybrid_bounded' or 'xcorr'
+    # to find them from this operating point's Cideal capture instead, like the run did (see find_deskew)
 
 # plots to enable or disable
 plot_input_traces = False # shows plot of scope data after cdiv scaling has happened
@@ -142,10 +145,18 @@ if smoothing:
     scope_smoothed = scope_data.copy() # for later plotting
     
 """
-Perform optional deskewing of vout+ and vout- using user-defined variables
+Perform optional deskewing of vout+ and vout- using user-defined variables or deskew_strategy
 """
 
-if use_custom_deskewing:
+if deskew_strategy is not None: # deskews from the Cideal capture at this operating point instead
+    cideal_file = run_doc_root_dir + run_doc_dir + cideal_dir + operating_point + '.csv'
+    cideal_data = np.loadtxt(cideal_file, delimiter=',', skiprows=0)
+    [vout_plus_custom_deskew, vout_minus_custom_deskew] = find_deskew(
+        cideal_data, freq, trap_dvdt, cref, deskew_strategy)
+    print('Cideal deskews by ' + deskew_strategy + ' [ns]: vout+ ' + str(vout_plus_custom_deskew*1e9) + \
+          ', vout- ' + str(vout_minus_custom_deskew*1e9))
+
+if use_custom_deskewing or deskew_strategy is not None:
     scope_data = data_array_time_shift_one_signal(scope_data, 0, 1, vout_plus_custom_deskew)
     scope_data = data_array_time_shift_one_signal(scope_data, 0, 2, vout_minus_custom_deskew)
 
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Times and checks the deskew and Ediss routines offline on synthesized captures
+(helper_code/equipment_control/sawyer_tower_synthesizer.py), where the channel
+skews and the DUT's Ediss are known.
+
+For each trap_dvdt: a Cideal capture is deskewed with find_deskew_MSE_Ediss_hybrid,
+the deskew is applied to a DUT capture at the same operating point like
+run_operating_point_DUT_trap does, and calculate_Ediss_trap is compared with the
+synthesizer's ground truth Ediss. Captures are averages of 5 noisy frames,
+quantized to 8 bits with window_scope's channel scales, and AC coupled.
+
+Before that, data_array_time_shift_one_signal and time_shift_signal_into are
+checked against the original per-sample loop (reference_time_shift, which
+tests/test_time_shift.py also checks them against) on synthesized captures,
+raising if they differ, and timed against it. find_deskew_MSE_Ediss_hybrid is
+likewise checked against its original one-skew-at-a-time loop
+(reference_deskew_MSE_Ediss_hybrid) at every trap_dvdt; its time includes
+the figure it draws, about half of it.
+
+The 101 shifts of one deskew search are also timed one time_shift_signal_into
+at a time against time_shifts_of_signal's batched linear, 'fft' and 'sinc'
+(helper_code/fractional_delay.py) methods.
+
+Last, every find_deskew strategy ('mse', 'hybrid', 'hybrid_bounded', 'xcorr'
+with parabolic or sinc peak interpolation), and 'hybrid' searching with 'fft'
+or 'sinc' fractional delays, deskews the same captures, with the
+error of its deskews and of the DUT Ediss they give, and the Ediss evaluations
+the vout+ search of the hybrid ones took (from their info dict). The
+'hybrid_bounded' vout+ deskew has to be within find_ch1_skew_bounded's
+tolerance of the |Ediss| minimum on a grid that fine, or this raises: the
+0.1 ns grid of 'hybrid' can be up to half a step from that minimum.
+"""
+
+import time
+import numpy as np
+import matplotlib.pyplot as plt
+from helper_code.equipment_control.sawyer_tower_synthesizer import SawyerTowerSynthesizer, gan_coss_curve
+from helper_code.helper_functions import L_guess_trap, find_deskew_MSE_Ediss_hybrid, calculate_Ediss_trap, \
+    data_array_time_shift_one_signal, time_shift_signal_into, scale_scope_data_w_cdivs, MSE, \
+    gaussian_average_specifying_stdev_time, data_array_set_t0_at_value_crossing, find_deskew, find_deskew_xcorr, \
+    time_shifts_of_signal, calculate_Ediss_trap_for_ch1_skews
+
+freq = 2 # [MHz]
+v_pp = 450 # [V]
+cref = 516 # [pF]
+cideal = 204 # [pF]
+dut_coss = gan_coss_curve() # [F] as a function of V
+dut_hysteresis = 0.02
+trap_dvdts = [0.3, 0.5, 0.7]
+probe_cdivs = [0.1, 0.1, 0.1]
+channel_skews = [0.5e-9, -0.3e-9, 0, 0.2e-9] # [s] what deskewing has to undo
+noise = [0.05, 0.05, 0.02, 0.05] # [V] rms at the scope input
+screen_points = 1000
+number_of_frames = 5 # averaged per capture, like capture_averaged
+bounded_tolerance = 10e-12 # [s] find_ch1_skew_bounded's tolerance
+
+def synthesizer_for(coss, hysteresis, trap_dvdt, seed):
+    # synthesizer at the trap_dvdt operating point, inductors set from L_guess_trap
+    synthesizer = SawyerTowerSynthesizer(cref*1e-12, coss, hysteresis, probe_cdivs=probe_cdivs,
+                                         channel_skews=channel_skews, noise=noise, seed=seed)
+    synthesizer.setOperatingPoint(freq*1e6, v_pp/2, 0.5, 1e-6, 1e-6) # to get the node capacitance
+    [L, duty] = L_guess_trap(freq, trap_dvdt, synthesizer.node_capacitance*1e12)
+    synthesizer.setOperatingPoint(freq*1e6, v_pp/2, duty, L*1e-6, L*1e-6)
+    return synthesizer
+
+def capture(synthesizer):
+    # [t, ch1, ch2, ch3, ch4] like capture_averaged, scope volts
+    t = (np.arange(screen_points) - screen_points/2) * (3/(freq*1e6)/screen_points) # 3 periods
+    frames = synthesizer.frames(t, number_of_frames)
+    channel_scales = np.array([probe_cdivs[0], probe_cdivs[1], 0, probe_cdivs[2]]) * v_pp/2 * 1.4/8
+    channel_scales[2] = 8/8 # gate channel, window_probe3
+    volts_per_code = 10 * channel_scales / 256
+    for n in [0, 1, 3]: # AC coupled
+        frames[:, n] -= np.mean(frames[:, n], axis=1)[:, None]
+    frames = np.round(frames / volts_per_code[None, :, None]) * volts_per_code[None, :, None]
+    return np.column_stack([t, np.mean(frames, axis=0).T])
+
+def reference_time_shift(data_array, t_col, d_col, shift):
+    # data_array_time_shift_one_signal as it was, one np.interp call per sample
+    t = data_array[:,t_col]
+    t_new = t + shift
+    d = data_array[:,d_col]
+    d_new = np.zeros(len(d))
+    for index in range(len(t)):
+        t_val = t[index]
+        if t_val < t_new[0]:
+            d_new[index] = d[0]
+        elif t_val > t_new[-1]:
+            d_new[index] = d[-1]
+        else:
+            d_new[index] = np.interp(t_val, t_new, d)
+    data_array[:,d_col] = d_new
+    return data_array
+
+def reference_deskew_MSE_Ediss_hybrid(scope_data_og, freq, trap_dvdt, cref):
+    # find_deskew_MSE_Ediss_hybrid as it was, copying and shifting the capture sample by sample for each skew
+    scope_data = scope_data_og.copy()
+    ch1_norm = np.average([abs(x) for x in scope_data[:,1]])
+    ch2_norm = np.average([abs(x) for x in scope_data[:,2]])
+    ch4_norm = np.average([abs(x) for x in scope_data[:,4]])
+    scope_data[:,1] = scope_data[:,1] / ch1_norm
+    scope_data[:,2] = scope_data[:,2] / ch2_norm
+    scope_data[:,4] = scope_data[:,4] / ch4_norm
+    skew_step = 0.1e-9
+    skew_range = 5e-9
+    t_res = scope_data[1, 0] - scope_data[0, 0]
+    period_points = (1 / freq) / t_res
+    half_slope_points = round((period_points / 4 * trap_dvdt) / 2)
+    scope_smooth = scope_data.copy()
+    scope_smooth[:,1] = gaussian_average_specifying_stdev_time(sig = scope_smooth[:,1], t_res = t_res, t_stdev = 1e-9)
+    scope_smooth = data_array_set_t0_at_value_crossing(scope_smooth, 0, 1, 0, True, 6)
+    scope_data[:,0] = scope_smooth[:,0]
+    t0_index = np.argmax(scope_data[:,0] >= 0)
+    istart1 = t0_index - half_slope_points - 1
+    istop1 = t0_index + round(period_points)
+    ch2_skew_mse = []
+    skew_points = np.arange(-skew_range, skew_range + skew_step/2, skew_step)
+    for skew_val in skew_points:
+        current_data = reference_time_shift(scope_data.copy(), 0, 2, skew_val)
+        ch2_skew_mse.append(MSE(current_data[istart1:istop1, 2], current_data[istart1:istop1, 4]))
+    ch2_skew = skew_points[np.argmin(ch2_skew_mse)]
+    scope_data = reference_time_shift(scope_data, 0, 2, ch2_skew)
+    scope_data[:,1] = scope_data[:,1] * ch1_norm
+    scope_data[:,2] = scope_data[:,2] * ch2_norm
+    scope_data[:,4] = scope_data[:,4] * ch4_norm
+    ch1_skew_Ediss = []
+    for skew_val in skew_points:
+        current_data = reference_time_shift(scope_data.copy(), 0, 1, skew_val)
+        ch1_skew_Ediss.append(abs(calculate_Ediss_trap(current_data, freq, trap_dvdt, cref)))
+    return [skew_points[np.argmin(ch1_skew_Ediss)], ch2_skew]
+
+def best_time(function, *args, repeats=3):
+    times = []
+    for n in range(repeats):
+        t_start = time.perf_counter()
+        output = function(*args)
+        times.append(time.perf_counter() - t_start)
+    return [output, min(times)]
+
+plt.switch_backend('Agg') # find_deskew_MSE_Ediss_hybrid plots
+
+# synthesizer speed
+synthesizer = synthesizer_for(dut_coss, dut_hysteresis, 0.5, 0)
+t = np.linspace(-750e-9, 750e-9, screen_points)
+[frames, frames_time] = best_time(synthesizer.frames, t, 100)
+t_start = time.perf_counter()
+for n in range(100): # new inductor value each time, so the period table is recomputed
+    synthesizer.setOperatingPoint(freq*1e6, v_pp/2, 0.75, (4 + n*0.001)*1e-6, 4e-6)
+operating_point_time = (time.perf_counter() - t_start) / 100
+print('Synthesizer: ' + str(round(100/frames_time)) + ' frames/s (' + str(screen_points) + ' points, 4 channels), ' + \
+      str(round(1/operating_point_time)) + ' operating point changes/s\n')
+
+# time shift: same output as the per-sample loop, and how long one shift takes
+data = capture(synthesizer)
+t_step = data[1, 0] - data[0, 0]
+shifts = [0, t_step, -3*t_step, 0.37e-9, -2.71e-9, 1e-6, -5e-6] # exact samples, fractions, past the edges
+shifts += list(np.random.default_rng(0).uniform(-5e-9, 5e-9, 50))
+buffer = np.empty(len(data))
+for shift in shifts:
+    for column in [1, 2, 4]:
+        expected = reference_time_shift(data.copy(), 0, column, shift)
+        shifted = data_array_time_shift_one_signal(data.copy(), 0, column, shift)
+        time_shift_signal_into(data[:, 0], data[:, column], shift, buffer)
+        if not(np.array_equal(expected, shifted) and np.array_equal(expected[:, column], buffer)):
+            raise Exception('Time shift by ' + str(shift) + ' s differs from the per-sample loop.')
+print('Time shift matches the per-sample loop for ' + str(len(shifts)) + ' shifts x 3 channels')
+for points in [screen_points, 10*screen_points]:
+    t = np.linspace(-750e-9, 750e-9, points)
+    data = np.column_stack([t, synthesizer.frames(t, 1)[0].T])
+    [output, loop_time] = best_time(reference_time_shift, data.copy(), 0, 1, 0.37e-9)
+    [output, vector_time] = best_time(data_array_time_shift_one_signal, data, 0, 1, 0.37e-9, repeats=20)
+    [output, into_time] = best_time(time_shift_signal_into, data[:, 0], data[:, 1], 0.37e-9, np.empty(points),
+                                    repeats=20)
+    print(str(points) + ' points: per-sample loop ' + str(round(loop_time*1e3, 2)) + ' ms, data_array_time_shift_one_signal ' + \
+          str(round(vector_time*1e6, 1)) + ' us, time_shift_signal_into ' + str(round(into_time*1e6, 1)) + ' us')
+
+# all 101 skews of a deskew search: one time_shift_signal_into per skew against one batched call per method
+skews = np.arange(-5e-9, 5e-9 + 0.05e-9, 0.1e-9)
+t = np.linspace(-750e-9, 750e-9, screen_points)
+sig = synthesizer.frames(t, 1)[0][0]
+def shift_one_at_a_time(t, sig, skews):
+    buffer = np.empty(len(sig))
+    for skew in skews:
+        time_shift_signal_into(t, sig, skew, buffer)
+[output, into_time] = best_time(shift_one_at_a_time, t, sig, skews, repeats=20)
+batch_times = []
+for method in ['linear', 'fft', 'sinc']:
+    [output, batch_time] = best_time(time_shifts_of_signal, t, sig, skews, None, method, repeats=20)
+    batch_times.append(method + ' ' + str(round(batch_time*1e3, 2)) + ' ms')
+print(str(len(skews)) + ' skews of ' + str(screen_points) + ' points: time_shift_signal_into per skew ' + \
+      str(round(into_time*1e3, 2)) + ' ms, time_shifts_of_signal ' + ', '.join(batch_times))
+print()
+
+print('trap_dvdt  true Ediss [nJ]  measured [nJ]  error [%]  deskew found [ns]    deskew expected [ns]  deskew time [s]  ' + \
+      'original deskew time [s]  Ediss time [s]')
+expected_deskews = [channel_skews[3] - channel_skews[0], channel_skews[3] - channel_skews[1]]
+for trap_dvdt in trap_dvdts:
+    cideal_synthesizer = synthesizer_for(cideal*1e-12, 0, trap_dvdt, 1)
+    dut_synthesizer = synthesizer_for(dut_coss, dut_hysteresis, trap_dvdt, 2)
+    # trap_dvdt the helpers see is what was asked for, the transitions are what the inductors give
+    cideal_data = scale_scope_data_w_cdivs(capture(cideal_synthesizer), probe_cdivs)
+    dut_data = scale_scope_data_w_cdivs(capture(dut_synthesizer), probe_cdivs)
+    [deskews, deskew_time] = best_time(find_deskew_MSE_Ediss_hybrid, cideal_data, freq*1e6, trap_dvdt, cref*1e-12)
+    plt.close('all')
+    [reference_deskews, reference_time] = best_time(reference_deskew_MSE_Ediss_hybrid, cideal_data, freq*1e6, trap_dvdt,
+                                                    cref*1e-12, repeats=1)
+    if not(np.array_equal(deskews, reference_deskews)):
+        raise Exception('find_deskew_MSE_Ediss_hybrid found ' + str(deskews) + ', the original ' + \
+                        str(reference_deskews) + '.')
+    dut_deskewed = data_array_time_shift_one_signal(dut_data.copy(), 0, 1, deskews[0])
+    dut_deskewed = data_array_time_shift_one_signal(dut_deskewed, 0, 2, deskews[1])
+    [Ediss, Ediss_time] = best_time(calculate_Ediss_trap, dut_deskewed, freq*1e6, trap_dvdt, cref*1e-12)
+    truth = dut_synthesizer.groundTruthEdiss()
+    print(str(trap_dvdt).ljust(11) + str(round(truth*1e9, 2)).ljust(17) + str(round(Ediss*1e9, 2)).ljust(15) + \
+          str(round((Ediss - truth)/truth*100, 1)).ljust(11) + str(np.round(np.array(deskews)*1e9, 3)).ljust(21) + \
+          str(np.round(np.array(expected_deskews)*1e9, 3)).ljust(22) + str(round(deskew_time, 4)).ljust(17) + \
+          str(round(reference_time, 3)).ljust(26) + str(round(Ediss_time, 5)))
+
+print('\nstrategy          trap_dvdt  deskew found [ns]      deskew error [ps]  Ediss error [%]  deskew time [s]  ' + \
+      'Ediss evaluations')
+strategies = [[name, find_deskew, [name]] for name in ['mse', 'hybrid', 'hybrid_bounded']] + \
+    [['hybrid ' + method, find_deskew_MSE_Ediss_hybrid, ['grid', method]] for method in ['fft', 'sinc']] + \
+    [['xcorr ' + interpolation, find_deskew_xcorr, [interpolation]] for interpolation in ['parabolic', 'sinc']]
+grid_optima = []
+for trap_dvdt in trap_dvdts:
+    cideal_data = scale_scope_data_w_cdivs(capture(synthesizer_for(cideal*1e-12, 0, trap_dvdt, 1)), probe_cdivs)
+    dut_synthesizer = synthesizer_for(dut_coss, dut_hysteresis, trap_dvdt, 2)
+    dut_data = scale_scope_data_w_cdivs(capture(dut_synthesizer), probe_cdivs)
+    truth = dut_synthesizer.groundTruthEdiss()
+    for [name, function, options] in strategies:
+        info = {}
+        if function == find_deskew_xcorr:
+            arguments = [cideal_data, freq*1e6, trap_dvdt] + options
+        else:
+            arguments = [cideal_data, freq*1e6, trap_dvdt, cref*1e-12] + options + [info]
+        [deskews, deskew_time] = best_time(function, *arguments)
+        plt.close('all')
+        evaluations = str(info.get('Ediss evaluations', '-'))
+        if name == 'hybrid_bounded': # vout+ against the |Ediss| minimum on a grid as fine as its tolerance
+            ch2_deskewed = data_array_time_shift_one_signal(cideal_data.copy(), 0, 2, deskews[1])
+            fine_skews = np.arange(-5e-9, 5e-9 + bounded_tolerance/2, bounded_tolerance)
+            fine_Ediss = np.abs(calculate_Ediss_trap_for_ch1_skews(ch2_deskewed, freq*1e6, trap_dvdt, cref*1e-12,
+                                                                   fine_skews))
+            grid_optimum = fine_skews[np.argmin(fine_Ediss)]
+            grid_optima.append(str(trap_dvdt) + ': ' + str(round(grid_optimum*1e9, 3)) + ' ns')
+            if abs(deskews[0] - grid_optimum) > bounded_tolerance:
+                raise Exception('hybrid_bounded found a vout+ deskew of ' + str(deskews[0]) + ' s, ' + \
+                                str(bounded_tolerance) + ' s grid optimum ' + str(grid_optimum) + ' s.')
+        dut_deskewed = data_array_time_shift_one_signal(dut_data.copy(), 0, 1, deskews[0])
+        dut_deskewed = data_array_time_shift_one_signal(dut_deskewed, 0, 2, deskews[1])
+        Ediss = calculate_Ediss_trap(dut_deskewed, freq*1e6, trap_dvdt, cref*1e-12)
+        print(name.ljust(18) + str(trap_dvdt).ljust(11) + str(np.round(np.array(deskews)*1e9, 4)).ljust(23) + \
+              str(np.round((np.array(deskews) - expected_deskews)*1e12, 1)).ljust(19) + \
+              str(round((Ediss - truth)/truth*100, 1)).ljust(17) + str(round(deskew_time, 4)).ljust(17) + evaluations)
+print('vout+ |Ediss| minimum on a ' + str(round(bounded_tolerance*1e12)) + ' ps grid, which hybrid_bounded matches: ' + \
+      ', '.join(grid_optima))
@@ -46,6 +46,7 @@ def hardware_setup_generation(hw_file_name, scope, HV_supply, LV_supply, arduino
     print(' done\n')
     turn_system_on(HV_supply, LV_supply, arduino)
     input('Please adjust the scope such that at least two cycles of the waveform appear, then press enter.\n')
+    scope.invalidate() # settings may have been changed from the front panel
     probe1_vamp_100 = float(scope.queryMeasItem("VAMP", 1))/100 # measured divided by true value
     probe2_vamp_100 = float(scope.queryMeasItem("VAMP", 2))/100
     probe4_vamp_100 = abs(float(scope.queryMeasItem("VAMP", 4))/(100*(C_ref - C_cal)/(C_ref + C_cal)))
@@ -59,6 +60,7 @@ def hardware_setup_generation(hw_file_name, scope, HV_supply, LV_supply, arduino
     print(' done\n')
     turn_system_on(HV_supply, LV_supply, arduino)
     input('Please adjust the scope such that at least two cycles of the waveform appear, then press enter.\n')
+    scope.invalidate() # settings may have been changed from the front panel
     probe1_vamp_150 = float(scope.queryMeasItem("VAMP", 1))/150
     probe2_vamp_150 = float(scope.queryMeasItem("VAMP", 2))/150
     probe4_vamp_150 = abs(float(scope.queryMeasItem("VAMP", 4))/(150*(C_ref - C_cal)/(C_ref + C_cal)))
@@ -72,6 +74,7 @@ def hardware_setup_generation(hw_file_name, scope, HV_supply, LV_supply, arduino
     print(' done\n')
     turn_system_on(HV_supply, LV_supply, arduino)
     input('Please adjust the scope such that at least two cycles of the waveform appear, then press enter.\n')
+    scope.invalidate() # settings may have been changed from the front panel
     probe1_vamp_200 = float(scope.queryMeasItem("VAMP", 1))/200
     probe2_vamp_200 = float(scope.queryMeasItem("VAMP", 2))/200
     probe4_vamp_200 = abs(float(scope.queryMeasItem("VAMP", 4))/(200*(C_ref - C_cal)/(C_ref + C_cal)))
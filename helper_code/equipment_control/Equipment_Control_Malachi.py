@@ -6,14 +6,113 @@ import serial
 import time
 import pyvisa
 import numpy as np
+import threading
+from contextlib import contextmanager
+
+#shared by the SCPI drivers over pyvisa (MSO5000, DP832)
+class SCPIMixin:
+    # command batching (batch) and how the driver waits for commands to finish (setSyncMode)
+    # needs self.inst, self.io_lock, self.sync_mode, self.batch_depth, self.batch_cmds,
+    # self.invalidate(), CMD_DELAY and MAX_BATCH_LENGTH from the driver
+    SYNC_MODES = ['DELAY', 'OPC', 'WAI']
+    
+    def sendCMD(self, cmd):
+        if self.batch_depth > 0:
+            self.batch_cmds.append(cmd) # sent when the batch ends
+        else:
+            self.__write_cmd__(cmd)
+    
+    @contextmanager
+    def batch(self):
+        # Collects the commands sent inside a 'with scope.batch():' block and sends
+        # them as a few ';'-concatenated writes when the block ends, so the command
+        # delay/synchronisation is paid once per write instead of once per command
+        # Queries inside the block send the commands collected so far first
+        # Blocks can be nested: commands go out when the outermost block ends
+        # holds io_lock, so another thread's commands can't end up in this batch
+        with self.io_lock:
+            self.batch_depth += 1
+            try:
+                yield self
+            finally:
+                self.batch_depth -= 1
+                if self.batch_depth == 0:
+                    self.flushBatch()
+    
+    def flushBatch(self):
+        # sends any commands collected by batch(), joined into as few writes as possible
+        # each command gets a leading ':' so it's parsed from the root of the SCPI tree
+        cmds = self.batch_cmds
+        self.batch_cmds = []
+        joined = ''
+        try:
+            for cmd in cmds:
+                if not(cmd.startswith(':') or cmd.startswith('*')):
+                    cmd = ':' + cmd
+                # leave room for the ';*WAI' that __write_cmd__ may append
+                if joined and len(joined) + len(cmd) + 1 > self.MAX_BATCH_LENGTH - len(';*WAI'):
+                    self.__write_cmd__(joined) # this write is full, start the next one
+                    joined = ''
+                joined = (joined + ';' + cmd) if joined else cmd
+            if joined:
+                self.__write_cmd__(joined)
+        except Exception:
+            self.invalidate() # don't know which queued settings made it to the instrument
+            raise
+    
+    def queryCMD(self, cmd):
+        with self.io_lock: # reply must belong to this query, not another thread's
+            self.flushBatch() # query reply may depend on commands waiting in a batch
+            self.inst.write(cmd)
+            self.__query_delay__()
+            rxVal = self.inst.read()
+        return rxVal
+    
+    def __write_cmd__(self, cmd):
+        # writes cmd (possibly several ';'-joined commands) and waits per sync_mode
+        with self.io_lock:
+            if self.sync_mode == 'WAI':
+                self.inst.write(cmd + ';*WAI') # instrument holds later commands until this one is done
+            else:
+                self.inst.write(cmd)
+            if self.sync_mode == 'OPC':
+                self.inst.query('*OPC?') # blocks until the instrument has finished the command
+            else:
+                self.__query_delay__()
+    
+    def __query_delay__(self):
+        # fixed delay only in DELAY mode: otherwise reads just block until the reply
+        # arrives, bounded by the VISA timeout
+        if self.sync_mode == 'DELAY':
+            time.sleep(self.CMD_DELAY)
+    
+    def setSyncMode(self, sync_mode):
+        # Sets how the driver waits for commands to finish:
+        # 'DELAY': sleep CMD_DELAY after every write (original behaviour, kept as a
+            # fallback for firmware quirks)
+        # 'OPC': after every command, block on *OPC? until the instrument reports it's done
+        # 'WAI': append *WAI so the instrument finishes each command before starting the
+            # next; the host doesn't wait at all until it reads a query reply
+        if sync_mode not in self.SYNC_MODES:
+            raise Exception('Sync mode must be one of ' + str(self.SYNC_MODES) + ', not ' + str(sync_mode))
+        self.sync_mode = sync_mode
 
 #RIGOL MSO5000 series oscilloscope (we have lots of MSO5074 scopes)
-class MSO5000:
+class MSO5000(SCPIMixin):
     CMD_DELAY = 0.1
     TIMEOUT = 5.0
+    WAV_FORMATS = ['ASCii', 'BYTE', 'WORD'] # waveform transfer formats the scope supports
+    MAX_RAW_CHUNK_POINTS = {'ASCii': 15625, 'BYTE': 250000, 'WORD': 125000} # per WAV:DATA? in RAW mode
+    SCREEN_POINTS = 1000 # points per channel on the screen, ie WAV:STOP for a whole NORMal read
+    MAX_BATCH_LENGTH = 256 # max characters in one ';'-concatenated batch write
+    STATUS_POLL_INTERVAL = 0.005 # [s] between trigger status queries while waiting for an acquisition
+    MAX_MEAS_ITEMS = 10 # measurement items the scope shows at once, oldest gets replaced
+    RESOURCE_MANAGER_CLASS = pyvisa.ResourceManager # swapped for a simulated bench in simulated_equipment
     
-    def __init__(self, visa_name): # visa_name is likely something like 'USB0::0x1AB1::0x0515::MS5A243807653::INSTR'
-        self.rm = pyvisa.ResourceManager()
+    def __init__(self, visa_name, wav_format='BYTE', sync_mode='DELAY'): # visa_name is likely something like 'USB0::0x1AB1::0x0515::MS5A243807653::INSTR'
+        # wav_format: 'BYTE' or 'WORD' for binary waveform transfer, 'ASCii' as a fallback
+        # sync_mode: how to wait for commands to finish, see setSyncMode
+        self.rm = self.RESOURCE_MANAGER_CLASS()
         self.rm.list_resources()
         
         # initialize connection. Tries a few times then quits if it's not working
@@ -29,6 +128,15 @@ class MSO5000:
         if not(self.connected):
             print("\nRIGOL MSO5000 unable to connect. Double check USB address using Ultra Sigma software, as well as USB connection, then try again.")
             raise(SystemExit)
+        self.inst.timeout = self.TIMEOUT * 1000 # VISA timeout is in ms
+        self.setSyncMode(sync_mode)
+        self.batch_depth = 0 # > 0 while inside a batch() block
+        self.batch_cmds = [] # commands waiting to be sent when the batch ends
+        self.io_lock = threading.RLock() # held for each exchange with the scope, see startAcquisitionThread
+        self.acquisition_thread = None
+        self.settings = {} # shadow copy of settings last written, {header: value}, see setSetting
+        self.meas_items = [] # [item, source] measurements added to the screen, oldest first
+        self.joined_meas_queries = True # False once the scope fails to answer ';'-joined queries
         
         # check the IDN is correct. If not, quit
         self.devID = self.inst.query("*IDN?")
@@ -42,18 +150,62 @@ class MSO5000:
             print("Actual value: " + self.devID)
             print("Double check equipment type and expected IDN, then try again")
             raise(SystemExit)
+        self.setWaveformFormat(wav_format)
+        self.last_transfer_bytes = 0 # bytes received in the most recent WAV:DATA? reply
+        self.wav_mode = None # WAV:MODE and WAV:SOURce last sent, to look up cached preambles
+        self.wav_source = None
+        self.preamble_cache = {} # preamble per (wav_mode, wav_format, wav_source), for y scaling
+        self.timebase_cache = {} # [xinc, xorigin] per wav_mode, shared by all sources
         return
     
-    def sendCMD(self, cmd):
-        self.inst.write(cmd)
-        time.sleep(self.CMD_DELAY)
-        
-    def queryCMD(self, cmd):
-        self.inst.write(cmd)
-        time.sleep(self.CMD_DELAY)
-        rxVal = self.inst.read()
+    def queryBinaryCMD(self, cmd):
+        # like queryCMD, but returns the raw bytes of an IEEE-488.2 definite length block
+        # keeps reading until the whole block (as stated in its header) has arrived
+        with self.io_lock:
+            self.flushBatch()
+            self.inst.write(cmd)
+            self.__query_delay__()
+            rxVal = self.inst.read_raw()
+            [header_length, data_length] = self.blockHeaderLengths(rxVal)
+            while len(rxVal) < header_length + data_length:
+                rxVal += self.inst.read_raw()
         return rxVal
     
+    def setSetting(self, header, value):
+        # writes 'header value' (eg ':CHANnel1:SCALe', 0.5) unless the shadow copy says the
+        # scope already has that value, which saves a write + delay for unchanged settings
+        # returns True if the command was sent, False if it was skipped
+        # the shadow copy only knows what this object wrote: call invalidate() after the
+        # front panel (or anything else) may have changed the scope
+        value = str(value)
+        if self.settings.get(header) == value:
+            return False
+        self.settings.pop(header, None) # unknown until the write goes through
+        self.sendCMD(header + ' ' + value)
+        self.settings[header] = value
+        return True
+    
+    def invalidate(self, header_prefix=None):
+        # forgets the shadow copy of the settings so the next setters always write
+        # header_prefix: only forget headers starting with it, eg ':CHANnel1:'
+            # None forgets everything, including the cached waveform preambles
+        if header_prefix is None:
+            self.settings = {}
+            self.meas_items = []
+            self.invalidatePreambleCache()
+        else:
+            for header in list(self.settings):
+                if header.startswith(header_prefix):
+                    del self.settings[header]
+    
+    def setWaveformFormat(self, wav_format):
+        # Sets the format used to transfer waveforms: 'BYTE', 'WORD', or 'ASCii'
+        # BYTE is 1 byte per point and is fastest; WORD is for higher resolution
+        # acquisition types; ASCii is kept as a fallback but is much slower
+        if wav_format not in self.WAV_FORMATS:
+            raise Exception('Waveform format must be one of ' + str(self.WAV_FORMATS) + ', not ' + str(wav_format))
+        self.wav_format = wav_format
+    
     def run(self):
         self.sendCMD("RUN")
         
@@ -68,15 +220,16 @@ class MSO5000:
         
     def autoscale(self):
         self.sendCMD("AUT")
+        self.invalidate() # autoscale changes timebase, channel scales, trigger...
         
     def clear(self):
         self.sendCMD("CLE")
         
     def turnChannelOn(self, channel_index):
-        self.sendCMD(':CHANnel' + str(channel_index) + ':DISPlay ON')
+        self.setSetting(':CHANnel' + str(channel_index) + ':DISPlay', 'ON')
         
     def turnChannelOff(self, channel_index):
-        self.sendCMD(':CHANnel' + str(channel_index) + ':DISPlay OFF')
+        self.setSetting(':CHANnel' + str(channel_index) + ':DISPlay', 'OFF')
         
     def readChannel(self, channel_index):
         # reads a channel into np.array with columns for time and values
@@ -137,83 +290,446 @@ class MSO5000:
         vals = val_sum / number_of_samples # compute average
         return np.concatenate((t1[:, None], vals), 1)
     
+    def captureSingle(self, channels=None):
+        # arms a single acquisition, waits for the scope to finish it, then reads
+        # every channel from that one frozen acquisition (same trigger for all)
+        # channels: list of channel indices to read, defaults to all channels turned on
+        # returns np.array: column 0 is time, then one column per channel in channels
+        if channels is None:
+            channels = self.getEnabledChannels()
+        output = self.__capture_single_frame__(channels)
+        self.run() # leave the scope running so measurements keep updating
+        return output
+    
+    def captureSingleAveraged(self, number_of_samples, channels=None):
+        # like readAllChannelsAveraged, but every sample is its own single acquisition,
+        # and the scope's trigger status replaces fixed sleeps between samples
+        if channels is None:
+            channels = self.getEnabledChannels()
+        sample1 = self.__capture_single_frame__(channels)
+        t1 = sample1[:,0] # pull out time; will be the same in all samples
+        val_sum = sample1[:,1:] # will sum values then divide to find average
+        for index in range(number_of_samples - 1):
+            val_sum += self.__capture_single_frame__(channels)[:,1:]
+        self.run()
+        vals = val_sum / number_of_samples # compute average
+        return np.concatenate((t1[:, None], vals), 1)
+    
+    def startAcquisitionThread(self, channels=None, buffer_frames=8):
+        # Starts a background thread that keeps capturing single frames (as in captureSingle)
+        # into a ring buffer of buffer_frames preallocated arrays, so that processing
+        # earlier frames (averaging, Ediss...) overlaps with the USB transfer of later ones
+        # read frames with getFrame / getNewFrames, and stop with stopAcquisitionThread
+        # other commands still work while it runs: they wait for the current frame to finish
+        if self.acquisition_thread is not None:
+            self.stopAcquisitionThread()
+        if channels is None:
+            channels = self.getEnabledChannels()
+        first_frame = self.__capture_single_frame__(channels)
+        self.acquisition_channels = channels
+        self.frame_buffer = np.empty((buffer_frames,) + first_frame.shape)
+        self.frame_buffer[0] = first_frame
+        self.frame_count = 1 # frames captured since the thread started
+        self.frame_buffer_start = 0 # first frame number in the current buffer
+        self.frame_condition = threading.Condition()
+        self.acquisition_error = None
+        self.acquisition_stop = threading.Event()
+        self.acquisition_thread = threading.Thread(target=self.__acquisition_loop__, daemon=True)
+        self.acquisition_thread.start()
+    
+    def stopAcquisitionThread(self):
+        # stops the thread after its current frame and leaves the scope running
+        if self.acquisition_thread is None:
+            return
+        self.acquisition_stop.set()
+        self.acquisition_thread.join()
+        self.acquisition_thread = None
+        self.run()
+    
+    @contextmanager
+    def runAcquisitionThread(self, channels=None, buffer_frames=8):
+        # 'with scope.runAcquisitionThread(channels):' keeps the acquisition thread running
+        # for the block and stops it at the end, even if the block raises
+        self.startAcquisitionThread(channels, buffer_frames)
+        try:
+            yield self
+        finally:
+            self.stopAcquisitionThread()
+    
+    def acquisitionThreadRunning(self):
+        return self.acquisition_thread is not None
+    
+    def getFrameCount(self):
+        # number of frames captured so far, eg to ask getFrame for frames after now
+        with self.frame_condition:
+            return self.frame_count
+    
+    def getFrame(self, frame_number, timeout=None):
+        # returns a copy of frame frame_number (counting from 0 at thread start), waiting
+        # for it to be captured if needed. same columns as captureSingle
+        # frames too old to still be in the ring buffer raise an Exception
+        if timeout is None:
+            timeout = self.TIMEOUT * 2 # one acquisition plus the channel reads
+        with self.frame_condition:
+            t_start = time.time()
+            while self.frame_count <= frame_number and self.acquisition_error is None:
+                if time.time() - t_start > timeout:
+                    raise Exception('No frame from the acquisition thread within ' + str(timeout) + ' seconds.')
+                self.frame_condition.wait(timeout)
+            if self.acquisition_error is not None:
+                raise Exception('Acquisition thread stopped: ' + str(self.acquisition_error))
+            oldest = max(self.frame_count - (len(self.frame_buffer) - 1), self.frame_buffer_start)
+            if frame_number < oldest:
+                raise Exception('Frame ' + str(frame_number) + ' is no longer in the ring buffer.')
+            return self.frame_buffer[frame_number % len(self.frame_buffer)].copy()
+    
+    def getNewFrames(self, number_of_frames):
+        # returns a list of the next number_of_frames frames captured after this call
+        first = self.getFrameCount()
+        return [self.getFrame(first + n) for n in range(number_of_frames)]
+    
+    def getEnabledChannels(self):
+        # returns list of the channel indices that are turned on
+        channels = []
+        for n in range(4):
+            if int(self.queryCMD(':CHANnel' + str(n+1) + ':DISPlay?')) == 1:
+                channels.append(n+1)
+        return channels
+    
+    def getTriggerStatus(self):
+        # returns one of TD, WAIT, RUN, AUTO, STOP
+        return self.queryCMD(':TRIGger:STATus?').strip()
+    
+    def singleStatus(self):
+        # :SINGle with the trigger status queried in the same write, so the status is
+        # taken right after the scope armed, before any sync delay lets it finish
+        # returns the status, for waitForAcquisition
+        return self.queryCMD(':SINGle;:TRIGger:STATus?').strip()
+    
+    def waitForAcquisition(self, timeout=None, status=None):
+        # polls the trigger status every STATUS_POLL_INTERVAL after :SINGle until the scope has stopped
+        # a STOP only counts once the scope has been seen armed (WAIT, RUN, TD, AUTO): a STOP
+        # before that can still be the previous acquisition's
+        # status: status already seen after :SINGle, eg from singleStatus
+        if timeout is None:
+            timeout = self.TIMEOUT
+        t_start = time.time()
+        armed = False
+        if status is None:
+            status = self.getTriggerStatus()
+        while True:
+            if status != 'STOP':
+                armed = True
+            elif armed:
+                return
+            if time.time() - t_start > timeout:
+                if not(armed):
+                    raise Exception('Scope did not arm within ' + str(timeout) + ' seconds after :SINGle.')
+                raise Exception('Scope single acquisition did not finish within ' + str(timeout) + \
+                                ' seconds. Check that the trigger source has a signal.')
+            time.sleep(self.STATUS_POLL_INTERVAL) # don't flood the USB link while it acquires
+            status = self.getTriggerStatus()
+    
     def saveAllChannels(self, file_name_csv):
         # saves trace data from all channels into a csv
         # file_name_csv must include '.csv' in the string
         data = self.readAllChannels()
         np.savetxt(file_name_csv, data, delimiter=',')
         
+    def readChannelRaw(self, channel_index, file_name=None, chunk_points=None):
+        # reads the whole acquisition memory of a channel (RAW mode), not just the screen
+        # scope should be stopped first so the memory doesn't change partway through
+        # memory is read in WAV:STARt/WAV:STOP chunks no bigger than the scope allows per
+        # transfer, and each chunk is scaled straight into a preallocated array
+        # file_name: if given (ending in '.npy'), chunks are streamed into that file on
+            # disk instead of RAM, so tens of megapoints don't need to fit in memory
+        # chunk_points: points per transfer, defaults to the scope's limit for wav_format
+        # returns [values, x_increment, x_origin]: time of point n is x_origin + n*x_increment
+        with self.io_lock: # another thread mustn't move WAV:STARt/STOP between chunks
+            if chunk_points is None:
+                chunk_points = self.MAX_RAW_CHUNK_POINTS[self.wav_format]
+            chunk_points = min(chunk_points, self.MAX_RAW_CHUNK_POINTS[self.wav_format])
+            with self.batch():
+                self.setSetting(':WAV:SOURce', 'CHAN' + str(channel_index))
+                if self.setSetting(':WAV:MODE', 'RAW'): # reads the acquisition memory
+                    self.invalidate(':WAV:POINts') # points setting depends on the mode
+                self.setSetting(':WAV:FORMat', self.wav_format)
+            self.wav_mode = 'RAW'
+            self.wav_source = 'CHAN' + str(channel_index)
+            preamble = self.getPreamble()
+            total_points = self.getMemoryDepth(preamble)
+        
+            if file_name is None:
+                values = np.empty(total_points)
+            else: # same array interface, but backed by a file on disk
+                values = np.lib.format.open_memmap(file_name, mode='w+', dtype=np.float64, shape=(total_points,))
+            self.last_transfer_bytes = 0
+            for start in range(0, total_points, chunk_points):
+                stop = min(start + chunk_points, total_points)
+                # set STOP before STARt so start never sits past the previous chunk's stop
+                # through setSetting, so the NORMal reads know to put the window back
+                with self.batch():
+                    self.setSetting(':WAV:STOP', stop) # scope counts points from 1
+                    self.setSetting(':WAV:STARt', start + 1)
+                if self.wav_format == 'ASCii':
+                    asc = self.queryCMD("WAV:DATA?")
+                    self.last_transfer_bytes += len(asc)
+                    values[start:stop] = self.asciiToVector(asc)
+                else:
+                    raw = self.queryBinaryCMD("WAV:DATA?")
+                    self.last_transfer_bytes += len(raw)
+                    values[start:stop] = self.binaryToVector(raw, preamble)
+            if file_name is not None:
+                values.flush()
+            return [values, preamble[4], preamble[5]]
+    
+    def readAllChannelsRaw(self, file_prefix=None):
+        # reads the whole acquisition memory of all 4 channels from a single acquisition
+        # file_prefix: if given, channel n is streamed to file_prefix + '_ch' + n + '.npy'
+        # returns a list of [values, x_increment, x_origin], one per channel
+        self.stop()
+        output = []
+        for n in range(4): # for all 4 channels
+            if file_prefix is None:
+                output.append(self.readChannelRaw(n+1))
+            else:
+                output.append(self.readChannelRaw(n+1, file_prefix + '_ch' + str(n+1) + '.npy'))
+        self.run()
+        return output
+        
 # Below are helper functions for the class's main functions
     
     def readChannelOrMath(self, math_channel, channel_index):
         # reads a channel into np.array with columns for time and values
         # math_channel: True if measuring math channel, False if normal channel
         # channel_index: 1-4 for both regular and math channels
-        self.sendCMD(":WAV:MODE NORMal") # reads what's on the screen
-            # note: could read entire memory too, but don't think I'll need it
-        self.sendCMD("WAV:FORMat ASCii") # only form VISA buffer recognizes
-        self.sendCMD("WAV:POINts MAX") # all the points on the screen
-        if math_channel:
-            self.sendCMD(":WAV:SOURce MATH" + str(channel_index))
-        else:
-            self.sendCMD(":WAV:SOURce CHAN" + str(channel_index))
+        with self.io_lock: # waveform settings and data read can't be split up by another thread
+            # waveform settings go out in a single write, and only if they changed
+            if math_channel:
+                self.wav_source = 'MATH' + str(channel_index)
+            else:
+                self.wav_source = 'CHAN' + str(channel_index)
+            with self.batch():
+                if self.setSetting(':WAV:MODE', 'NORMal'): # reads what's on the screen
+                        # note: could read entire memory too, see readChannelRaw
+                    self.invalidate(':WAV:POINts') # points setting depends on the mode
+                self.setSetting(':WAV:FORMat', self.wav_format)
+                self.setSetting(':WAV:POINts', 'MAX') # all the points on the screen
+                # whole screen, in case readChannelRaw left a chunk's window behind
+                    # STARt first: it may sit past the new STOP
+                self.setSetting(':WAV:STARt', 1)
+                self.setSetting(':WAV:STOP', self.SCREEN_POINTS)
+                self.setSetting(':WAV:SOURce', self.wav_source)
+            self.wav_mode = 'NORMal'
         
-        wave_vector = self.asciiToVector(self.queryCMD("WAV:DATA?"))
-        time_vector = self.getTimeVector(len(wave_vector))
-        return np.stack((time_vector, wave_vector), 1)
+            if self.wav_format == 'ASCii':
+                asc = self.queryCMD("WAV:DATA?")
+                self.last_transfer_bytes = len(asc)
+                wave_vector = self.asciiToVector(asc)
+            else: # binary transfer: raw ADC codes that get scaled by the preamble
+                preamble = self.getPreamble()
+                raw = self.queryBinaryCMD("WAV:DATA?")
+                self.last_transfer_bytes = len(raw)
+                wave_vector = self.binaryToVector(raw, preamble)
+            time_vector = self.getTimeVector(len(wave_vector))
+            return np.stack((time_vector, wave_vector), 1)
+    
+    def __capture_single_frame__(self, channels, output=None):
+        # one :SINGle acquisition with every channel in channels read from it
+        # output: array to fill if it has the right shape, otherwise a new one is made
+        with self.io_lock:
+            self.waitForAcquisition(status=self.singleStatus())
+            for n in range(len(channels)):
+                data = self.readChannel(channels[n])
+                if n == 0: # time and values columns for all channels
+                    if output is None or output.shape != (len(data), len(channels) + 1):
+                        output = np.empty((len(data), len(channels) + 1))
+                    output[:,0] = data[:,0]
+                output[:,n+1] = data[:,1]
+        return output
+    
+    def __acquisition_loop__(self):
+        # producer for startAcquisitionThread: keeps filling the ring buffer slot after
+        # the newest frame. that slot holds the oldest frame, which getFrame never hands out
+        try:
+            while not(self.acquisition_stop.is_set()):
+                slot = self.frame_count % len(self.frame_buffer)
+                frame = self.__capture_single_frame__(self.acquisition_channels, self.frame_buffer[slot])
+                with self.frame_condition:
+                    if frame is not self.frame_buffer[slot]: # screen points changed, start a new buffer
+                        self.frame_buffer = np.empty((len(self.frame_buffer),) + frame.shape)
+                        self.frame_buffer_start = self.frame_count
+                        slot = self.frame_count % len(self.frame_buffer)
+                        self.frame_buffer[slot] = frame
+                    self.frame_count += 1
+                    self.frame_condition.notify_all()
+        except Exception as error: # hand the error to whoever is waiting on frames
+            with self.frame_condition:
+                self.acquisition_error = error
+                self.frame_condition.notify_all()
     
     def asciiToVector(self, asc):
-        asc = asc[11:-2] # remove header and footer
-        values = [float(i) for i in asc.split(',')] # makes a list
-        return np.asarray(values)
+        # parses a WAV:DATA? ASCii reply, eg '#9000000028-1.000e-01,2.500e-02,...\n'
+        # the header length is read from the block header, and the values are parsed
+        # by numpy in C rather than building a python list of floats
+        if asc[0:1] == '#':
+            [header_length, data_length] = self.blockHeaderLengths(asc)
+            asc = asc[header_length:header_length + data_length]
+        # no header (some firmware): the reply is just the values
+        return np.fromstring(asc.strip().strip(','), sep=',')
+    
+    def binaryToVector(self, raw, preamble):
+        # converts a BYTE or WORD IEEE-488.2 block into a vector of voltages
+        # preamble is the list returned by getPreamble for the same source
+        [header_length, data_length] = self.blockHeaderLengths(raw)
+        data = raw[header_length:header_length + data_length]
+        if self.wav_format == 'WORD':
+            codes = np.frombuffer(data, dtype='<u2') # 2 bytes per point, LSB first
+        else:
+            codes = np.frombuffer(data, dtype=np.uint8)
+        [y_inc, y_origin, y_ref] = preamble[7:10]
+        return (codes - y_origin - y_ref) * y_inc # scaling from the programming guide
+    
+    def blockHeaderLengths(self, raw):
+        # IEEE-488.2 block header is '#', one digit N, then N digits of data length
+        # returns [header_length, data_length] in bytes (or characters for an ASCii reply)
+        if raw[0:1] not in [b'#', '#']:
+            raise Exception('Expected IEEE-488.2 block header, got: ' + str(raw[:16]))
+        num_digits = int(raw[1:2])
+        header_length = 2 + num_digits
+        data_length = int(raw[2:header_length])
+        return [header_length, data_length]
+    
+    def getMemoryDepth(self, preamble):
+        # number of points in acquisition memory; :ACQuire:MDEPth? can answer AUTO,
+        # in which case the points count in the RAW mode preamble is used instead
+        try:
+            return int(float(self.queryCMD(":ACQuire:MDEPth?")))
+        except ValueError:
+            return int(preamble[2])
+    
+    def queryPreamble(self):
+        # returns the waveform preamble for the current WAV:SOURce as a list:
+        # [format, type, points, count, xinc, xorigin, xref, yinc, yorigin, yref]
+        preamble = self.queryCMD(":WAV:PREamble?")
+        return [float(i) for i in preamble.split(',')]
         
+    def getPreamble(self):
+        # like queryPreamble, but only asks the scope the first time for each WAV:MODE,
+        # WAV:FORMat and WAV:SOURce: the result is cached until invalidatePreambleCache clears it
+        key = (self.wav_mode, self.wav_format, self.wav_source)
+        if key not in self.preamble_cache:
+            preamble = self.queryPreamble()
+            self.preamble_cache[key] = preamble
+            self.timebase_cache[self.wav_mode] = preamble[4:6]
+        return self.preamble_cache[key]
+    
+    def invalidatePreambleCache(self, channel_index=None):
+        # forgets cached preambles so the next read asks the scope again
+        # channel_index: only forget that channel's y scaling (plus math channels,
+            # which depend on it). None forgets everything, including the timebase
+        if channel_index is None:
+            self.preamble_cache = {}
+            self.timebase_cache = {}
+        else:
+            for key in list(self.preamble_cache):
+                if key[2] == 'CHAN' + str(channel_index) or key[2].startswith('MATH'):
+                    del self.preamble_cache[key]
+    
     def getTimeVector(self, num_points):
-        xInc = float(self.queryCMD(":WAV:XINC?"))
-        xOrigin = float(self.queryCMD(":WAV:XOR?"))
+        # the timebase is the same for every channel, so one preamble covers all of them
+        if self.wav_mode not in self.timebase_cache:
+            self.getPreamble()
+        [xInc, xOrigin] = self.timebase_cache[self.wav_mode]
         time_vector = np.arange(0, num_points) * xInc # build vector
         return time_vector + xOrigin # set time-scale correctly
 
 #Functions for Startup - Added May 21st, 2024
     def setAttenuationFactor(self, probe_number, attenuation_factor):
 		#Sets attenuation factor of user-defined 'probe_number' to user-defined 'attenuation_factor'
-        cmd = (':CHANnel' + str(probe_number) + ':PROBe ' + str(attenuation_factor))
-        # print(cmd)
-        self.sendCMD(cmd)
+        if self.setSetting(':CHANnel' + str(probe_number) + ':PROBe', attenuation_factor):
+            self.invalidate(':CHANnel' + str(probe_number) + ':') # scope rescales scale/offset with the probe
+            self.invalidatePreambleCache(probe_number) # attenuation changes y scaling
 
     def setCoupling(self, probe_number, coupling):
 		#Sets coupling of user-defined 'probe_number' to user-defined 'coupling', which can be DC, AC or GND
-        cmd = (':CHANnel' + str(probe_number) + ':COUPling ' + str(coupling))
-        # print(cmd)
-        self.sendCMD(cmd)
+        self.setSetting(':CHANnel' + str(probe_number) + ':COUPling', coupling)
 
     def setDataAcquisitionType(self, typ): # type is a preset python word, so use typ
 		#Sets data acquisition type, which can be: NORMal|AVERages|PEAK|HRESolution
-        cmd = (':ACQuire:TYPE ' + str(typ))
-        # print(cmd)
-        self.sendCMD(cmd)
+        if self.setSetting(':ACQuire:TYPE', typ):
+            self.invalidatePreambleCache()
+
+    def setMemoryDepth(self, depth):
+        #Sets memory depth (points per acquisition), eg AUTO, 1k, 10k, 100k, 1M, 10M, 25M, 50M, 100M, 200M
+        if self.setSetting(':ACQuire:MDEPth', depth):
+            self.invalidatePreambleCache() # memory depth changes the RAW mode timebase
 
     def setDataAcquisitionAverage(self, count):
 		#In average data acquisition mode, 'count' sets the number of cycles over which to average over
-        cmd = (':ACQuire:AVERages ' + str(count))
-        # print(cmd)
-        self.sendCMD(cmd)
+        if self.setSetting(':ACQuire:AVERages', count):
+            self.invalidatePreambleCache()
     
     def queryMeasItem(self, item, source):
         # Returns instantaneous measurement item from source
-        cmd1 = 'MEASure:ITEM ' + str(item) + ',CHANnel' + str(source)
-        self.sendCMD(cmd1)
+        self.registerMeasSnapshot([[item, source]]) # only added the first time
         cmd2 = 'MEASure:ITEM? ' + str(item) + ',CHANnel' + str(source)
         return float(self.queryCMD(cmd2))
     
     def queryStatItem(self, typ, item, source): # type is a preset python word, so use typ
 		# Obtains the value of item given the statistical type and source 
-        cmd1 = (':MEASure:STATistic:ITEM ' + str(item) + ',CHANnel' + str(source))
-        self.sendCMD(cmd1)
+        self.registerMeasSnapshot([[item, source]]) # only added the first time
         cmd2 = (':MEASure:STATistic:ITEM? ' + str(typ) + ',' + str(item) + ',CHANnel' + str(source))
         # print(cmd2)
         value = self.queryCMD(cmd2)
         return float(value)
     
+    def registerMeasSnapshot(self, items):
+        # Adds measurement items (with statistics) to the screen so queryMeasSnapshot can read them
+        # items: list of [item, source], eg [['PSLewrate', 1], ['NSLewrate', 1], ['PDUTy', 3]]
+        # items already added are skipped, new ones go out in a single write
+        with self.batch():
+            for [item, source] in items:
+                if [str(item), int(source)] in self.meas_items:
+                    continue
+                self.sendCMD(':MEASure:STATistic:ITEM ' + str(item) + ',CHANnel' + str(source))
+                self.meas_items.append([str(item), int(source)])
+                if len(self.meas_items) > self.MAX_MEAS_ITEMS:
+                    self.meas_items.pop(0) # scope replaces its oldest item
+    
+    def queryMeasSnapshot(self, items, typ=None):
+        # Reads every item in items with ';'-joined queries, one round trip per
+        # MAX_BATCH_LENGTH characters of queries instead of a set + query per item
+        # items: list of [item, source], see registerMeasSnapshot (registered here if needed)
+        # typ: None for instantaneous values, or a statistic type, eg 'AVERages'
+        # returns a dict of {(item, source): value}
+        self.registerMeasSnapshot(items)
+        queries = []
+        for [item, source] in items:
+            if typ is None:
+                queries.append(':MEASure:ITEM? ' + str(item) + ',CHANnel' + str(source))
+            else:
+                queries.append(':MEASure:STATistic:ITEM? ' + str(typ) + ',' + str(item) + ',CHANnel' + str(source))
+        values = []
+        start = 0
+        while start < len(queries): # group the queries into writes of at most MAX_BATCH_LENGTH
+            stop = start + 1
+            while stop < len(queries) and len(';'.join(queries[start:stop + 1])) <= self.MAX_BATCH_LENGTH:
+                stop += 1
+            replies = []
+            if self.joined_meas_queries:
+                replies = self.queryCMD(';'.join(queries[start:stop])).strip().split(';')
+                if len(replies) != stop - start: # firmware didn't answer each query
+                    self.joined_meas_queries = False # so ask one at a time from now on
+            if not(self.joined_meas_queries):
+                replies = [self.queryCMD(query) for query in queries[start:stop]]
+            values += [float(reply) for reply in replies]
+            start = stop
+        snapshot = {}
+        for n in range(len(items)):
+            snapshot[(str(items[n][0]), int(items[n][1]))] = values[n]
+        return snapshot
+    
     def resetMeasStats(self):
         # Resets the statistics measurements, eg starting count from 0 again
         self.sendCMD(':MEASure:STATistic:RESet')
@@ -221,10 +737,12 @@ class MSO5000:
     def clearMeasItem(self, item_index):
         # Clears one of the measurements. item_index ranges from 1 to 10
         self.sendCMD(':MEASure:CLEar ITEM' + str(item_index))
+        self.meas_items = [] # don't know which one it was, so re-add items when next used
         
     def clearAllMeasItems(self):
         # Clears all of the measurements from the scope screen
         self.sendCMD(':MEASure:CLEar ALL')
+        self.meas_items = []
     
 # Functions for setting oscillscope windowing/scaling
     def setChannelScale(self, channel_index, volt_scale):
@@ -234,13 +752,16 @@ class MSO5000:
         # note if you enter a value that isn't allowed, it rounds down to nearest allowed
         scope_scale_bars = 8
         volt_scale = volt_scale / scope_scale_bars # accounts for scope using 8 scale bars
-        self.sendCMD(':CHANnel' + str(channel_index) + ':VERNier ON') # allows fine adjustment
-        self.sendCMD(':CHANnel' + str(channel_index) + ':SCALe ' + str(volt_scale))
+        with self.batch():
+            self.setSetting(':CHANnel' + str(channel_index) + ':VERNier', 'ON') # allows fine adjustment
+            if self.setSetting(':CHANnel' + str(channel_index) + ':SCALe', volt_scale):
+                self.invalidatePreambleCache(channel_index)
         
     def setChannelZeroLocation(self, channel_index, volts):
         # Sets the zero location [Volts] of a single channel
         # Positive value moves channel up on the screen
-        self.sendCMD(':CHANnel' + str(channel_index) + ':OFFSet ' + str(volts))
+        if self.setSetting(':CHANnel' + str(channel_index) + ':OFFSet', volts):
+            self.invalidatePreambleCache(channel_index)
         
     def setTimeScale(self, time_scale):
         # Sets the horizontal time scale for all channels (in seconds)
@@ -249,29 +770,40 @@ class MSO5000:
         # note if you enter a value that isn't allowed, it rounds down to nearest allowed
         scope_scale_bars = 10
         time_scale = time_scale / scope_scale_bars # accounts for scoe using 10 scale bars
-        self.sendCMD(':TIMebase:VERNier ON')
-        self.sendCMD(':TIMebase:MAIN:SCALe ' + str(time_scale))
+        with self.batch():
+            self.setSetting(':TIMebase:VERNier', 'ON')
+            if self.setSetting(':TIMebase:MAIN:SCALe', time_scale):
+                self.invalidatePreambleCache()
         
     def setTimeZeroLocation(self, time):
         # Sets the zero location [seconds] on the time axis, eg where the trigger is on the screen
         # Positive value shifts trigger to the left
-        self.sendCMD(':TIMebase:MAIN:OFFSet ' + str(time))
+        if self.setSetting(':TIMebase:MAIN:OFFSet', time):
+            self.invalidatePreambleCache()
         
     def setChannelDeskew(self, channel_index, deskew):
         # Sets the deskew [seconds] of a channel relative to the other channels
         # deskew can be sci. notation (eg 5e-8) or long form (eg 0.00000005)
-        self.sendCMD(':CHANnel' + str(channel_index) + ':TCALibrate ' + str(deskew))
+        self.setSetting(':CHANnel' + str(channel_index) + ':TCALibrate', deskew)
         
 
 #RIGOL DP832 DC Power Supply
-class DP832:
+class DP832(SCPIMixin):
 	CMD_DELAY = 0.2
 	TIMEOUT = 5.0
+	MAX_BATCH_LENGTH = 128 # max characters in one ';'-concatenated batch write
+	RESOURCE_MANAGER_CLASS = pyvisa.ResourceManager # swapped for a simulated bench in simulated_equipment
 
-	def __init__(self, visa_name):
-		self.rm = pyvisa.ResourceManager()
+	def __init__(self, visa_name, sync_mode='DELAY'):
+		self.rm = self.RESOURCE_MANAGER_CLASS()
 		self.rm.list_resources()
 		self.inst = self.rm.open_resource(visa_name)
+		self.inst.timeout = self.TIMEOUT * 1000 # VISA timeout is in ms
+		self.setSyncMode(sync_mode)
+		self.batch_depth = 0 # > 0 while inside a batch() block
+		self.batch_cmds = []
+		self.io_lock = threading.RLock() # for sharing with other threads, eg SupplyTelemetrySampler
+		self.settings = {} # last command sent per cached setting, see applyChannel
 		self.devID=self.inst.query("*IDN?")
 		# time delay
 		time.sleep(self.CMD_DELAY)
@@ -285,16 +817,6 @@ class DP832:
 		self.fault = True
 		return
 
-	def sendCMD(self, cmd):
-		self.inst.write(cmd)
-		time.sleep(self.CMD_DELAY)
-
-	def queryCMD(self, cmd):
-		self.inst.write(cmd)
-		time.sleep(self.CMD_DELAY)
-		rxVal = self.inst.read()
-		return rxVal
-
 	def setCH1(self):
 		cmd = 'INST CH1'
 		self.sendCMD(cmd)
@@ -310,10 +832,41 @@ class DP832:
 	def setCurrent(self, currentVal):
 		cmd = ('SOUR:CURR ' + "%.3f" % currentVal)
 		self.sendCMD(cmd)
+		self.invalidate() # changes whichever channel is selected
 
 	def setVoltage(self, voltageVal):
 		cmd = ('SOUR:VOLT ' + "%.3f" % voltageVal)
 		self.sendCMD(cmd)
+		self.invalidate()
+
+	def applyChannel(self, channel, voltageVal, currentVal):
+		# sets voltage and current limit of channel (1-3) in one command, without
+		# selecting it first. Skipped if the same values were the last applied to it
+		cmd = ('APPL CH' + str(channel) + ',' + "%.3f" % voltageVal + ',' + "%.3f" % currentVal)
+		self.__send_if_changed__('APPL CH' + str(channel), cmd)
+
+	def enableChannelOutput(self, channel):
+		# turns on output of channel (1-3) in one command, without selecting it first
+		# always sent: the supply can turn outputs off by itself (eg overcurrent)
+		cmd = 'OUTP CH' + str(channel) + ',ON'
+		self.sendCMD(cmd)
+
+	def disableChannelOutput(self, channel):
+		cmd = 'OUTP CH' + str(channel) + ',OFF'
+		self.sendCMD(cmd)
+
+	def __send_if_changed__(self, key, cmd):
+		# sends cmd unless it's what was last sent for key
+		if self.settings.get(key) == cmd:
+			return
+		self.settings.pop(key, None) # unknown until the write goes through
+		self.sendCMD(cmd)
+		self.settings[key] = cmd
+
+	def invalidate(self):
+		# forgets the cached settings so the next applyChannel always writes
+		# call after anyone may have changed the supply from its front panel
+		self.settings = {}
 
 	def enableChannel(self):
 		cmd = 'OUTP ON'
@@ -324,20 +877,22 @@ class DP832:
 		self.sendCMD(cmd)
 
 	def enableMaster(self):
-		cmd = 'OUTP CH1,ON'
-		self.sendCMD(cmd)
-		cmd = 'OUTP CH2,ON'
-		self.sendCMD(cmd)
-		cmd = 'OUTP CH3,ON'
-		self.sendCMD(cmd)
+		with self.batch():
+			cmd = 'OUTP CH1,ON'
+			self.sendCMD(cmd)
+			cmd = 'OUTP CH2,ON'
+			self.sendCMD(cmd)
+			cmd = 'OUTP CH3,ON'
+			self.sendCMD(cmd)
 
 	def disableMaster(self):
-		cmd = 'OUTP CH1,OFF'
-		self.sendCMD(cmd)
-		cmd = 'OUTP CH2,OFF'
-		self.sendCMD(cmd)
-		cmd = 'OUTP CH3,OFF'
-		self.sendCMD(cmd)
+		with self.batch():
+			cmd = 'OUTP CH1,OFF'
+			self.sendCMD(cmd)
+			cmd = 'OUTP CH2,OFF'
+			self.sendCMD(cmd)
+			cmd = 'OUTP CH3,OFF'
+			self.sendCMD(cmd)
 
 	def readVoltage(self):
 		cmd = 'MEAS:VOLT?'
@@ -351,17 +906,27 @@ class DP832:
 		if retVal != None:
 			return float(retVal)
 
+	def readChannelVoltageAndCurrent(self, channel):
+		# returns [volts, amps] measured on channel (1-3), without changing the selected channel
+		cmd = 'MEAS:ALL? CH' + str(channel) # replies 'volts,amps,watts'
+		retVal = self.queryCMD(cmd)
+		if retVal != None:
+			values = retVal.strip().split(',')
+			return [float(values[0]), float(values[1])]
+
 	def setSeriesVoltage(self, voltageVal):
-		self.setCH1()
-		self.setVoltage(voltageVal / 2.0)
-		self.setCH2()
-		self.setVoltage(voltageVal / 2.0)
+		with self.batch():
+			self.setCH1()
+			self.setVoltage(voltageVal / 2.0)
+			self.setCH2()
+			self.setVoltage(voltageVal / 2.0)
 
 	def setSeriesCurrent(self, currentVal):
-		self.setCH1()
-		self.setCurrent(currentVal)
-		self.setCH2()
-		self.setCurrent(currentVal)
+		with self.batch():
+			self.setCH1()
+			self.setCurrent(currentVal)
+			self.setCH2()
+			self.setCurrent(currentVal)
 
 
 #Agilent/Keysight N5771A DC Power Supply
@@ -862,10 +1427,24 @@ class GENH600: # updated to close serial after use leaving available for future
 	CMD_DELAY = 0.1
 	TIMEOUT = 5.0
 
-	def __init__(self, serialfd):
+	BAUDRATE = 19200
+	SERIAL_CLASS = serial.Serial # swapped for a simulated port in simulated_equipment
+
+	def __init__(self, serialfd, persistent_session=False):
 		#initalize USB serial
+		# persistent_session: keep the port open between commands, see openSession
 		self.serialfd = serialfd
-		with serial.Serial(self.serialfd, 19200, timeout=1) as ser:
+		self.ser = None # open serial.Serial while a session is open
+		self.io_lock = threading.RLock() # for sharing with other threads, eg SupplyTelemetrySampler
+		if persistent_session:
+			self.openSession()
+			self.sendCMD(b'ADR 6') #sometimes wakeup is needed?
+			self.sendCMD(b'RST') #reset supply
+			deviceID = self.sendCMD(b'IDN?')
+			self.connected = (deviceID is not None) and ("LAMBDA,GEN600-1.3-USB" in deviceID.decode(errors='replace'))
+			self.fault = not(self.connected)
+			return
+		with self.SERIAL_CLASS(self.serialfd, self.BAUDRATE, timeout=1) as ser:
             # check identity of power supply
 			ser.write(b'ADR 6\r') #sometimes wakeup is needed?
 			ser.flush()
@@ -892,16 +1471,51 @@ class GENH600: # updated to close serial after use leaving available for future
 			return
 
 	def sendCMD(self, cmd):
-		with serial.Serial(self.serialfd, 19200, timeout=1) as ser:
-			ser.reset_input_buffer()
-			ser.write(cmd+b'\r')
-			#self.ser.flush()
-			time.sleep(self.CMD_DELAY)
-			if (ser.in_waiting != 0):
-				rxVal = ser.read(ser.in_waiting)
+		with self.io_lock: # one exchange at a time, the reply must belong to this command
+			if self.ser is not None:
+				return self.__session_send_receive__(cmd)
+			with self.SERIAL_CLASS(self.serialfd, self.BAUDRATE, timeout=1) as ser:
+				ser.reset_input_buffer()
+				ser.write(cmd+b'\r')
+				#self.ser.flush()
+				time.sleep(self.CMD_DELAY)
+				if (ser.in_waiting != 0):
+					rxVal = ser.read(ser.in_waiting)
+					return rxVal
+				else:
+					return None
+
+	def openSession(self):
+		# Opens the port once and keeps it open for later commands instead of opening
+		# it per command. Replies (every command gets one, 'OK' for settings) are read
+		# up to their '\r' terminator, with TIMEOUT as the limit, instead of after a sleep
+		if self.ser is None:
+			self.ser = self.SERIAL_CLASS(self.serialfd, self.BAUDRATE, timeout=self.TIMEOUT)
+
+	def closeSession(self):
+		if self.ser is not None:
+			try:
+				self.ser.close()
+			finally:
+				self.ser = None
+
+	def __session_send_receive__(self, cmd):
+		# returns the reply including its '\r', or None if nothing came back in TIMEOUT
+		# on a serial error the port is reopened and the command sent once more
+			# (fine here: every GEN command sets or reads an absolute value)
+		for attempt in range(2):
+			try:
+				self.ser.reset_input_buffer() # drop anything left over from earlier commands
+				self.ser.write(cmd + b'\r')
+				rxVal = self.ser.read_until(b'\r')
+				if rxVal == b'':
+					return None
 				return rxVal
-			else:
-				return None
+			except (serial.SerialException, OSError):
+				self.closeSession()
+				self.openSession()
+				if attempt == 1:
+					raise
 
 	def setVoltage(self, voltageVal):
 		cmd = ('PV ' + "%.3f" % voltageVal).encode()
@@ -923,6 +1537,15 @@ class GENH600: # updated to close serial after use leaving available for future
 		if retVal != None:
 			return float(retVal)
 
+	def readVoltageAndCurrent(self):
+		# returns [volts, amps] measured, from one exchange
+		# DVC? replies 'MV,PV,MC,PC,OVP,UVL' (measured/programmed voltage and current...)
+		cmd = b'DVC?'
+		retVal = self.sendCMD(cmd)
+		if retVal != None:
+			values = retVal.decode().strip().split(',')
+			return [float(values[0]), float(values[2])]
+
 	def enableMaster(self):
 		cmd = b'OUT 1'
 		self.sendCMD(cmd)
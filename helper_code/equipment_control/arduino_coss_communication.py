@@ -29,32 +29,71 @@ Current acceptable instructions:
     'zX_XX' - test connection to the arduino board. Returns 'ATMEGA328P is still alive' if working
     't#_XX' - set sine or trap mode; # is 0 or 1. 0 means sine, 1 means trap
     'e#_XX' - set gate signal enable; # is 0 or 1. 0 turns all gates off, 1 allows them to switch
+Framing (firmware that supports it, see POWAM_MICRO.batch):
+    'f<seq>:<cmd>|<seq>:<cmd>|...' - runs each <cmd> above in order. Replies with one
+        line '<seq>:<reply>' per command, <reply> being empty for commands without one
+        Old firmware ignores frames, and the host falls back to one command per exchange
+        The shipped firmware has no 'f' instruction yet, so the host only probes for it
+        when asked to (framing_probe=True), eg against arduino_coss_mock
 """
 
 import serial 
 import time 
 import struct
+from contextlib import contextmanager
 
 #Class for the arduino uno ATMEGA328P on poweramerica control board
 class POWAM_MICRO:
     CMD_DELAY = 0.1
     TIMEOUT = 5.0
     BAUDRATE = 115200 # happens to be what the arduino is configured for
+    RELATIVE_CMDS = ['m', 'c'] # relative moves: not safe to resend after a failed exchange
+    MAX_FRAME_LENGTH = 60 # characters per frame incl. quotes and '\n': ATMEGA328P serial buffer is 64
+    FRAME_PROBE_TIMEOUT = 0.5 # how long old firmware gets to (not) answer the framing probe
+    SESSION_WRITE_GAP = 0.02 # [s] between a session command with no reply and the next write, so
+        # back-to-back commands can't overrun the firmware's serial buffer before it parses them
+    SERIAL_CLASS = serial.Serial # swapped for a mock port in arduino_coss_mock
+    # stepper model for predicting how long moves take, see predictMoveTime
+    # the firmware's stepper settings aren't known here, so these are starting guesses only,
+    # replaced by calibrateMotion from timed moves once a session has seen a few.
+    # the speed guess errs fast: an early prediction costs a few 'r' polls, a late one
+    # sleeps past the end of the move
+    STEPS_PER_SECOND = 1000.0 # [steps/s]
+    MOTION_START_DELAY = 0.0 # [s] added to every predicted move
+    MOTION_CALIBRATION_MOVES = 3 # timed moves needed before calibrateMotion fits the model
+    MOTION_HISTORY_LENGTH = 20 # timed moves kept for calibrateMotion, most recent
+    MOTION_POLL_INTERVAL = 0.02 # [s] first 'r' poll interval after the predicted move time
+    MOTION_POLL_MAX_INTERVAL = 0.5 # [s] poll interval doubles up to this
     
-    def __init__(self, port_name): # port_name is likely something like '/dev/ttyUSB0' on linux, 'COM5' on windows
+    def __init__(self, port_name, persistent_session=False, framing_probe=False): # port_name is likely something like '/dev/ttyUSB0' on linux, 'COM5' on windows
+        # persistent_session: keep the port open between commands, see openSession
+        # framing_probe: ask the firmware whether it takes 'f' frames when a session opens
+            # off by default: the shipped firmware doesn't, and batches then go out one
+            # command at a time anyway
         self.port_name = port_name
-        with serial.Serial(port=self.port_name, baudrate=self.BAUDRATE, timeout=self.CMD_DELAY) as comm:
-        # "with" statement means the serial connection will close when finished
-        # Test that the connection is working, or throw an error if not
-            trash = comm.readline() # empty out serial connection just in case
-            connection_test_cmd = '\'' + 'z' + '\'' # '' needed apparently :(
-            # For some reason, using 'z1' or str('z1') doesn't work... idk
-            for n in range(len(connection_test_cmd)):
-                comm.write(bytes(connection_test_cmd[n], 'utf-8'))
-            comm.write(bytes('\n', 'utf-8'))
-            time.sleep(self.CMD_DELAY)
-            return_data = comm.readline().decode('utf-8')
-        # serial connection closes here, freeing up port for future use
+        self.comm = None # open serial.Serial while a session is open
+        self.framing_probe = framing_probe
+        self.framing = False # True if the firmware answered the framing probe, see openSession
+        self.frame_seq = 0 # last frame sequence number used
+        self.batch_depth = 0 # > 0 while inside a batch() block
+        self.batch_cmds = []
+        self.write_ready_time = 0 # time.time() the next session write may go out, see SESSION_WRITE_GAP
+        if persistent_session:
+            self.openSession()
+            return_data = self.queryCMD('z')
+        else:
+            with self.SERIAL_CLASS(port=self.port_name, baudrate=self.BAUDRATE, timeout=self.CMD_DELAY) as comm:
+            # "with" statement means the serial connection will close when finished
+            # Test that the connection is working, or throw an error if not
+                trash = comm.readline() # empty out serial connection just in case
+                connection_test_cmd = '\'' + 'z' + '\'' # '' needed apparently :(
+                # For some reason, using 'z1' or str('z1') doesn't work... idk
+                for n in range(len(connection_test_cmd)):
+                    comm.write(bytes(connection_test_cmd[n], 'utf-8'))
+                comm.write(bytes('\n', 'utf-8'))
+                time.sleep(self.CMD_DELAY)
+                return_data = comm.readline().decode('utf-8')
+            # serial connection closes here, freeing up port for future use
         if return_data != 'ATMEGA328P is still alive\n':
             print('\nArduino Uno failed connectivity test\n' + 
                   'Reply received: ' + str(return_data) + '\n' + 
@@ -63,20 +102,169 @@ class POWAM_MICRO:
         print('Arduino Uno connected successfully.')
         self.l1_pos = 0 # going to store inductor positions in object as well
         self.l2_pos = 0 # assume inductors are calibrated
+        self.motion_end_time = time.time() # predicted time.time() the inductors stop, see predictMoveTime
+        self.motion_move = None # [start time, steps] of the move expected to end last, see __record_move__
+        self.motion_history = [] # [steps, measured seconds] of timed moves, see calibrateMotion
     
     def sendCMD(self, cmd):
         # sends command (a string) directly to arduino. Recieves no response
-        self.__serial_send_receive__(cmd)
+        if self.batch_depth > 0:
+            self.batch_cmds.append(cmd) # sent when the batch ends
+        else:
+            self.__send_single__(cmd)
+    
+    def __send_single__(self, cmd):
+        # one command per exchange, on the session port if there is one
+        if self.comm is not None:
+            self.__session_send_receive__(cmd, False)
+        else:
+            self.__serial_send_receive__(cmd)
         
     def queryCMD(self, cmd):
         # sends command (a string) directly to arduino and returns the response
-        rxVal = self.__serial_send_receive__(cmd)
+        self.flushBatch() # reply may depend on commands waiting in a batch
+        if self.comm is not None:
+            rxVal = self.__session_send_receive__(cmd, True)
+        else:
+            rxVal = self.__serial_send_receive__(cmd)
         return rxVal
     
+    def openSession(self):
+        # Opens the serial port once and keeps it open for all later commands, instead
+        # of opening and closing it for every command. Commands then take about the
+        # serial line time: no port opens, no fixed sleeps
+        # DTR is held low so opening the port doesn't reset boards that reset on DTR
+        if self.comm is not None:
+            return
+        comm = self.SERIAL_CLASS() # not opened until the settings below are in place
+        comm.port = self.port_name
+        comm.baudrate = self.BAUDRATE
+        comm.timeout = self.TIMEOUT # replies are read up to their '\n', this is just the limit
+        comm.dtr = False
+        comm.open()
+        self.comm = comm
+        if self.framing_probe:
+            self.framing = self.__detect_framing__()
+    
+    @contextmanager
+    def batch(self):
+        # Collects the commands sent inside a 'with arduino.batch():' block and sends them
+        # when the block ends, several per frame with sequence numbers, checking each
+        # command's acknowledgement. Needs a session (openSession) and firmware that
+        # supports frames (framing_probe=True): otherwise the commands go out one at a time as usual
+        # Queries inside the block send the commands collected so far first
+        self.batch_depth += 1
+        try:
+            yield self
+        finally:
+            self.batch_depth -= 1
+            if self.batch_depth == 0:
+                self.flushBatch()
+    
+    def flushBatch(self):
+        # sends any commands collected by batch()
+        cmds = self.batch_cmds
+        self.batch_cmds = []
+        if not(self.framing) or self.comm is None:
+            for cmd in cmds: # command-compatible fallback
+                self.__send_single__(cmd)
+            return
+        frame_cmds = []
+        for cmd in cmds:
+            if frame_cmds and self.__frame_length__(frame_cmds + [cmd]) > self.MAX_FRAME_LENGTH:
+                self.__send_frame__(frame_cmds) # this frame is full, start the next one
+                frame_cmds = []
+            frame_cmds.append(cmd)
+        if frame_cmds:
+            self.__send_frame__(frame_cmds)
+    
+    def __frame_length__(self, cmds):
+        # characters on the line for a frame of cmds, with 2-digit sequence numbers
+        return len('\'f\'\n') + sum([len(str(cmd)) + 3 for cmd in cmds]) + len(cmds) - 1
+    
+    def __send_frame__(self, cmds):
+        # sends cmds as one frame and checks each acknowledgement
+        # returns the replies in order, formatted like queryCMD's
+        entries = []
+        for cmd in cmds:
+            self.frame_seq = self.frame_seq % 99 + 1 # 1 to 99, 0 is for the probe
+            entries.append([str(self.frame_seq), str(cmd)])
+        frame = 'f' + '|'.join([seq + ':' + cmd for [seq, cmd] in entries])
+        try:
+            self.comm.reset_input_buffer() # drop anything left over from earlier commands
+            self.__wait_to_write__()
+            self.comm.write(bytes('\'' + frame + '\'' + '\n', 'utf-8'))
+            acks = [self.comm.readline().decode('utf-8') for entry in entries]
+        except (serial.SerialException, OSError):
+            # commands may or may not have run, so reconnect but don't resend
+            self.closeSession()
+            self.openSession()
+            raise
+        replies = []
+        for n in range(len(entries)):
+            [ack_seq, separator, reply] = acks[n].rstrip('\n').partition(':')
+            if separator == '' or ack_seq != entries[n][0]:
+                raise Exception('Arduino acknowledgement for \'' + entries[n][1] + '\' missing or out of order.\n' + 
+                                'Reply received: ' + str(acks[n]) + '\n' + 
+                                'Reply expected to start with: ' + entries[n][0] + ':')
+            replies.append((reply + '\n') if reply else '')
+        return replies
+    
+    def __detect_framing__(self):
+        # asks the firmware for a one-command frame: 'f0:z'. Firmware with framing
+        # answers '0:ATMEGA328P is still alive', old firmware doesn't recognise it
+        self.comm.timeout = self.FRAME_PROBE_TIMEOUT
+        try:
+            self.comm.reset_input_buffer()
+            self.comm.write(bytes('\'' + 'f0:z' + '\'' + '\n', 'utf-8'))
+            reply = self.comm.readline().decode('utf-8', errors='replace')
+        finally:
+            self.comm.timeout = self.TIMEOUT
+        return reply == '0:ATMEGA328P is still alive\n'
+    
+    def closeSession(self):
+        # closes the port opened by openSession, later commands open it per command again
+        if self.comm is not None:
+            try:
+                self.comm.close()
+            finally:
+                self.comm = None
+                self.framing = False
+    
+    def __session_send_receive__(self, cmd, read_reply):
+        # like __serial_send_receive__ but on the open session port
+        # the command goes out as a single buffer and the reply is read up to its '\n'
+        # on a serial error the port is reopened and the command sent once more,
+        # unless it's a relative move that may already have happened
+        data = bytes('\'' + str(cmd) + '\'' + '\n', 'utf-8') # same quoting as __serial_send_receive__
+        for attempt in range(2):
+            try:
+                if read_reply:
+                    self.comm.reset_input_buffer() # drop anything left over from earlier commands
+                self.__wait_to_write__()
+                self.comm.write(data)
+                if not(read_reply):
+                    self.comm.flush() # wait until it's actually out on the line
+                    # nothing comes back to say the firmware has read it, so give it time to
+                    self.write_ready_time = time.time() + self.SESSION_WRITE_GAP
+                    return ''
+                return self.comm.readline().decode('utf-8')
+            except (serial.SerialException, OSError):
+                self.closeSession()
+                self.openSession()
+                if attempt == 1 or str(cmd)[0] in self.RELATIVE_CMDS:
+                    raise
+    
+    def __wait_to_write__(self):
+        # sleeps out what's left of SESSION_WRITE_GAP after the last command with no reply
+        # commands with replies (and frames, acknowledged per command) don't need one:
+        # the reply means the firmware has already read them
+        time.sleep(max(self.write_ready_time - time.time(), 0))
+    
     def __serial_send_receive__(self, cmd):
         # note for private methods, must include __ when calling as well
         cmd = '\'' + str(cmd) + '\'' # adding '' makes it work oof
-        with serial.Serial(port=self.port_name, baudrate=self.BAUDRATE, timeout=self.CMD_DELAY) as comm:
+        with self.SERIAL_CLASS(port=self.port_name, baudrate=self.BAUDRATE, timeout=self.CMD_DELAY) as comm:
             for n in range(len(cmd)):
                 comm.write(bytes(cmd[n], 'utf-8'))
             comm.write(bytes('\n', 'utf-8'))
@@ -85,7 +273,7 @@ class POWAM_MICRO:
         # serial connection closes here, freeing up port for future use
         
     def troubleshootConnection(self):
-        with serial.Serial(port=self.port_name, baudrate=self.BAUDRATE, timeout=self.CMD_DELAY) as comm:
+        with self.SERIAL_CLASS(port=self.port_name, baudrate=self.BAUDRATE, timeout=self.CMD_DELAY) as comm:
             stringy = '\'' + 'z' + '\''
             for n in range(len(stringy)):
                 comm.write(bytes(stringy[n], 'utf-8'))
@@ -108,14 +296,70 @@ class POWAM_MICRO:
         self.l2_pos = int(self.queryCMD('w2'))
         
     def waitForInductorsToMove(self):
-        # literally just delays until the inductors are finished moving
+        # delays until the inductors are finished moving
+        # with a session: sleeps until just before the predicted end of the move (see
+        # predictMoveTime), then polls 'r' quickly, backing off, until the arduino says it's
+        # done. the first poll comes early so a well-predicted move is still seen moving, and
+        # its measured time goes into calibrateMotion
+        # without one each poll opens the port, so it waits 0.5s then polls once a second
         print('Moving inductors...')
-        time.sleep(0.5) # wait just a bit in case
-        ready = self.queryCMD('r')
-        while not(bool(int(ready[0]))): # pulls 1 or 0 out from ready string
-            time.sleep(1) # wait a second and try again
+        if self.comm is not None:
+            time.sleep(max(self.motion_end_time - self.MOTION_POLL_INTERVAL - time.time(), 0))
+            poll_interval = self.MOTION_POLL_INTERVAL
             ready = self.queryCMD('r')
+            still_moving_time = None # last poll that saw the inductors moving
+            while not(bool(int(ready[0]))): # pulls 1 or 0 out from ready string
+                still_moving_time = time.time()
+                time.sleep(poll_interval)
+                poll_interval = min(poll_interval * 2, self.MOTION_POLL_MAX_INTERVAL)
+                ready = self.queryCMD('r')
+            if still_moving_time is not None and self.motion_move is not None:
+                # the move ended between the last two polls: only then is its duration
+                    # known, a move that's done at the first poll may have ended any time before
+                [start_time, steps] = self.motion_move
+                self.motion_history.append([steps, (still_moving_time + time.time()) / 2 - start_time])
+                self.motion_history = self.motion_history[-self.MOTION_HISTORY_LENGTH:]
+                self.calibrateMotion()
+        else:
+            time.sleep(0.5) # wait just a bit in case
+            ready = self.queryCMD('r')
+            while not(bool(int(ready[0]))): # pulls 1 or 0 out from ready string
+                time.sleep(1) # wait a second and try again
+                ready = self.queryCMD('r')
+        self.motion_move = None
         print(' done\n')
+    
+    def predictMoveTime(self, steps):
+        # stepper model: seconds to move steps steps (either direction)
+        return self.MOTION_START_DELAY + abs(steps) / self.STEPS_PER_SECOND
+    
+    def calibrateMotion(self):
+        # fits STEPS_PER_SECOND and MOTION_START_DELAY (on this object) to the timed moves
+        # in motion_history by least squares, once there are enough of different lengths
+        # returns True if the model was updated
+        if len(self.motion_history) < self.MOTION_CALIBRATION_MOVES:
+            return False
+        steps = [move[0] for move in self.motion_history]
+        seconds = [move[1] for move in self.motion_history]
+        steps_mean = sum(steps) / len(steps)
+        seconds_mean = sum(seconds) / len(seconds)
+        steps_var = sum([(x - steps_mean)**2 for x in steps])
+        if steps_var == 0: # all the same length: speed and start delay can't be told apart
+            return False
+        slope = sum([(x - steps_mean) * (y - seconds_mean) for [x, y] in zip(steps, seconds)]) / steps_var
+        if slope <= 0: # timing noise swamped the moves, keep the old model
+            return False
+        self.STEPS_PER_SECOND = 1 / slope
+        self.MOTION_START_DELAY = max(seconds_mean - slope * steps_mean, 0)
+        return True
+    
+    def __record_move__(self, steps):
+        # moves run at the same time on both inductors, so the later end time counts
+        # the move that sets it is the one waitForInductorsToMove times for calibrateMotion
+        end_time = time.time() + self.predictMoveTime(steps)
+        if end_time > self.motion_end_time:
+            self.motion_end_time = end_time
+            self.motion_move = [time.time(), abs(steps)] if steps != 0 else None
                 
     def setDutyCycleRefValue(self, val):
         # Sets analog reference value that gets compared with sine for duty cycle
@@ -124,21 +368,26 @@ class POWAM_MICRO:
         
     def setIndVal(self, ind_number, val_uh):
         # Sets inductor number to value in micro Henrys (characterization not so accurate)
+        old_positions = [self.l1_pos, self.l2_pos]
         self.sendCMD('l' + str(ind_number) + str(val_uh))
         self.updateIndPositionsFromArduino()
+        self.__record_move__([self.l1_pos, self.l2_pos][ind_number - 1] - old_positions[ind_number - 1])
         
     def moveInd(self, ind_number, steps):
         # Moves inductor number by steps number of steps (200 steps per rotation)
         self.sendCMD('m' + str(ind_number) + str(steps))
+        self.__record_move__(steps)
         self.updateIndPositionsFromArduino()
         
     def calInd(self, ind_number, steps):
         # Moves inductor number by steps and calibrates that new position as "zero"
         self.sendCMD('c' + str(ind_number) + str(steps))
+        self.__record_move__(steps)
         self.updateIndPositionsFromArduino()
         
     def setIndPos(self, ind_number, pos):
         self.sendCMD('p' + str(ind_number) + str(pos))
+        self.__record_move__(pos - [self.l1_pos, self.l2_pos][ind_number - 1])
         self.updateIndPositionsFromArduino()
         
     def setSineAmp(self, val_mA):
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the ATMEGA328P firmware, to run POWAM_MICRO without the board.
+
+MockPOWAMFirmware understands the instructions listed in arduino_coss_communication
+(and optionally the 'f' frames), keeps the state the board would (inductor
+positions, gate enable, sine settings...) and moves the inductors at STEPS_PER_SECOND.
+MockSerial looks enough like serial.Serial for POWAM_MICRO, and delivers every
+line written to it to the firmware object.
+
+Usage:
+    [arduino, firmware] = make_mock_powam(framing=True)
+    arduino.setIndPos(1, 500)
+"""
+
+import time
+try:
+    from .arduino_coss_communication import POWAM_MICRO
+except ImportError: # run as a script from this folder
+    from arduino_coss_communication import POWAM_MICRO
+
+class MockPOWAMFirmware:
+    STEPS_PER_SECOND = 400.0 # mock inductor motor speed
+    STEPS_PER_UH = 100.0 # mock 'l' characterization, the real one lives in the firmware
+    ALIVE_REPLY = 'ATMEGA328P is still alive'
+
+    def __init__(self, framing=True):
+        # framing: True to answer 'f' frames like new firmware, False to ignore them like old
+        self.framing = framing
+        self.positions = {1: 0, 2: 0} # target position of each inductor
+        self.move_start = {1: 0, 2: 0} # position when the current move started
+        self.move_time = {1: 0.0, 2: 0.0} # time.time() the current move started
+        self.gates_enabled = False
+        self.trap_mode = True
+        self.duty_ref = 0.0
+        self.sine_amp = 0.0
+        self.sine_freq = 0
+        self.sine_pll = 10
+        self.received = [] # every instruction run, in order, for checking
+        self.frames_received = 0
+
+    def openSerial(self, *args, **kwargs):
+        # same signature as serial.Serial, for POWAM_MICRO.SERIAL_CLASS
+        return MockSerial(self, *args, **kwargs)
+
+    def handleLine(self, line):
+        # runs one line written by the host, returns the text sent back
+        cmd = line.strip().strip('\'')
+        if cmd.startswith('f'):
+            if not(self.framing):
+                return '' # old firmware: unknown instruction
+            self.frames_received += 1
+            replies = ''
+            for entry in cmd[1:].split('|'):
+                [seq, separator, frame_cmd] = entry.partition(':')
+                replies += seq + ':' + self.runInstruction(frame_cmd) + '\n'
+            return replies
+        reply = self.runInstruction(cmd)
+        return (reply + '\n') if reply else ''
+
+    def runInstruction(self, cmd):
+        # runs one instruction, returns its reply without '\n' ('' if it has none)
+        self.received.append(cmd)
+        letter = cmd[0:1]
+        second = cmd[1:2]
+        number = cmd[2:]
+        # positions and steps may arrive as floats, eg 'p1612.5', the firmware rounds them
+        if letter == 'z':
+            return self.ALIVE_REPLY
+        if letter == 'r':
+            return '1' if self.inductorsStopped() else '0'
+        if letter == 'w':
+            return str(self.positions[int(second)])
+        if letter in ['m', 'c']:
+            self.__start_move__(int(second), self.positions[int(second)] + round(float(number)))
+            if letter == 'c': # new position becomes zero
+                self.move_start[int(second)] -= self.positions[int(second)]
+                self.positions[int(second)] = 0
+        elif letter == 'p':
+            self.__start_move__(int(second), round(float(number)))
+        elif letter == 'l':
+            self.__start_move__(int(second), round(float(number) * self.STEPS_PER_UH))
+        elif letter == 'i':
+            self.duty_ref = float(number)
+        elif letter == 'a':
+            if second == 'a':
+                self.sine_amp = float(number)
+            elif second == 'f':
+                self.sine_freq = int(number)
+            elif second == 'x':
+                self.sine_pll = int(number)
+        elif letter == 't':
+            self.trap_mode = (second == '0')
+        elif letter == 'e':
+            self.gates_enabled = (second == '1')
+        return ''
+
+    def inductorsStopped(self):
+        return self.stepsLeft() == 0
+
+    def stepsLeft(self):
+        # steps left to move, summed over both inductors
+        steps = 0
+        for ind in [1, 2]:
+            distance = abs(self.positions[ind] - self.move_start[ind])
+            moved = (time.time() - self.move_time[ind]) * self.STEPS_PER_SECOND
+            steps += max(distance - moved, 0)
+        return steps
+
+    def positionNow(self, ind):
+        # where inductor ind has got to in its current move
+        distance = self.positions[ind] - self.move_start[ind]
+        moved = min((time.time() - self.move_time[ind]) * self.STEPS_PER_SECOND, abs(distance))
+        direction = 1 if distance >= 0 else -1
+        return self.move_start[ind] + direction * moved
+
+    def __start_move__(self, ind, target):
+        # moves start from wherever the inductor has got to
+        self.move_start[ind] = round(self.positionNow(ind))
+        self.move_time[ind] = time.time()
+        self.positions[ind] = target
+
+class MockSerial:
+    # the parts of serial.Serial that POWAM_MICRO uses, talking to a MockPOWAMFirmware
+
+    def __init__(self, firmware, port=None, baudrate=9600, timeout=None):
+        self.firmware = firmware
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.dtr = True
+        self.is_open = False
+        self.input = b'' # bytes written by the host, not yet a full line
+        self.output = b'' # bytes waiting for the host to read
+        if port is not None: # serial.Serial opens straight away when given a port
+            self.open()
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, data):
+        self.input += data
+        while b'\n' in self.input:
+            [line, separator, self.input] = self.input.partition(b'\n')
+            self.output += bytes(self.firmware.handleLine(line.decode('utf-8')), 'utf-8')
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        self.output = b''
+
+    def readline(self):
+        # like a serial port timing out, returns whatever is there if there's no full line
+        [line, separator, self.output] = self.output.partition(b'\n')
+        return line + separator
+
+    @property
+    def in_waiting(self):
+        return len(self.output)
+
+def make_mock_powam(firmware=None, persistent_session=True, framing=True, framing_probe=True):
+    # returns [arduino, firmware]: a POWAM_MICRO talking to a MockPOWAMFirmware
+    # framing: whether the mock firmware takes 'f' frames
+    # framing_probe: whether the host asks for them, see POWAM_MICRO
+    if firmware is None:
+        firmware = MockPOWAMFirmware(framing)
+    class MockPOWAM_MICRO(POWAM_MICRO):
+        SERIAL_CLASS = firmware.openSerial
+    return [MockPOWAM_MICRO('MOCK', persistent_session, framing_probe), firmware]
+
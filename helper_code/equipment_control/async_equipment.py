@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Asyncio layer over the (blocking) equipment drivers, so actions on different
+instruments can run at the same time instead of one after the other.
+
+AsyncInstrument wraps an existing MSO5000, DP832, GENH600 or POWAM_MICRO object.
+Every driver method becomes a coroutine that runs the blocking call on a worker
+thread (asyncio.to_thread) while holding that instrument's asyncio lock, so two
+coroutines never talk to the same instrument at once but different instruments
+overlap. Plain attributes (eg arduino.l1_pos) are read straight through.
+
+Usage:
+    [scope_a, HV_a, LV_a, arduino_a] = make_async_devices(scope, HV_supply, LV_supply, arduino)
+    await asyncio.gather(HV_a.setVoltage(100), arduino_a.setIndPos(1, 500))
+    await run_on_devices([LV_a, arduino_a], set_inductor_positions, LV_supply, arduino, 500, 800)
+
+From synchronous code (including a console that already runs an event loop) use
+run_coroutine(...) instead of asyncio.run(...).
+"""
+
+import asyncio
+import threading
+
+class AsyncInstrument:
+
+    def __init__(self, device):
+        # device: a connected driver object, eg MSO5000(...)
+        self.device = device
+        self.lock = asyncio.Lock() # one per instrument, taken for every call
+
+    def __getattr__(self, name):
+        # only called for names not on AsyncInstrument itself
+        attribute = getattr(self.device, name)
+        if not(callable(attribute)):
+            return attribute
+        async def locked_call(*args, **kwargs):
+            async with self.lock:
+                return await asyncio.to_thread(attribute, *args, **kwargs)
+        return locked_call
+
+    def __repr__(self):
+        return 'AsyncInstrument(' + type(self.device).__name__ + ')'
+
+def make_async_devices(*devices):
+    # wraps each driver object, returns the wrappers in the same order
+    return [AsyncInstrument(device) for device in devices]
+
+async def run_on_devices(async_devices, function, *args, **kwargs):
+    # runs a blocking function that uses several instruments (eg set_inductor_positions
+    # uses LV_supply and arduino) on a worker thread, holding all of their locks
+    # locks are taken in a fixed order so two of these can't deadlock each other
+    ordered = sorted(async_devices, key=id)
+    for i, async_device in enumerate(ordered):
+        try:
+            await async_device.lock.acquire()
+        except BaseException:
+            for held in ordered[:i]:
+                held.lock.release()
+            raise
+    try:
+        return await asyncio.to_thread(function, *args, **kwargs)
+    finally:
+        for async_device in ordered:
+            async_device.lock.release()
+
+def run_coroutine(coroutine):
+    # runs coroutine to completion from synchronous code and returns its result
+    # asyncio.run refuses to run inside an already running loop (IPython/Spyder
+    # consoles), so in that case it gets its own loop on a separate thread
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError: # no loop running here, the normal case for scripts
+        return asyncio.run(coroutine)
+    result = []
+    error = []
+    def run_in_thread():
+        try:
+            result.append(asyncio.run(coroutine))
+        except BaseException as exception:
+            error.append(exception)
+    thread = threading.Thread(target=run_in_thread)
+    thread.start()
+    thread.join()
+    if error:
+        raise error[0]
+    return result[0]
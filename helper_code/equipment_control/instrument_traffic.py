@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+Records the traffic between the drivers and the instruments during a run, and
+replays it later without the hardware.
+
+TrafficRecorder wraps the methods where each driver actually talks to its
+instrument, and logs every exchange as one JSON line: device, method, command,
+response, timestamp and latency. The log is gzipped if its name ends in '.gz'.
+    MSO5000, DP832: __write_cmd__ (what sendCMD and batches end up calling),
+        queryCMD, queryBinaryCMD
+    GENH600 and the other drivers: sendCMD, queryCMD
+    POWAM_MICRO: __serial_send_receive__, __session_send_receive__, __send_frame__
+Everything above those methods (batches, setting caches, sleeps in the helpers)
+still runs, so a replayed run goes through the same control flow.
+
+TrafficReplay builds the same drivers on a zero-latency SimulatedBench (so their
+connection checks pass) and serves the recorded responses in order. Each call
+takes the next recorded exchange with the same method and command, skipping any
+in between. Writes with no recorded match (eg batched differently) are accepted
+and counted, queries with no match raise. latency_scale=1 sleeps the recorded
+latencies, 0 runs as fast as the host can.
+
+Usage:
+    with TrafficRecorder('run_traffic.jsonl.gz') as recorder:
+        scope = recorder.record(MSO5000('USB0::...'), 'scope')
+        ... run as usual ...
+    replay = TrafficReplay('run_traffic.jsonl.gz')
+    scope = replay.device('scope')
+    ... same calls, responses come from the log ...
+    print(replay.summary())
+"""
+
+import time
+import json
+import gzip
+import base64
+import threading
+try:
+    from .simulated_equipment import SimulatedBench, SimulatedMSO5000, SimulatedDP832, SimulatedGENH600, \
+        SimulatedPOWAM_MICRO
+except ImportError: # run as a script from this folder
+    from simulated_equipment import SimulatedBench, SimulatedMSO5000, SimulatedDP832, SimulatedGENH600, \
+        SimulatedPOWAM_MICRO
+
+# methods that talk to the instrument, per driver class: {method: send batched commands first}
+EXCHANGE_METHODS = {
+    'MSO5000': {'__write_cmd__': False, 'queryCMD': True, 'queryBinaryCMD': True},
+    'DP832': {'__write_cmd__': False, 'queryCMD': True},
+    'POWAM_MICRO': {'__serial_send_receive__': False, '__session_send_receive__': False, '__send_frame__': False},
+}
+DEFAULT_EXCHANGE_METHODS = {'sendCMD': False, 'queryCMD': False} # GENH600 and the older drivers
+REPLAY_CLASSES = {'MSO5000': SimulatedMSO5000, 'DP832': SimulatedDP832, 'GENH600': SimulatedGENH600,
+                  'POWAM_MICRO': SimulatedPOWAM_MICRO}
+
+def open_log(log_file, mode):
+    # text mode file, gzipped if log_file ends in '.gz'
+    if log_file.endswith('.gz'):
+        return gzip.open(log_file, mode + 't', encoding='utf-8')
+    return open(log_file, mode, encoding='utf-8')
+
+def encode_value(value):
+    # JSON-safe copy of a command or response: bytes become {'bytes': base64}
+    if isinstance(value, bytes):
+        return {'bytes': base64.b64encode(value).decode('ascii')}
+    if isinstance(value, (list, tuple)):
+        return [encode_value(item) for item in value]
+    return value
+
+def decode_value(value):
+    if isinstance(value, dict) and 'bytes' in value:
+        return base64.b64decode(value['bytes'])
+    if isinstance(value, list):
+        return [decode_value(item) for item in value]
+    return value
+
+def exchange_methods(device):
+    # [driver class name, {method: flush first}] for device, from the closest known base class
+    for cls in type(device).__mro__:
+        if cls.__name__ in EXCHANGE_METHODS:
+            return [cls.__name__, EXCHANGE_METHODS[cls.__name__]]
+        if cls.__name__ in REPLAY_CLASSES:
+            return [cls.__name__, DEFAULT_EXCHANGE_METHODS]
+    return [type(device).__name__, DEFAULT_EXCHANGE_METHODS]
+
+def load_traffic(log_file):
+    # returns [headers, records]: headers {device name: header line}, records in order
+    headers = {}
+    records = []
+    with open_log(log_file, 'r') as file:
+        for line in file:
+            entry = json.loads(line)
+            if 'class' in entry:
+                headers[entry['device']] = entry
+            else:
+                records.append(entry)
+    return [headers, records]
+
+def traffic_summary(records):
+    # {(device, method): [exchanges, total latency [s]]}, eg to see where a run's time went
+    summary = {}
+    for record in records:
+        key = (record['d'], record['m'])
+        [count, latency] = summary.get(key, [0, 0.0])
+        summary[key] = [count + 1, latency + record['dt']]
+    return summary
+
+class TrafficRecorder:
+
+    def __init__(self, log_file):
+        self.log_file = log_file
+        self.file = open_log(log_file, 'w')
+        self.lock = threading.Lock() # drivers can be used from several threads
+        self.t0 = time.time()
+        self.wrapped = [] # [device, method name] patched, to undo in stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def record(self, device, name):
+        # starts logging device's exchanges under name, returns device
+        [class_name, methods] = exchange_methods(device)
+        self.__write__({'device': name, 'class': class_name, 'options': self.__options__(device), 't0': self.t0})
+        for method in methods:
+            if hasattr(device, method):
+                setattr(device, method, self.__wrap__(device, name, method, getattr(device, method), methods[method]))
+                self.wrapped.append([device, method])
+        return device
+
+    def __options__(self, device):
+        # constructor options needed to rebuild the driver for replay
+        options = {}
+        for attribute in ['wav_format', 'sync_mode', 'framing']:
+            if hasattr(device, attribute):
+                options[attribute] = getattr(device, attribute)
+        if hasattr(device, 'ser'):
+            options['persistent_session'] = device.ser is not None
+        if hasattr(device, 'comm'):
+            options['persistent_session'] = device.comm is not None
+        return options
+
+    def __wrap__(self, device, name, method, function, flush_first):
+        io_lock = getattr(device, 'io_lock', threading.RLock())
+        def recorded_call(*args):
+            with io_lock: # flush and call together, like the method itself
+                if flush_first:
+                    device.flushBatch() # so the batched writes are logged on their own
+                t_start = time.time()
+                entry = {'d': name, 'm': method, 'c': encode_value(args[0]) if args else None}
+                if len(args) > 1:
+                    entry['a'] = encode_value(list(args[1:]))
+                try:
+                    response = function(*args)
+                except Exception as error:
+                    entry.update({'t': round(t_start - self.t0, 6), 'dt': round(time.time() - t_start, 6), 'e': repr(error)})
+                    self.__write__(entry)
+                    raise
+                entry.update({'t': round(t_start - self.t0, 6), 'dt': round(time.time() - t_start, 6),
+                              'r': encode_value(response)})
+                self.__write__(entry)
+                return response
+        return recorded_call
+
+    def __write__(self, entry):
+        with self.lock:
+            if self.file is not None:
+                self.file.write(json.dumps(entry, separators=(',', ':')) + '\n')
+
+    def stop(self):
+        # puts the drivers' own methods back
+        for [device, method] in self.wrapped:
+            if method in vars(device):
+                delattr(device, method)
+        self.wrapped = []
+
+    def close(self):
+        self.stop()
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+class TrafficReplay:
+    NO_REPLY = object() # marks a call that needs a recorded response
+
+    def __init__(self, log_file, latency_scale=0.0):
+        # latency_scale: recorded latencies are slept times this, 0 for as fast as possible
+        [self.headers, records] = load_traffic(log_file)
+        self.latency_scale = latency_scale
+        self.queues = {} # per device, records not served yet
+        for name in self.headers:
+            self.queues[name] = []
+        for record in records:
+            self.queues.setdefault(record['d'], []).append(record)
+        self.positions = dict([(name, 0) for name in self.queues]) # next record per device
+        self.counts = {} # per device: served, skipped, unmatched writes, recorded latency served
+        self.bench = SimulatedBench(latency_scale=0) # only for the drivers' connection checks
+        self.lock = threading.Lock()
+
+    def device(self, name):
+        # driver object for recorded device name, its exchanges served from the log
+        header = self.headers[name]
+        if header['class'] not in REPLAY_CLASSES:
+            raise Exception('No replay for ' + header['class'] + ' (recorded as ' + name + ').')
+        options = header['options']
+        if header['class'] in ['MSO5000']:
+            device = SimulatedMSO5000(self.bench, options.get('wav_format', 'BYTE'), options.get('sync_mode', 'DELAY'))
+        elif header['class'] in ['DP832']:
+            device = SimulatedDP832(self.bench, options.get('sync_mode', 'DELAY'))
+        else:
+            device = REPLAY_CLASSES[header['class']](self.bench, options.get('persistent_session', False))
+        if 'framing' in options:
+            device.framing = options['framing'] # frames or single commands, as recorded
+        self.counts[name] = {'served': 0, 'skipped': 0, 'unmatched writes': 0, 'recorded latency': 0.0}
+        methods = exchange_methods(device)[1]
+        for method in methods:
+            if hasattr(device, method):
+                setattr(device, method, self.__replay_call__(device, name, method, methods[method]))
+        return device
+
+    def __replay_call__(self, device, name, method, flush_first):
+        def replayed_call(*args):
+            if flush_first:
+                device.flushBatch() # the driver's own query sends batched commands first
+            return self.__serve__(name, method, args)
+        return replayed_call
+
+    def __serve__(self, name, method, args):
+        cmd = encode_value(args[0]) if args else None
+        extra = encode_value(list(args[1:])) if len(args) > 1 else None
+        with self.lock:
+            queue = self.queues[name]
+            position = self.positions[name]
+            index = position
+            while index < len(queue) and not(queue[index]['m'] == method and queue[index]['c'] == cmd and \
+                                             queue[index].get('a') == extra):
+                index += 1
+            counts = self.counts[name]
+            if index == len(queue): # nothing recorded for this call
+                reply = self.__unmatched_reply__(method, args)
+                if reply is self.NO_REPLY:
+                    raise Exception('Replay of ' + name + ' has no recorded ' + method + ' ' + str(args) + \
+                                    ' after exchange ' + str(position) + ' of ' + str(len(queue)) + '.')
+                counts['unmatched writes'] += 1
+                return reply
+            record = queue[index]
+            counts['skipped'] += index - position
+            counts['served'] += 1
+            counts['recorded latency'] += record['dt']
+            self.positions[name] = index + 1
+        if self.latency_scale > 0:
+            time.sleep(record['dt'] * self.latency_scale)
+        if 'e' in record:
+            raise Exception('Recorded ' + method + ' failed: ' + record['e'])
+        return decode_value(record.get('r'))
+
+    def __unmatched_reply__(self, method, args):
+        # what a write nobody recorded returns, NO_REPLY for queries
+        if method == '__write_cmd__':
+            return None
+        if method == '__send_frame__':
+            return ['' for cmd in args[0]]
+        if method == '__session_send_receive__' and not(args[1]):
+            return ''
+        if method == 'sendCMD' and isinstance(args[0], bytes) and not(b'?' in args[0]):
+            return b'OK\r' # GEN settings are acknowledged with OK
+        return self.NO_REPLY
+
+    def remaining(self, name):
+        # recorded exchanges of name not served yet
+        return len(self.queues[name]) - self.positions[name]
+
+    def summary(self):
+        # {device: counts}, with exchanges left over
+        summary = {}
+        for name in self.counts:
+            summary[name] = dict(self.counts[name])
+            summary[name]['left over'] = self.remaining(name)
+        return summary
+
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Times how long the host spends decoding ASCii waveform replies, old python list
+parsing vs the vectorised MSO5000.asciiToVector, at 1k, 100k and 1M points.
+Runs offline on synthetic replies. Set scopeUSB to the scope's address to also
+time a live ASCii read and see decode time vs time waiting on USB.
+"""
+
+import time
+import numpy as np
+from Equipment_Control_Malachi import MSO5000
+
+scopeUSB = None # eg 'USB0::0x1AB1::0x0515::MS5A243807653::INSTR' to include a live read
+channel_index = 1 # channel for the live read
+number_of_repeats = 5 # decodes per size, best time is reported
+
+def legacy_ascii_to_vector(asc):
+    # asciiToVector as it used to be: fixed header offset and a list of floats
+    asc = asc[11:-2] # remove header and footer
+    values = [float(i) for i in asc.split(',')] # makes a list
+    return np.asarray(values)
+
+def synthetic_reply(num_points):
+    # WAV:DATA? ASCii reply: block header, comma separated values, footer
+    values = np.round(np.sin(np.linspace(0, 20*np.pi, num_points)), 4) * 1.5
+    data = ','.join(['%.6e' % v for v in values]) + ','
+    return '#9' + str(len(data)).zfill(9) + data + '\n'
+
+def best_time(function, argument):
+    times = []
+    for n in range(number_of_repeats):
+        t_start = time.perf_counter()
+        output = function(argument)
+        times.append(time.perf_counter() - t_start)
+    return [output, min(times)]
+
+decoder = MSO5000.__new__(MSO5000) # no connection needed just to decode
+
+print('points    legacy [s]  vectorised [s]  speedup  max difference')
+for num_points in [1000, 100000, 1000000]:
+    asc = synthetic_reply(num_points)
+    [legacy_values, legacy_time] = best_time(legacy_ascii_to_vector, asc)
+    [values, vector_time] = best_time(decoder.asciiToVector, asc)
+    max_difference = np.max(np.abs(values - legacy_values))
+    print(str(num_points).ljust(10) + str(round(legacy_time, 5)).ljust(12) + \
+          str(round(vector_time, 5)).ljust(16) + str(round(legacy_time / vector_time, 1)).ljust(9) + \
+          str(max_difference))
+
+if scopeUSB is not None:
+    scope = MSO5000(visa_name = scopeUSB, wav_format = 'ASCii')
+    scope.stop() # freeze the screen so every read transfers the same waveform
+    scope.readChannel(channel_index) # sends the waveform settings once
+    t_start = time.perf_counter()
+    asc = scope.queryCMD("WAV:DATA?")
+    transfer_time = time.perf_counter() - t_start
+    [values, vector_time] = best_time(scope.asciiToVector, asc)
+    [legacy_values, legacy_time] = best_time(legacy_ascii_to_vector, asc)
+    scope.run()
+    print('\nLive read of ' + str(len(values)) + ' points (' + str(len(asc)) + ' bytes):')
+    print('waiting on USB [s]: ' + str(round(transfer_time, 4)))
+    print('legacy decode [s]: ' + str(round(legacy_time, 5)))
+    print('vectorised decode [s]: ' + str(round(vector_time, 5)))
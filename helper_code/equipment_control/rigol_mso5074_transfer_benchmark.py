@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+Compares ASCii and binary (BYTE/WORD) waveform transfer from the Rigol scope:
+bytes on the wire and wall time per channel read. Run with a live waveform on
+the screen so every mode transfers the same number of points.
+"""
+
+import time
+import numpy as np
+from Equipment_Control_Malachi import MSO5000
+
+scopeUSB = 'USB0::0x1AB1::0x0515::MS5A243807653::INSTR'
+channel_index = 1 # channel to read
+number_of_reads = 10 # reads per mode, averaged
+
+scope = MSO5000(visa_name = scopeUSB)
+scope.stop() # freeze the screen so every mode reads the same waveform
+
+results = {}
+for wav_format in ['ASCii', 'BYTE', 'WORD']:
+    scope.setWaveformFormat(wav_format)
+    read_times = []
+    for n in range(number_of_reads):
+        t_start = time.perf_counter()
+        data = scope.readChannel(channel_index)
+        read_times.append(time.perf_counter() - t_start)
+    results[wav_format] = [data, scope.last_transfer_bytes, np.average(read_times)]
+
+scope.run()
+
+print('format  points  bytes    bytes/point  time/read [s]')
+for wav_format in results:
+    [data, transfer_bytes, read_time] = results[wav_format]
+    print(wav_format.ljust(8) + str(len(data)).ljust(8) + str(transfer_bytes).ljust(9) + \
+          str(round(transfer_bytes / len(data), 2)).ljust(13) + str(round(read_time, 4)))
+
+# binary modes should agree with ASCii to within one ADC code
+ascii_values = results['ASCii'][0][:,1]
+for wav_format in ['BYTE', 'WORD']:
+    max_difference = np.max(np.abs(results[wav_format][0][:,1] - ascii_values))
+    print('Max difference ' + wav_format + ' vs ASCii [V]: ' + str(max_difference))
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+Waveform synthesizer for the hybrid converter driving the Sawyer-Tower circuit,
+what the scope sees on vout+ (channel 1), vout- (2), the vout+ low-side gate (3)
+and vref (4). Used by simulated_equipment's scope, and on its own to time and
+check the deskew/Ediss routines against a known Ediss.
+
+Model, per operating point (freq, HV voltage, gate duty, L1, L2, trap or sine):
+    - each switch node swings between 0 and the HV voltage. Trap: resonant transition
+      lasting f*Thalf/2, f from 16*C*L/Thalf^2 = f*(2 - f) (L_guess_trap inverted),
+      jumping the rest of the way if the dead time ends first. Sine: half-sine bump
+      lasting pi*sqrt(L*C), peak pi times the HV voltage
+    - C is the charge-equivalent node capacitance, 2*Cst + 2*c_parasitic like the
+      c_trap estimate in running_operating_points, and edges are shaped by the
+      nonlinear Coss(V): the node slows down where its capacitance is large
+    - vref comes from solving the DUT (Coss(V)) and Cref in series across vout+ and
+      vout-. The DUT's discharge branch holds hysteresis * Qmax * sin(pi*V/Vmax) more
+      charge than its charge branch, so every cycle dissipates a known Ediss
+One period is computed on a fine phase grid once per operating point. Frames are
+read off that table (linear interpolation, vectorised over channels and frames)
+with per-channel skew and noise, so producing a frame costs microseconds.
+
+Usage:
+    synthesizer = SawyerTowerSynthesizer(516e-12, gan_coss_curve(), hysteresis=0.02)
+    synthesizer.setOperatingPoint(2e6, 225, 0.75, 4.2e-6, 4.2e-6)
+    frames = synthesizer.frames(t, 100) # (100, 4, len(t)) scope volts
+    synthesizer.groundTruthEdiss() # [J] per cycle
+"""
+
+import numpy as np
+
+def constant_coss(capacitance):
+    # Coss(V) of an ideal capacitor [F]
+    return lambda v: np.full(np.shape(v), float(capacitance))
+
+def gan_coss_curve(c_zero=500e-12, c_high=100e-12, v_knee=40):
+    # GaN-HEMT-like Coss(V) [F]: c_zero at 0V falling towards c_high past v_knee [V]
+    # defaults are roughly a GS66504B
+    return lambda v: c_high + (c_zero - c_high) / (1 + np.asarray(v)/v_knee)**2
+
+class SawyerTowerSynthesizer:
+    PERIOD_POINTS = 4096 # phase grid of the period table
+    VOLTAGE_POINTS = 2048 # DUT voltage grid for solving the Sawyer-Tower divider
+
+    def __init__(self, cref, coss, hysteresis=0.0, c_parasitic=200e-12, probe_cdivs=[1, 1, 1],
+                 channel_skews=[0, 0, 0, 0], noise=[0, 0, 0, 0], gate_voltage=5.0, seed=0):
+        # cref [F]: Sawyer-Tower reference capacitor
+        # coss: DUT Coss(V) [F] as a function of numpy arrays, a number for an ideal capacitor
+        # hysteresis: extra charge on the discharge branch as a fraction of Qmax, 0 for lossless
+        # c_parasitic [F]: switch + diode capacitance on each switch node
+        # probe_cdivs: capacitive divider ratios of the vout+, vout-, vref probes
+        # channel_skews [s]: delay of each channel's probe and cable, [ch1, ch2, ch3, ch4]
+        # noise [V]: rms noise on each channel at the scope input
+        self.cref = cref
+        self.setCoss(coss, hysteresis)
+        self.c_parasitic = c_parasitic
+        self.probe_cdivs = probe_cdivs
+        self.channel_skews = np.asarray(channel_skews, dtype=float)
+        self.noise = np.asarray(noise, dtype=float)
+        self.gate_voltage = gate_voltage
+        self.rng = np.random.default_rng(seed)
+        self.operating_point = None
+        self.table = np.zeros((4, self.PERIOD_POINTS)) # one period of each channel, before skew and noise
+        self.period = 1.0
+        self.transition_times = [0.0, 0.0]
+        self.node_capacitance = 0.0
+        self.ediss = 0.0
+        self.loop = [np.zeros(1), np.zeros(1)] # [DUT voltage, DUT charge] over one period
+
+    def setCoss(self, coss, hysteresis=0.0):
+        # swaps the DUT, eg ideal capacitor for the device under test
+        if not(callable(coss)):
+            coss = constant_coss(coss)
+        self.coss = coss
+        self.hysteresis = hysteresis
+        self.operating_point = None # recompute on the next setOperatingPoint
+
+    def setOperatingPoint(self, freq, HV_voltage, duty, L1, L2, trap=True):
+        # freq [Hz] switching frequency, HV_voltage [V] each switch node's swing (0 when off)
+        # duty: low-side gate on-time as a fraction of half a period
+        # L1 [H] drives vout- (channel 2), L2 [H] drives vout+ (channel 1)
+        # the period table is only recomputed when something changed
+        operating_point = (freq, HV_voltage, duty, L1, L2, trap)
+        if operating_point == self.operating_point:
+            return
+        self.operating_point = operating_point
+        self.period = 1/freq
+        Thalf = self.period/2
+        phase = np.arange(self.PERIOD_POINTS) * (self.period/self.PERIOD_POINTS)
+        [node_swing_fraction, node_time_fraction] = self.__node_capacitance__(HV_voltage, trap)
+        t_off = duty * Thalf # low-side gate turns off, node starts moving
+        nodes = []
+        self.transition_times = []
+        for L in [L2, L1]: # vout+ then vout-, vout- half a period later
+            if trap:
+                f = 1 - np.sqrt(1 - min(16*self.node_capacitance*L/Thalf**2, 1))
+                tr = max(f * Thalf/2, 1e-12)
+            else:
+                tr = np.pi * np.sqrt(L*self.node_capacitance)
+            self.transition_times.append(tr)
+            node_phase = phase if not(nodes) else np.mod(phase + Thalf, self.period)
+            nodes.append(self.__node_waveform__(node_phase, Thalf, t_off, tr, HV_voltage, trap,
+                                                node_swing_fraction, node_time_fraction))
+        [vout_plus, vout_minus] = nodes
+        [vd, q] = self.__sawyer_tower_solve__(vout_plus - vout_minus)
+        self.loop = [vd, q]
+        vref = vout_minus + q/self.cref
+        gate = self.gate_voltage * (phase < t_off)
+        self.table = np.array([vout_plus * self.probe_cdivs[0], vout_minus * self.probe_cdivs[1],
+                               gate, vref * self.probe_cdivs[2]])
+
+    def __node_capacitance__(self, HV_voltage, trap):
+        # sets node_capacitance (charge-equivalent) and returns the edge shape as
+        # [fraction of the swing, fraction of the transition time it's reached at]
+        # while a node moves, the ST divider sees twice its movement (both nodes move)
+        swing = 2*HV_voltage * (np.pi if not(trap) else 1)
+        self.__dut_charge_table__(max(swing, 1e-3))
+        u = self.vd_grid + self.Q_grid/self.cref # ST voltage for each DUT voltage
+        c_st = self.Q_grid[-1] / u[-1] if u[-1] > 0 else 0.0
+        self.node_capacitance = 2*c_st + 2*self.c_parasitic
+        # incremental capacitance along the edge: slower where the DUT's Coss is large
+        c_st_incremental = np.gradient(self.Q_grid, u)
+        fractions = u / u[-1]
+        c_node = 2*c_st_incremental + 2*self.c_parasitic
+        time_fraction = np.concatenate(([0], np.cumsum((c_node[1:] + c_node[:-1])/2 * np.diff(fractions))))
+        time_fraction /= time_fraction[-1]
+        return [fractions, time_fraction]
+
+    def __dut_charge_table__(self, swing):
+        # DUT voltage grid covering a Sawyer-Tower swing [V], with the charge branch Q(V)
+        # ST voltage u = vd + Q(vd)/cref reaches swing before vd does, so vd up to swing is enough
+        vd = np.linspace(0, swing, self.VOLTAGE_POINTS)
+        c = self.coss(vd)
+        Q = np.concatenate(([0], np.cumsum((c[1:] + c[:-1])/2 * np.diff(vd))))
+        u = vd + Q/self.cref
+        vd_max = np.interp(swing, u, vd)
+        self.vd_grid = np.linspace(0, vd_max, self.VOLTAGE_POINTS)
+        self.Q_grid = np.interp(self.vd_grid, vd, Q)
+
+    def __node_waveform__(self, phase, Thalf, t_off, tr, A, trap, swing_fraction, time_fraction):
+        # one switch node over a period: low, leaves at t_off, high, back half a period later
+        if not(trap): # resonant half-sine bump
+            bump = np.clip((phase - t_off) / tr, 0, 1)
+            return A * np.pi * np.sin(np.pi * bump) * (phase >= t_off)
+        dead_time = Thalf - t_off
+        rising = np.clip((phase - t_off) / tr, 0, 1) # fraction of the rising edge's time
+        falling = np.clip((phase - Thalf - t_off) / tr, 0, 1)
+        rising_v = np.interp(rising, time_fraction, swing_fraction)
+        falling_v = np.interp(falling, time_fraction, swing_fraction)
+        if tr > dead_time: # next gate turns on first: node jumps the rest of the way
+            rising_v[phase >= Thalf] = 1 # the falling edge's jump happens at the wrap to phase 0
+        return A * (rising_v - falling_v)
+
+    def __sawyer_tower_solve__(self, vst):
+        # [DUT voltage, DUT charge] over the period, given vout+ - vout-, and sets ediss
+        # the DUT and Cref share the same charge: vd + q/cref = vst (offset to start at 0)
+        u = vst - np.min(vst)
+        Q_charge = self.Q_grid
+        if self.hysteresis != 0 and self.vd_grid[-1] > 0:
+            Q_discharge = Q_charge + self.hysteresis * Q_charge[-1] * np.sin(np.pi * self.vd_grid/self.vd_grid[-1])
+        else:
+            Q_discharge = Q_charge
+        vd_charge = np.interp(u, self.vd_grid + Q_charge/self.cref, self.vd_grid)
+        vd_discharge = np.interp(u, self.vd_grid + Q_discharge/self.cref, self.vd_grid)
+        # branch: charging while u last moved up, discharging while it last moved down
+        du = np.diff(np.append(u, u[0]))
+        moving = np.flatnonzero(du != 0)
+        if len(moving) == 0:
+            self.ediss = 0.0
+            return [vd_charge, np.interp(vd_charge, self.vd_grid, Q_charge)]
+        last_move = np.maximum.accumulate(np.where(du != 0, np.arange(len(du)), -1))
+        last_move[last_move < 0] = moving[-1] # before the first move: the period's last one
+        charging = np.roll(du[last_move] > 0, 1) # sample i comes after the step from i-1
+        vd = np.where(charging, vd_charge, vd_discharge)
+        q = np.where(charging, np.interp(vd, self.vd_grid, Q_charge), np.interp(vd, self.vd_grid, Q_discharge))
+        # Ediss is the loop integral of vd dq, taken along the Q(V) branches rather than
+        # straight lines between samples so jumps (hard switching) don't add chord error
+        energy_charge = self.__cumulative_v_dq__(Q_charge)
+        energy_discharge = self.__cumulative_v_dq__(Q_discharge)
+        following = np.roll(vd, -1) # each step from sample i to i+1, on sample i+1's branch
+        branch_next = np.roll(charging, -1)
+        steps = np.where(branch_next,
+                         np.interp(following, self.vd_grid, energy_charge) - np.interp(vd, self.vd_grid, energy_charge),
+                         np.interp(following, self.vd_grid, energy_discharge) - np.interp(vd, self.vd_grid, energy_discharge))
+        self.ediss = np.sum(steps)
+        return [vd, q]
+
+    def __cumulative_v_dq__(self, Q):
+        # integral of v dQ from 0 up to each point of vd_grid, along the branch Q(vd_grid)
+        v = self.vd_grid
+        return np.concatenate(([0], np.cumsum((v[1:] + v[:-1])/2 * np.diff(Q))))
+
+    def groundTruthEdiss(self):
+        # [J] dissipated in the DUT per cycle at the current operating point
+        return self.ediss
+
+    def transitionTimes(self):
+        # [s] [vout+ transition, vout- transition], resonant times even if cut short
+        return self.transition_times
+
+    def riseTime(self, channel):
+        # [s] 10-90% rise time of channel (1 or 2) from the period table, 0 if it doesn't rise
+        node = self.table[channel - 1]
+        low = np.min(node)
+        swing = np.max(node) - low
+        if swing <= 0:
+            return 0.0
+        rising = np.flatnonzero((node[1:] > node[:-1]))
+        if len(rising) == 0:
+            return 0.0
+        start = rising[0] # start of the rising edge, then look for the two levels after it
+        after = np.concatenate((node[start:], node[:start]))
+        t10 = np.argmax(after >= low + 0.1*swing)
+        t90 = np.argmax(after >= low + 0.9*swing)
+        return max(t90 - t10, 1) * self.period/self.PERIOD_POINTS
+
+    def frame(self, t, extra_skews=None):
+        # noise-free channels 1-4 at times t [s] (trigger at 0), shape (4, len(t))
+        # extra_skews [s]: added to channel_skews, eg the scope's own deskew settings
+        skews = self.channel_skews if extra_skews is None else self.channel_skews + np.asarray(extra_skews)
+        position = np.mod(np.asarray(t)[None, :] - skews[:, None], self.period) * (self.PERIOD_POINTS/self.period)
+        index = np.floor(position).astype(int)
+        fraction = position - index
+        index %= self.PERIOD_POINTS
+        following = (index + 1) % self.PERIOD_POINTS
+        rows = np.arange(4)[:, None]
+        return self.table[rows, index] * (1 - fraction) + self.table[rows, following] * fraction
+
+    def frames(self, t, number_of_frames=1, extra_skews=None):
+        # number_of_frames acquisitions of channels 1-4 with noise, shape (frames, 4, len(t))
+        clean = self.frame(t, extra_skews)
+        noise = self.rng.standard_normal((number_of_frames, 4, len(clean[0]))) * self.noise[None, :, None]
+        return clean[None, :, :] + noise
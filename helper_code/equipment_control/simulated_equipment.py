@@ -0,0 +1,655 @@
+# -*- coding: utf-8 -*-
+"""
+Simulated bench, to run operating points and sweeps without the hardware.
+
+SimulatedBench holds the state of the whole setup: HV supply, LV supply channels,
+control board (a MockPOWAMFirmware, see arduino_coss_mock), and the hybrid
+converter driving the Sawyer-Tower circuit, whose waveforms come from a
+SawyerTowerSynthesizer (see sawyer_tower_synthesizer). It hands out simulated VISA resources
+and serial ports. SimulatedMSO5000, SimulatedDP832, SimulatedGENH600 and
+SimulatedPOWAM_MICRO are the real driver classes on those transports, so
+everything above the transport (batches, sync modes, setting caches, sessions,
+acquisition thread...) runs exactly as it does on the bench.
+
+Every instrument has a LatencyModel for how long talking to it and processing
+commands takes. The defaults (DEFAULT_LATENCIES) assume the instruments really
+need a tenth of the CMD_DELAY the drivers were tuned with, so the time the
+drivers spend waiting shows up like it does on the bench.
+
+Usage:
+    bench = SimulatedBench()
+    scope = SimulatedMSO5000(bench)
+    HV_supply = SimulatedGENH600(bench, persistent_session=True)
+    LV_supply = SimulatedDP832(bench)
+    arduino = SimulatedPOWAM_MICRO(bench, persistent_session=True)
+    ... same calls as with the real instruments ...
+    bench.installCapacitor(gan_coss_curve(), hysteresis=0.02) # swap the ideal capacitor for the DUT
+    bench.synthesizer.groundTruthEdiss() # [J] Ediss the run should measure
+
+Commands covered are the SCPI and arduino instructions the drivers send for
+helper_functions. Other SCPI commands are accepted and stored like a setting.
+"""
+
+import time
+import threading
+import numpy as np
+import pyvisa
+try:
+    from .Equipment_Control_Malachi import MSO5000, DP832, GENH600
+    from .arduino_coss_communication import POWAM_MICRO
+    from .arduino_coss_mock import MockPOWAMFirmware
+    from .sawyer_tower_synthesizer import SawyerTowerSynthesizer
+except ImportError: # run as a script from this folder
+    from Equipment_Control_Malachi import MSO5000, DP832, GENH600
+    from arduino_coss_communication import POWAM_MICRO
+    from arduino_coss_mock import MockPOWAMFirmware
+    from sawyer_tower_synthesizer import SawyerTowerSynthesizer
+
+class LatencyModel:
+    # how long an instrument takes, applied by its simulated transport [s]
+
+    def __init__(self, per_open=0.0, per_exchange=0.0, per_command=0.0, per_byte=0.0):
+        # per_open: opening the port (serial ports opened per command pay this every time)
+        # per_exchange: every write or read crossing the bus
+        # per_command: instrument processing each command, ';'-joined ones counted separately
+        # per_byte: line time per byte, eg 10/baudrate for serial
+        self.per_open = per_open
+        self.per_exchange = per_exchange
+        self.per_command = per_command
+        self.per_byte = per_byte
+
+    def scaled(self, scale):
+        return LatencyModel(self.per_open * scale, self.per_exchange * scale,
+                            self.per_command * scale, self.per_byte * scale)
+
+    def __repr__(self):
+        return 'LatencyModel(per_open=' + str(self.per_open) + ', per_exchange=' + str(self.per_exchange) + \
+               ', per_command=' + str(self.per_command) + ', per_byte=' + str(self.per_byte) + ')'
+
+# instruments are modelled as needing a tenth of the CMD_DELAY the drivers wait
+DEFAULT_LATENCIES = {
+    'scope': LatencyModel(per_exchange=0.001, per_command=MSO5000.CMD_DELAY/10, per_byte=1/20e6), # USB2 ~20MB/s
+    'LV': LatencyModel(per_exchange=0.001, per_command=DP832.CMD_DELAY/10, per_byte=1/1e6),
+    'HV': LatencyModel(per_open=0.02, per_command=GENH600.CMD_DELAY/10, per_byte=10/GENH600.BAUDRATE),
+    'arduino': LatencyModel(per_open=0.02, per_command=0.001, per_byte=10/POWAM_MICRO.BAUDRATE),
+}
+
+class SimulatedBench:
+    HV_IDN = 'LAMBDA,GEN600-1.3-USB'
+    LV_IDN = 'RIGOL TECHNOLOGIES,DP832A,DP8B171800380,00.01.13'
+    SCOPE_IDN = 'RIGOL TECHNOLOGIES,MSO5074,MS5ASIMULATED,00.01.03.00.01'
+    GATE_VOLTAGE = 5.0 # [V] gate drive seen on channel 3
+
+    def __init__(self, latencies=None, latency_scale=1.0, cref=516e-12, c_dut=204e-12, hysteresis=0.0,
+                 c_parasitic=200e-12, probe_cdivs=[0.1, 0.1, 0.1], channel_skews=[0.5e-9, -0.3e-9, 0, 0.2e-9],
+                 noise=[0.05, 0.05, 0.02, 0.05], inductance_gain=1.1, inductance_offset=0.2e-6,
+                 screen_points=1000, raw_points=10000, acquisition_time=0.01, seed=0):
+        # latencies: {'scope', 'LV', 'HV', 'arduino': LatencyModel}, missing ones use DEFAULT_LATENCIES
+        # latency_scale: multiplies every latency, eg 0 for an instant bench
+        # cref [F]: Sawyer-Tower reference capacitance
+        # c_dut: capacitor in the DUT position [F], or its Coss(V) curve (see sawyer_tower_synthesizer)
+        # hysteresis: DUT loss, see SawyerTowerSynthesizer, 0 for the ideal capacitor
+        # c_parasitic [F]: switch + diode capacitance on each switch node
+        # probe_cdivs: capacitive divider ratio of the vout+, vout-, vref probes
+        # channel_skews [s]: true delay of each channel's probe, what deskewing has to find
+        # noise [V]: rms noise on each channel at the scope input
+        # inductance_gain, inductance_offset: true inductance is
+            # offset + gain * (position / STEPS_PER_UH) uH, so the arduino's 'l' instruction
+            # (characterization not so accurate) is off like on the bench
+        # screen_points, raw_points: points per channel in WAV:MODE NORMal and RAW
+        # acquisition_time [s]: from :SINGle until the scope reports STOP
+        latency_models = dict(DEFAULT_LATENCIES)
+        if latencies is not None:
+            latency_models.update(latencies)
+        self.latencies = {}
+        for name in latency_models:
+            self.latencies[name] = latency_models[name].scaled(latency_scale)
+        self.cref = cref
+        self.probe_cdivs = probe_cdivs
+        self.inductance_gain = inductance_gain
+        self.inductance_offset = inductance_offset
+        self.screen_points = screen_points
+        self.raw_points = raw_points
+        self.acquisition_time = acquisition_time
+        self.rng = np.random.default_rng(seed)
+        self.synthesizer = SawyerTowerSynthesizer(cref, c_dut, hysteresis, c_parasitic, probe_cdivs,
+                                                  channel_skews, noise, self.GATE_VOLTAGE, seed)
+        self.lock = threading.RLock() # state is shared by every instrument's thread
+        # HV supply and LV supply state
+        self.HV = {'voltage': 0.0, 'current_limit': 1.3, 'output': False}
+        self.LV = {}
+        for channel in [1, 2, 3]:
+            self.LV[channel] = {'voltage': 0.0, 'current_limit': 0.0, 'output': False}
+        # control board, with its inductor motion model
+        self.firmware = MockPOWAMFirmware(framing=True)
+        self.scope_resource = SimulatedScopeResource(self, self.latencies['scope'])
+        self.LV_resource = SimulatedDP832Resource(self, self.latencies['LV'])
+        self.unpowered_moves = 0 # inductor moves started with LV channel 2 (motors) off
+        self.firmware_run_instruction = self.firmware.runInstruction
+        self.firmware.runInstruction = self.__run_instruction__
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def installCapacitor(self, c_dut, hysteresis=0.0):
+        # swaps the capacitor under test, eg ideal capacitor for the DUT
+        # c_dut [F] or Coss(V) curve, hysteresis: see SawyerTowerSynthesizer
+        with self.lock:
+            self.synthesizer.setCoss(c_dut, hysteresis)
+
+    # transports handed to the simulated drivers
+    def resourceManager(self):
+        return SimulatedResourceManager(self)
+
+    def openHVSerial(self, *args, **kwargs):
+        return SimulatedHVSerial(self, self.latencies['HV'], *args, **kwargs)
+
+    def openArduinoSerial(self, *args, **kwargs):
+        return SimulatedArduinoSerial(self, self.latencies['arduino'], *args, **kwargs)
+
+    def __run_instruction__(self, cmd):
+        # arduino instructions go to the firmware mock, noting moves without motor power
+        if cmd[0:1] in ['m', 'c', 'p', 'l'] and not(self.LV[2]['output']):
+            self.unpowered_moves += 1
+        return self.firmware_run_instruction(cmd)
+
+    # circuit model, waveforms come from the synthesizer
+    def inductance(self, ind):
+        # [H] present inductance of inductor ind (1 or 2), following it while it moves
+        position = self.firmware.positionNow(ind)
+        uH = max(position, 0) / self.firmware.STEPS_PER_UH
+        return self.inductance_offset + self.inductance_gain * uH * 1e-6
+
+    def switchingFrequency(self):
+        return self.firmware.sine_freq / 2 # [Hz] DDS runs at twice the switching frequency
+
+    def signalChainOn(self):
+        return self.LV[1]['output'] and self.LV[1]['voltage'] > 10
+
+    def gateDuty(self):
+        # low-side gate on-time as a fraction of half a period, from duty vref
+        return 0.5 + 0.4 * (self.firmware.duty_ref - 2.5)
+
+    def gatesRunning(self):
+        # False when gates are off or the duty vref is out of range (no gate signal)
+        duty = self.gateDuty()
+        return self.firmware.gates_enabled and self.signalChainOn() and (0.05 < duty < 0.95) and \
+               self.switchingFrequency() > 0
+
+    def nodeAmplitude(self):
+        # [V] swing of each switch node: HV supply voltage, when everything is running
+        if not(self.HV['output'] and self.gatesRunning()):
+            return 0.0
+        return self.HV['voltage']
+
+    def updateSynthesizer(self):
+        # brings the synthesizer to the present state of the bench, False if the gates aren't running
+        if not(self.gatesRunning()):
+            return False
+        self.synthesizer.setOperatingPoint(self.switchingFrequency(), self.nodeAmplitude(), self.gateDuty(),
+                                           self.inductance(1), self.inductance(2), self.firmware.trap_mode)
+        return True
+
+    def HVPower(self):
+        # [W] drawn from the HV supply: fixed losses, plus hard switching when the dead
+        # time is too short for the transition, plus diode conduction when it's too long,
+        # plus the DUT's Ediss every cycle
+        A = self.nodeAmplitude()
+        if A == 0 or not(self.updateSynthesizer()):
+            return 0.0
+        fsw = self.switchingFrequency()
+        Thalf = 1/2/fsw
+        C = self.synthesizer.node_capacitance
+        dead_time = (1 - self.gateDuty()) * Thalf
+        power = 1.0 + 2e-5 * A**2 + self.synthesizer.groundTruthEdiss() * fsw
+        for tr in self.synthesizer.transitionTimes():
+            if self.firmware.trap_mode:
+                if dead_time < tr: # node jumps the rest of the way when the next gate turns on
+                    power += 2 * fsw * C/2 * (A * (1 - dead_time/tr))**2
+                else: # current freewheels in the reverse diode for the rest of the dead time
+                    power += 2 * fsw * (dead_time - tr) * (C*A/tr) * 2.5
+            else: # sine: bump should last half a period, energy left over is lost
+                power += 2 * fsw * C/2 * (A * abs(tr - Thalf) / Thalf)**2
+        return power
+
+    def HVCurrent(self):
+        with self.lock:
+            if not(self.HV['output']) or self.HV['voltage'] <= 0:
+                return 0.0
+            return self.HVPower() / self.HV['voltage'] + 0.002 * self.rng.standard_normal()
+
+    def LVCurrent(self, channel):
+        # [A] signal chain on channel 1, fans (and moving inductor motors) on channel 2
+        with self.lock:
+            if not(self.LV[channel]['output']):
+                return 0.0
+            if channel == 1:
+                current = 0.3 + (0.2 if self.gatesRunning() else 0)
+            elif channel == 2:
+                current = 0.8 + (0.0 if self.firmware.inductorsStopped() else 0.6)
+            else:
+                current = 0.0
+            return min(current, self.LV[channel]['current_limit'])
+
+    def channelWaveforms(self, t, tcal=[0, 0, 0, 0]):
+        # one acquisition of the scope inputs at times t (trigger at t=0), shape (4, len(t))
+        # channel 1: vout+, 2: vout-, 4: vref (all through their probe cdivs), 3: gate
+        # tcal: scope channel deskews [s]
+        with self.lock:
+            if not(self.updateSynthesizer()):
+                return np.zeros((4, len(t)))
+            return self.synthesizer.frames(t, 1, tcal)[0]
+
+    def measure(self, item, channel):
+        # scope measurement item on channel, 9.9e37 when it can't be measured (like the scope)
+        with self.lock:
+            if item in ['PDUTy', 'NDUTy'] and channel == 3:
+                if not(self.gatesRunning()):
+                    return 9.9e37
+                duty = self.gateDuty() / 2 # high for D of half the period
+                return duty if item == 'PDUTy' else 1 - duty
+            if item in ['PSLewrate', 'NSLewrate'] and channel in [1, 2]:
+                A = self.nodeAmplitude()
+                if A == 0 or not(self.firmware.trap_mode) or not(self.updateSynthesizer()):
+                    return 9.9e37
+                slew = 0.8 * A * self.probe_cdivs[channel - 1] / self.synthesizer.riseTime(channel)
+                slew *= 1 + 0.002 * self.rng.standard_normal()
+                return slew if item == 'PSLewrate' else -slew
+            if item == 'FREQuency':
+                return self.switchingFrequency() if self.gatesRunning() else 9.9e37
+        return 9.9e37 # item not modelled
+
+class SimulatedResourceManager:
+    # the parts of pyvisa.ResourceManager the drivers use
+
+    def __init__(self, bench):
+        self.bench = bench
+
+    def list_resources(self):
+        return ('SIM::MSO5074::INSTR', 'SIM::DP832::INSTR')
+
+    def open_resource(self, visa_name):
+        if 'MSO5' in visa_name:
+            return self.bench.scope_resource
+        if 'DP8' in visa_name:
+            return self.bench.LV_resource
+        raise pyvisa.VisaIOError(pyvisa.constants.StatusCode.error_resource_not_found)
+
+class SimulatedResource:
+    # the parts of a pyvisa resource the drivers use: write, read, read_raw, query, timeout
+    # commands are processed one after the other in the order received: the instrument is
+    # busy until busy_until, and replies can only be read after it gets to them
+
+    def __init__(self, bench, latency):
+        self.bench = bench
+        self.latency = latency
+        self.timeout = 5000 # [ms] like pyvisa
+        self.replies = [] # [ready time, reply] waiting to be read
+        self.busy_until = time.time()
+        self.commands_received = 0
+        self.writes_received = 0
+
+    def write(self, cmd):
+        self.bench.sleep(self.latency.per_exchange + self.latency.per_byte * len(cmd))
+        commands = [command.strip() for command in cmd.strip().split(';') if command.strip()]
+        self.writes_received += 1
+        replies = []
+        for command in commands:
+            self.busy_until = max(self.busy_until, time.time()) + self.latency.per_command
+            self.commands_received += 1
+            [header, separator, args] = command.lstrip(':').partition(' ')
+            with self.bench.lock:
+                reply = self.handle(header.upper(), args.strip())
+            if reply is not None:
+                replies.append(reply)
+        if len(replies) == 1:
+            self.replies.append([self.busy_until, replies[0]])
+        elif replies: # ';'-joined queries get one ';'-joined reply line
+            self.replies.append([self.busy_until, ';'.join([str(reply).strip() for reply in replies])])
+        return len(cmd)
+
+    def read_raw(self):
+        if not(self.replies):
+            self.bench.sleep(self.timeout / 1000)
+            raise pyvisa.VisaIOError(pyvisa.constants.StatusCode.error_timeout)
+        [ready_time, reply] = self.replies.pop(0)
+        if isinstance(reply, str):
+            reply = bytes(reply if reply.endswith('\n') else reply + '\n', 'utf-8')
+        self.bench.sleep(ready_time - time.time())
+        self.bench.sleep(self.latency.per_exchange + self.latency.per_byte * len(reply))
+        return reply
+
+    def read(self):
+        return self.read_raw().decode('utf-8')
+
+    def query(self, cmd):
+        self.write(cmd)
+        return self.read()
+
+    def close(self):
+        pass
+
+    def handle(self, header, args):
+        # runs one command, returns its reply (str or bytes) or None
+        if header == '*IDN?':
+            return self.IDN
+        if header == '*OPC?':
+            return '1'
+        if header in ['*WAI', '*CLS', '*RST']:
+            return None
+        return self.handleCommand(header, args)
+
+class SimulatedScopeResource(SimulatedResource):
+    # MSO5074: settings are stored by header, waveforms come from the bench's circuit model
+    DEFAULT_SETTINGS = {'TIMEBASE:MAIN:SCALE': '1e-07', 'TIMEBASE:MAIN:OFFSET': '0', 'ACQUIRE:MDEPTH': 'AUTO',
+                        'WAV:MODE': 'NORMAL', 'WAV:FORMAT': 'BYTE', 'WAV:SOURCE': 'CHAN1', 'WAV:START': '1'}
+    FORMAT_CODES = {'BYTE': 0, 'WORD': 1, 'ASCII': 2}
+
+    def __init__(self, bench, latency):
+        SimulatedResource.__init__(self, bench, latency)
+        self.IDN = bench.SCOPE_IDN
+        self.settings = dict(self.DEFAULT_SETTINGS)
+        for n in range(1, 5):
+            self.settings['CHANNEL' + str(n) + ':DISPLAY'] = 'ON'
+            self.settings['CHANNEL' + str(n) + ':SCALE'] = '1'
+            self.settings['CHANNEL' + str(n) + ':OFFSET'] = '0'
+            self.settings['CHANNEL' + str(n) + ':COUPLING'] = 'DC'
+            self.settings['CHANNEL' + str(n) + ':TCALIBRATE'] = '0'
+        self.running = True
+        self.acquired_at = time.time() # when the latest acquisition finished (or will)
+        self.frame_index = 0 # acquisitions so far
+        self.frames = {} # waveforms of the latest acquisition, per WAV:MODE
+
+    def handleCommand(self, header, args):
+        if header == 'RUN':
+            self.running = True
+        elif header == 'STOP':
+            self.running = False
+        elif header in ['SING', 'SINGLE']:
+            self.running = False
+            self.__acquire__(time.time() + self.bench.acquisition_time)
+        elif header in ['TFOR', 'CLE', 'AUT', 'MEASURE:STATISTIC:ITEM', 'MEASURE:STATISTIC:RESET', 'MEASURE:CLEAR']:
+            pass # nothing to model
+        elif header == 'TRIGGER:STATUS?':
+            if self.running:
+                return 'RUN'
+            return 'STOP' if time.time() >= self.acquired_at else 'WAIT'
+        elif header == 'WAV:DATA?':
+            return self.__waveform_data__()
+        elif header == 'WAV:PREAMBLE?':
+            return ','.join([str(value) for value in self.__preamble__()])
+        elif header in ['MEASURE:ITEM?', 'MEASURE:STATISTIC:ITEM?']:
+            fields = args.split(',')
+            return '%.6e' % self.bench.measure(fields[-2], int(fields[-1][len('CHANnel'):]))
+        elif header.endswith(':DISPLAY?'):
+            return '1' if self.settings.get(header[:-1], 'OFF') in ['ON', '1'] else '0'
+        elif header.endswith('?'):
+            return self.settings.get(header[:-1], '0')
+        else:
+            self.settings[header] = args.upper() if header in ['WAV:MODE', 'WAV:FORMAT', 'WAV:SOURCE'] else args
+        return None
+
+    def __acquire__(self, acquired_at):
+        self.acquired_at = acquired_at
+        self.frame_index += 1
+        self.frames = {}
+
+    def __timebase__(self, mode):
+        # [points, xinc, xorigin] of the current acquisition in WAV:MODE mode
+        scale = float(self.settings['TIMEBASE:MAIN:SCALE'])
+        offset = float(self.settings['TIMEBASE:MAIN:OFFSET'])
+        points = self.bench.raw_points if mode == 'RAW' else self.bench.screen_points
+        return [points, 10*scale/points, offset - 5*scale]
+
+    def __frame__(self, mode):
+        # waveforms of the latest acquisition, a new one each read while running
+        if self.running:
+            self.__acquire__(time.time())
+        if mode not in self.frames:
+            [points, xinc, xorigin] = self.__timebase__(mode)
+            t = xorigin + np.arange(points) * xinc
+            tcal = [float(self.settings['CHANNEL' + str(n) + ':TCALIBRATE']) for n in range(1, 5)]
+            waveforms = self.bench.channelWaveforms(t, tcal)
+            for n in range(4):
+                if self.settings['CHANNEL' + str(n+1) + ':COUPLING'].upper() == 'AC':
+                    waveforms[n] -= np.mean(waveforms[n])
+            self.frames[mode] = waveforms
+        return self.frames[mode]
+
+    def __preamble__(self):
+        mode = 'RAW' if self.settings['WAV:MODE'].startswith('RAW') else 'NORMAL'
+        wav_format = self.settings['WAV:FORMAT']
+        [points, xinc, xorigin] = self.__timebase__(mode)
+        channel = self.__source_channel__()
+        scale = float(self.settings['CHANNEL' + str(channel) + ':SCALE'])
+        offset = float(self.settings['CHANNEL' + str(channel) + ':OFFSET'])
+        if wav_format == 'WORD':
+            [y_inc, y_ref] = [10*scale/65536, 32768]
+        else:
+            [y_inc, y_ref] = [10*scale/256, 128]
+        y_origin = offset / y_inc # volts = (code - y_origin - y_ref) * y_inc
+        return [self.FORMAT_CODES.get(wav_format, 0), 0, points, 1, xinc, xorigin, 0, y_inc, y_origin, y_ref]
+
+    def __source_channel__(self):
+        source = self.settings['WAV:SOURCE']
+        return int(source[-1]) # CHAN1 to CHAN4, MATH channels read as the channel of the same number
+
+    def __waveform_data__(self):
+        # IEEE-488.2 block of the current source in the current WAV:FORMat
+        mode = 'RAW' if self.settings['WAV:MODE'].startswith('RAW') else 'NORMAL'
+        values = self.__frame__(mode)[self.__source_channel__() - 1]
+        # WAV:STARt/WAV:STOP window, counting from 1, in either mode like the scope
+        start = int(self.settings.get('WAV:START', '1'))
+        stop = int(self.settings.get('WAV:STOP', str(len(values))))
+        values = values[start - 1:stop]
+        preamble = self.__preamble__()
+        [y_inc, y_origin, y_ref] = preamble[7:10]
+        wav_format = self.settings['WAV:FORMAT']
+        if wav_format == 'ASCII':
+            displayed = np.clip(values, (0 - y_origin - y_ref)*y_inc, (2*y_ref - 1 - y_origin - y_ref)*y_inc)
+            data = bytes(','.join(['%.6e' % value for value in displayed]) + ',', 'utf-8')
+        else: # clipped to the screen like the scope's ADC
+            codes = np.clip(np.round(values / y_inc + y_origin + y_ref), 0, 2*y_ref - 1)
+            data = codes.astype('<u2' if wav_format == 'WORD' else np.uint8).tobytes()
+        length = str(len(data))
+        return bytes('#' + str(len(length)) + length, 'utf-8') + data + b'\n'
+
+class SimulatedDP832Resource(SimulatedResource):
+    # DP832: INST/SOUR/OUTP/APPL/MEAS commands on the bench's LV channels
+
+    def __init__(self, bench, latency):
+        SimulatedResource.__init__(self, bench, latency)
+        self.IDN = bench.LV_IDN
+        self.selected = 1
+
+    def handleCommand(self, header, args):
+        LV = self.bench.LV
+        fields = [field.strip().upper() for field in args.split(',')] if args else []
+        if header in ['INST', 'INST:NSEL']:
+            self.selected = int(fields[0][-1])
+        elif header == 'SOUR:VOLT':
+            LV[self.selected]['voltage'] = float(fields[0])
+        elif header == 'SOUR:CURR':
+            LV[self.selected]['current_limit'] = float(fields[0])
+        elif header == 'APPL':
+            channel = int(fields[0][-1])
+            LV[channel]['voltage'] = float(fields[1])
+            LV[channel]['current_limit'] = float(fields[2])
+        elif header == 'OUTP':
+            if len(fields) == 2: # OUTP CH2,ON
+                LV[int(fields[0][-1])]['output'] = fields[1] in ['ON', '1']
+            else:
+                LV[self.selected]['output'] = fields[0] in ['ON', '1']
+        elif header in ['MEAS:VOLT?', 'MEAS:CURR?', 'MEAS:ALL?']:
+            channel = int(fields[0][-1]) if fields else self.selected
+            volts = LV[channel]['voltage'] if LV[channel]['output'] else 0.0
+            amps = self.bench.LVCurrent(channel)
+            if header == 'MEAS:VOLT?':
+                return '%.4f' % volts
+            if header == 'MEAS:CURR?':
+                return '%.4f' % amps
+            return '%.4f,%.4f,%.4f' % (volts, amps, volts*amps)
+        return None
+
+class SimulatedSerial:
+    # the parts of serial.Serial the drivers use. Each line written (up to TERMINATOR)
+    # is handed to handleLine, and its reply can be read once the device has processed it
+    TERMINATOR = b'\n'
+
+    def __init__(self, bench, latency, port=None, baudrate=9600, timeout=None, **kwargs):
+        self.bench = bench
+        self.latency = latency
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.dtr = True
+        self.is_open = False
+        self.input = b'' # bytes written, not yet a full line
+        self.pending = [] # [ready time, reply bytes] on their way back
+        self.busy_until = time.time()
+        if port is not None: # serial.Serial opens straight away when given a port
+            self.open()
+
+    def open(self):
+        self.bench.sleep(self.latency.per_open)
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, data):
+        self.bench.sleep(self.latency.per_byte * len(data)) # time on the line
+        self.input += data
+        while self.TERMINATOR in self.input:
+            [line, separator, self.input] = self.input.partition(self.TERMINATOR)
+            self.busy_until = max(self.busy_until, time.time()) + self.latency.per_command
+            with self.bench.lock:
+                reply = self.handleLine(line.decode('utf-8'))
+            if reply:
+                ready_time = self.busy_until + self.latency.per_byte * len(reply)
+                self.pending.append([ready_time, bytes(reply, 'utf-8')])
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        # drops what has arrived, replies still on their way arrive later
+        now = time.time()
+        self.pending = [[ready_time, reply] for [ready_time, reply] in self.pending if ready_time > now]
+
+    @property
+    def in_waiting(self):
+        now = time.time()
+        return sum([len(reply) for [ready_time, reply] in self.pending if ready_time <= now])
+
+    def read(self, size=1):
+        # returns up to size bytes that have arrived, waiting up to timeout for the first
+        data = self.read_until(None, size)
+        return data
+
+    def read_until(self, expected=b'\n', size=None):
+        # like serial.Serial.read_until: stops at expected, size bytes, or timeout
+        deadline = None if self.timeout is None else time.time() + self.timeout
+        data = b''
+        while True:
+            now = time.time()
+            while self.pending and self.pending[0][0] <= now:
+                reply = self.pending[0][1]
+                end = len(reply)
+                if expected is not None and expected in reply:
+                    end = min(end, reply.index(expected) + len(expected))
+                if size is not None:
+                    end = min(end, size - len(data))
+                data += reply[:end]
+                if end < len(reply):
+                    self.pending[0][1] = reply[end:]
+                else:
+                    self.pending.pop(0)
+                if (expected is not None and data.endswith(expected)) or (size is not None and len(data) >= size):
+                    return data
+            if expected is None and data:
+                return data
+            if not(self.pending): # nothing more on its way: times out
+                self.bench.sleep(deadline - now if deadline is not None else 0)
+                return data
+            next_ready = self.pending[0][0]
+            if deadline is not None and next_ready > deadline:
+                self.bench.sleep(deadline - now)
+                return data
+            self.bench.sleep(next_ready - now)
+
+    def readline(self):
+        return self.read_until(b'\n')
+
+class SimulatedHVSerial(SimulatedSerial):
+    # GEN600 on its USB serial port: '\r' terminated commands and replies
+    TERMINATOR = b'\r'
+
+    def handleLine(self, line):
+        HV = self.bench.HV
+        [header, separator, args] = line.strip().partition(' ')
+        header = header.upper()
+        if header == 'IDN?':
+            return self.bench.HV_IDN + '\r'
+        if header == 'RST':
+            HV['output'] = False
+            HV['voltage'] = 0.0
+        elif header == 'PV':
+            HV['voltage'] = float(args)
+        elif header == 'PC':
+            HV['current_limit'] = float(args)
+        elif header == 'OUT':
+            HV['output'] = args.strip().upper() in ['1', 'ON']
+        elif header in ['MV?', 'MC?', 'DVC?']:
+            volts = HV['voltage'] if HV['output'] else 0.0
+            amps = self.bench.HVCurrent()
+            if header == 'MV?':
+                return '%.3f\r' % volts
+            if header == 'MC?':
+                return '%.3f\r' % amps
+            return '%.3f,%.3f,%.3f,%.3f,660.000,0.000\r' % (volts, HV['voltage'], amps, HV['current_limit'])
+        return 'OK\r' # every other GEN command is acknowledged
+
+class SimulatedArduinoSerial(SimulatedSerial):
+    # control board serial port, instructions run by the bench's MockPOWAMFirmware
+
+    def handleLine(self, line):
+        return self.bench.firmware.handleLine(line)
+
+# drivers on simulated transports
+
+class SimulatedMSO5000(MSO5000):
+
+    def __init__(self, bench, wav_format='BYTE', sync_mode='DELAY'):
+        self.bench = bench
+        self.RESOURCE_MANAGER_CLASS = bench.resourceManager
+        MSO5000.__init__(self, 'SIM::MSO5074::INSTR', wav_format, sync_mode)
+
+class SimulatedDP832(DP832):
+
+    def __init__(self, bench, sync_mode='DELAY'):
+        self.bench = bench
+        self.RESOURCE_MANAGER_CLASS = bench.resourceManager
+        DP832.__init__(self, 'SIM::DP832::INSTR', sync_mode)
+
+class SimulatedGENH600(GENH600):
+
+    def __init__(self, bench, persistent_session=False):
+        self.bench = bench
+        self.SERIAL_CLASS = bench.openHVSerial
+        GENH600.__init__(self, 'SIM_HV', persistent_session)
+
+class SimulatedPOWAM_MICRO(POWAM_MICRO):
+
+    def __init__(self, bench, persistent_session=False, framing_probe=False):
+        self.bench = bench
+        self.SERIAL_CLASS = bench.openArduinoSerial
+        POWAM_MICRO.__init__(self, 'SIM_ARDUINO', persistent_session, framing_probe)
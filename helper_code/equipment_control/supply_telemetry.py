@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Background sampler for supply telemetry: polls the GENH600 HV supply (and
+optionally DP832 LV supply channels) at a set period into a timestamped ring
+buffer, so tuning loops can average readings over exactly the window they need
+instead of sleeping and taking one noisy sample.
+
+Columns:
+    'HV_V', 'HV_I', 'HV_P' - HV supply measured voltage [V], current [A], power [W]
+    'LV#_V', 'LV#_I', 'LV#_P' - the same for each DP832 channel # in LV_channels
+
+Usage:
+    with SupplyTelemetrySampler(HV_supply) as telemetry:
+        t0 = time.time()
+        ... change something ...
+        current = telemetry.meanAfter('HV_I', t0 + 1, 0.5) # mean over 1 to 1.5s after t0
+
+The drivers serialise their own I/O, so the main flow can keep using the
+supplies while the sampler runs. That needs the HV supply's persistent session
+(GENH600.openSession): without it every poll would open the port and sleep
+CMD_DELAY while holding it from the main flow. The sampler opens the session
+when it starts if the supply doesn't have one, and closes it again when it stops.
+"""
+
+import time
+import threading
+import numpy as np
+
+class SupplyTelemetrySampler:
+
+    def __init__(self, HV_supply, LV_supply=None, LV_channels=None, period=0.1, buffer_samples=3000):
+        # LV_channels: list of DP832 channels to sample too, eg [1, 2]
+        # period: [s] between samples, as fast as the supplies answer if smaller
+        # buffer_samples: samples kept, oldest dropped first (3000 at 0.1s is 5 minutes)
+        self.HV_supply = HV_supply
+        self.LV_supply = LV_supply
+        self.LV_channels = LV_channels if (LV_supply is not None and LV_channels is not None) else []
+        self.period = period
+        self.columns = ['HV_V', 'HV_I', 'HV_P']
+        for channel in self.LV_channels:
+            self.columns += ['LV' + str(channel) + '_V', 'LV' + str(channel) + '_I', 'LV' + str(channel) + '_P']
+        self.buffer = np.empty((buffer_samples, len(self.columns) + 1)) # column 0 is time.time()
+        self.sample_count = 0 # samples taken since start
+        self.condition = threading.Condition() # guards buffer/sample_count, notified per sample
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.error = None
+        self.opened_session = False # True if start opened the HV supply's session
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        if self.thread is not None:
+            return
+        with self.HV_supply.io_lock:
+            if self.HV_supply.ser is None: # polls need the port kept open, see above
+                self.HV_supply.openSession()
+                self.opened_session = True
+        self.stop_event.clear()
+        self.error = None
+        self.thread = threading.Thread(target=self.__sample_loop__, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        if self.opened_session: # leave the supply as it was
+            with self.HV_supply.io_lock:
+                self.HV_supply.closeSession()
+            self.opened_session = False
+
+    def __sample_loop__(self):
+        next_time = time.time()
+        try:
+            while not(self.stop_event.is_set()):
+                row = self.__take_sample__()
+                with self.condition:
+                    self.buffer[self.sample_count % len(self.buffer)] = row
+                    self.sample_count += 1
+                    self.condition.notify_all()
+                next_time = max(next_time + self.period, time.time())
+                self.stop_event.wait(next_time - time.time())
+        except Exception as error: # hand the error to whoever is waiting on samples
+            with self.condition:
+                self.error = error
+                self.condition.notify_all()
+
+    def __take_sample__(self):
+        # one row: timestamp then every column, time stamped halfway through the readings
+        t_start = time.time()
+        [volts, amps] = self.HV_supply.readVoltageAndCurrent()
+        values = [volts, amps, volts * amps]
+        for channel in self.LV_channels:
+            [volts, amps] = self.LV_supply.readChannelVoltageAndCurrent(channel)
+            values += [volts, amps, volts * amps]
+        return [(t_start + time.time()) / 2] + values
+
+    def getSamples(self, column, start_time=None, end_time=None):
+        # returns [times, values] of column for samples with start_time <= time <= end_time
+        # None means no limit on that side. only samples still in the buffer are returned
+        with self.condition:
+            if self.error is not None:
+                raise Exception('Supply telemetry sampler stopped: ' + str(self.error))
+            count = min(self.sample_count, len(self.buffer))
+            first = self.sample_count - count
+            rows = np.arange(first, self.sample_count) % len(self.buffer) # oldest first
+            data = self.buffer[rows][:, [0, self.columns.index(column) + 1]]
+        keep = np.ones(len(data), dtype=bool)
+        if start_time is not None:
+            keep &= data[:,0] >= start_time
+        if end_time is not None:
+            keep &= data[:,0] <= end_time
+        return [data[keep,0], data[keep,1]]
+
+    def waitUntil(self, end_time, timeout=None):
+        # blocks until a sample newer than end_time exists, so a window ending at
+        # end_time is complete
+        if timeout is None:
+            timeout = max(end_time - time.time(), 0) + 10 * self.period + 5
+        t_start = time.time()
+        with self.condition:
+            while True:
+                if self.error is not None:
+                    raise Exception('Supply telemetry sampler stopped: ' + str(self.error))
+                if self.sample_count > 0 and self.buffer[(self.sample_count - 1) % len(self.buffer), 0] > end_time:
+                    return
+                if self.thread is None:
+                    raise Exception('Supply telemetry sampler is not running.')
+                if time.time() - t_start > timeout:
+                    raise Exception('No supply telemetry sample after ' + str(end_time) + ' within ' + str(timeout) + ' seconds.')
+                self.condition.wait(self.period + 1)
+
+    def windowStats(self, column, start_time, end_time):
+        # returns [mean, variance, trend] of column over the window, trend in units per second
+        # (least squares slope). waits for the window to be complete first
+        self.waitUntil(end_time)
+        [times, values] = self.getSamples(column, start_time, end_time)
+        if len(values) == 0:
+            raise Exception('No ' + column + ' samples between ' + str(start_time) + ' and ' + str(end_time) + \
+                            '. Window shorter than the sample period?')
+        if len(values) > 1:
+            trend = np.polyfit(times - times[0], values, 1)[0]
+        else:
+            trend = 0.0
+        return [np.mean(values), np.var(values), trend]
+
+    def meanAfter(self, column, start_time, window):
+        # mean of column over [start_time, start_time + window], waiting for it if needed
+        return self.windowStats(column, start_time, start_time + window)[0]
+
+    def recentStats(self, column, window):
+        # [mean, variance, trend] over the last window seconds
+        now = time.time()
+        return self.windowStats(column, now - window, now)
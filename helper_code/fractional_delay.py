@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Fractional time delays of one scope channel, many delays per call.
+
+fractional_delay(sig, t_step, delays) returns a (len(delays), len(sig)) array,
+row n being sig delayed by delays[n] (positive shifts right, like
+data_array_time_shift_one_signal), with no Python loop over the delays:
+    'fft' - phase ramp exp(-j2*pi*f*delay) on one FFT of the channel; exact for
+        any delay, the edges are held so the FFT sees no wrap-around step
+    'sinc' - windowed-sinc interpolation filter per delay (taps each side),
+        built for all delays at once; slower than 'fft', but in the time domain,
+        so a bad sample (eg a clipped one) only spreads over taps samples
+Both are band-limited to bandwidth (the scope's analog bandwidth by default):
+content above it is noise or aliasing on a scope capture anyway, and removing
+it keeps the delayed signals from ringing. Row n of each method is the same
+band-limited signal, so comparing rows only sees the delays. Like
+data_array_time_shift_one_signal, the first/last value is held where the
+delayed signal is unknown, so don't trust edge data.
+
+time_shifts_of_signal (helper_functions.py) uses these for its 'fft' and 'sinc'
+methods, so find_deskew_MSE_Ediss_hybrid can search skews with them
+(delay_method); deskew_benchmark.py compares them with linear interpolation.
+"""
+
+import numpy as np
+
+SCOPE_BANDWIDTH = 70e6 # [Hz] MSO5074, the 70 MHz model on the bench; set to your scope's
+
+def fractional_delay(sig, t_step, delays, method='fft', bandwidth=SCOPE_BANDWIDTH, taps=32):
+    # sig: np.ndarray of one channel on a uniform timebase with step t_step [s]
+    # delays: [s] list or np.ndarray, positive shifts right
+    # method: 'fft' or 'sinc', see above; taps only for 'sinc'
+    # bandwidth: [Hz] band limit, None for none (up to the Nyquist frequency)
+    # returns np.ndarray of shape (len(delays), len(sig))
+    if method == 'fft':
+        return fractional_delay_fft(sig, t_step, delays, bandwidth)
+    if method == 'sinc':
+        return fractional_delay_sinc(sig, t_step, delays, bandwidth, taps)
+    raise Exception('Fractional delay method must be \'fft\' or \'sinc\', not ' + str(method) + '.')
+
+def band_limit_response(f, bandwidth):
+    # gain at frequencies f: 1 up to bandwidth, raised cosine to 0 at 1.5*bandwidth
+    if bandwidth is None:
+        return np.ones(len(f))
+    x = np.clip((f - bandwidth) / (0.5 * bandwidth), 0, 1)
+    return 0.5 * (1 + np.cos(np.pi * x))
+
+def fractional_delay_fft(sig, t_step, delays, bandwidth=SCOPE_BANDWIDTH):
+    # fractional_delay's 'fft' method
+    sig = np.asarray(sig, dtype=float)
+    delays = np.atleast_1d(np.asarray(delays, dtype=float))
+    samples = len(sig)
+    # hold the edges for the longest delay plus room for the filter to settle
+    pad = int(np.ceil(np.max(np.abs(delays)) / t_step)) + samples // 4 + 16
+    padded = np.pad(sig, pad, mode='edge')
+    length = len(padded)
+    # a ramp from the first to the last value is delayed exactly on its own, the rest
+        # starts and ends at 0 so the FFT's wrap-around has no step
+    n = np.arange(length)
+    first = padded[0]
+    slope = (padded[-1] - padded[0]) / (length - 1)
+    spectrum = np.fft.rfft(padded - (first + slope * n))
+    f = np.fft.rfftfreq(length, t_step)
+    spectrum = spectrum * band_limit_response(f, bandwidth)
+    if length % 2 == 0:
+        spectrum[-1] = 0 # a delayed Nyquist bin is not real
+    delayed = np.fft.irfft(spectrum[None, :] * np.exp(-2j * np.pi * f[None, :] * delays[:, None]), length, axis=1)
+    n_delayed = n[None, pad:pad + samples] - delays[:, None] / t_step
+    return delayed[:, pad:pad + samples] + first + slope * np.clip(n_delayed, 0, length - 1)
+
+def fractional_delay_sinc(sig, t_step, delays, bandwidth=SCOPE_BANDWIDTH, taps=32):
+    # fractional_delay's 'sinc' method: 2*taps + 1 tap filters, Blackman windowed
+    sig = np.asarray(sig, dtype=float)
+    delays = np.atleast_1d(np.asarray(delays, dtype=float))
+    samples = len(sig)
+    cutoff = 1.0 if bandwidth is None else min(1.0, 2 * bandwidth * t_step) # fraction of the Nyquist frequency
+    delay_points = delays / t_step
+    whole = np.floor(delay_points).astype(int) # delay in whole samples...
+    fraction = delay_points - whole # ...and what is left, 0 to 1
+    m = np.arange(-taps, taps + 1)
+    x = m[None, :] - fraction[:, None] # tap positions relative to the delayed sample
+    window = 0.42 + 0.5 * np.cos(np.pi * x / (taps + 1)) + 0.08 * np.cos(2 * np.pi * x / (taps + 1))
+    kernels = cutoff * np.sinc(cutoff * x) * window
+    kernels = kernels / np.sum(kernels, axis=1)[:, None] # unity gain at DC
+    pad = taps + int(np.max(np.abs(whole))) + 1
+    padded = np.pad(sig, pad, mode='edge')
+    # output n is sum over m of kernels[m] * sig[n - whole - m]
+    start = pad + np.arange(samples)[None, :] - whole[:, None]
+    delayed = np.zeros((len(delays), samples))
+    for tap in range(len(m)): # loop over taps, all delays at once
+        delayed += kernels[:, tap][:, None] * padded[start - m[tap]]
+    return delayed
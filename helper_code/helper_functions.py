@@ -11,6 +11,8 @@ import matplotlib.pyplot as plt
 from scipy.ndimage import gaussian_filter1d
 from scipy import integrate
 from scipy import signal
+from scipy.optimize import minimize_scalar
+from helper_code.fractional_delay import fractional_delay
 
 """
 General scope activation and associated functions:
@@ -19,81 +21,88 @@ General scope activation and associated functions:
 
 def general_scope_activation(scope, probe_attenuations):
     # For general turn-on of the scope
-    scope.run()
-    # turn channels on
-    scope.turnChannelOn(1)
-    scope.turnChannelOn(2)
-    scope.turnChannelOn(3)
-    scope.turnChannelOn(4)
-    set_channel_deskews(scope, 0, 0, 0, 0)
-    # set up trigger on channel 3 (probing the low side gate of vout+)
-    scope_trigger_setup(scope)
-    # set probe attenuations and couplings
-    scope.setAttenuationFactor(1, probe_attenuations[0])
-    scope.setAttenuationFactor(2, probe_attenuations[1])
-    scope.setAttenuationFactor(3, probe_attenuations[2])
-    scope.setAttenuationFactor(4, probe_attenuations[3])
-    set_probe_couplings(scope)
-    # other misc scope setup stuff
-    scope.clearAllMeasItems() # just to reduce clutter
-    scope.setDataAcquisitionType('NORMal')
-    # window probe 3 correctly since it's always on the gate
-    window_probe3(scope)
+    with scope.batch(): # whole setup goes out in a few writes
+        scope.run()
+        # turn channels on
+        scope.turnChannelOn(1)
+        scope.turnChannelOn(2)
+        scope.turnChannelOn(3)
+        scope.turnChannelOn(4)
+        set_channel_deskews(scope, 0, 0, 0, 0)
+        # set up trigger on channel 3 (probing the low side gate of vout+)
+        scope_trigger_setup(scope)
+        # set probe attenuations and couplings
+        scope.setAttenuationFactor(1, probe_attenuations[0])
+        scope.setAttenuationFactor(2, probe_attenuations[1])
+        scope.setAttenuationFactor(3, probe_attenuations[2])
+        scope.setAttenuationFactor(4, probe_attenuations[3])
+        set_probe_couplings(scope)
+        # other misc scope setup stuff
+        scope.clearAllMeasItems() # just to reduce clutter
+        scope.setDataAcquisitionType('NORMal')
+        # window probe 3 correctly since it's always on the gate
+        window_probe3(scope)
     
 def scope_trigger_setup(scope):
-    scope.sendCMD('TRIGger:MODE EDGE') # set trigger to edge mode
-    scope.sendCMD('TRIGger:COUPling DC') # set trigger to DC coupling
-    scope.sendCMD('TRIGger:EDGE:SOURce CHANnel3') # trigger source to channel 3
-    scope.sendCMD('TRIGger:EDGE:SLOPe POSitive') # trigger on rising edge
-    scope.sendCMD('TRIGger:EDGE:LEVel 1') # sets trigger level to 1 Volt
-    scope.setTimeZeroLocation(0)
+    with scope.batch():
+        # only settings that changed since the last call get written
+        scope.setSetting(':TRIGger:MODE', 'EDGE') # set trigger to edge mode
+        scope.setSetting(':TRIGger:COUPling', 'DC') # set trigger to DC coupling
+        scope.setSetting(':TRIGger:EDGE:SOURce', 'CHANnel3') # trigger source to channel 3
+        scope.setSetting(':TRIGger:EDGE:SLOPe', 'POSitive') # trigger on rising edge
+        scope.setSetting(':TRIGger:EDGE:LEVel', 1) # sets trigger level to 1 Volt
+        scope.setTimeZeroLocation(0)
     
 def set_probe_couplings(scope):
-    scope.setCoupling(1, 'AC')
-    scope.setCoupling(2, 'AC')
-    scope.setCoupling(3, 'DC') # channel 3 is gate sig: should be DC coupled
-    scope.setCoupling(4, 'AC')
+    with scope.batch():
+        scope.setCoupling(1, 'AC')
+        scope.setCoupling(2, 'AC')
+        scope.setCoupling(3, 'DC') # channel 3 is gate sig: should be DC coupled
+        scope.setCoupling(4, 'AC')
     
 def set_channel_deskews(scope, ch1_deskew, ch2_deskew, ch3_deskew, ch4_deskew):
-    scope.setChannelDeskew(1, ch1_deskew)
-    scope.setChannelDeskew(2, ch2_deskew)
-    scope.setChannelDeskew(3, ch3_deskew)
-    scope.setChannelDeskew(4, ch4_deskew)
+    with scope.batch():
+        scope.setChannelDeskew(1, ch1_deskew)
+        scope.setChannelDeskew(2, ch2_deskew)
+        scope.setChannelDeskew(3, ch3_deskew)
+        scope.setChannelDeskew(4, ch4_deskew)
     
 def window_probe3(scope):
-    scope.setChannelScale(3, 8) # set Channel 3 to have 8 volts on the screen
-    scope.setChannelZeroLocation(3, -3) # lower channel 3 to fit on screen
+    with scope.batch():
+        scope.setChannelScale(3, 8) # set Channel 3 to have 8 volts on the screen
+        scope.setChannelZeroLocation(3, -3) # lower channel 3 to fit on screen
 
 def window_scope(freq_MHz, v_pp, trap, probe_cdivs, scope):
     # Sets the scope window appropriately based on signal information
     # First, reset some settings the user may have changed in hardware setup
-    scope_trigger_setup(scope)
-    window_probe3(scope)
-    # Second, set scalings to what they should be based on cdiv values
-    freq = freq_MHz * 1e6
-    scope.setTimeScale(1/freq * 3) # shoot for 3 wavelengths on scope
-    probe1_vpp = v_pp / 2 * probe_cdivs[0] # anticipated Vpp we'll probe
-    probe2_vpp = v_pp / 2 * probe_cdivs[1]
-    probe4_vpp = v_pp / 2 * probe_cdivs[2]
-    
-    if trap:
-        trap_buffer_scaling = 1.4 # room beyond nominal Vpp for overshooting
-        scope.setChannelScale(1, round((probe1_vpp * trap_buffer_scaling), 5))
-        scope.setChannelScale(2, round((probe2_vpp * trap_buffer_scaling), 5))
-        scope.setChannelScale(4, round((probe4_vpp * trap_buffer_scaling), 5))
+    with scope.batch(): # all window settings go out in a few writes
+        scope_trigger_setup(scope)
+        window_probe3(scope)
+        # Second, set scalings to what they should be based on cdiv values
+        freq = freq_MHz * 1e6
+        scope.setTimeScale(1/freq * 3) # shoot for 3 wavelengths on scope
+        probe1_vpp = v_pp / 2 * probe_cdivs[0] # anticipated Vpp we'll probe
+        probe2_vpp = v_pp / 2 * probe_cdivs[1]
+        probe4_vpp = v_pp / 2 * probe_cdivs[2]
+    
+        if trap:
+            trap_buffer_scaling = 1.4 # room beyond nominal Vpp for overshooting
+            scope.setChannelScale(1, round((probe1_vpp * trap_buffer_scaling), 5))
+            scope.setChannelScale(2, round((probe2_vpp * trap_buffer_scaling), 5))
+            scope.setChannelScale(4, round((probe4_vpp * trap_buffer_scaling), 5))
         
-        scope.setChannelZeroLocation(1, 0) # for trap, symmetric waveform
-        scope.setChannelZeroLocation(2, 0)
-        scope.setChannelZeroLocation(4, 0)
-    else: # Sinusoidal waveform: average value will be 2/pi times peak
-        sine_buffer_scaling = 1.5 # room beyond nominal Vpp for overshooting
-        scope.setChannelScale(1, round((probe1_vpp * sine_buffer_scaling), 5))
-        scope.setChannelScale(2, round((probe2_vpp * sine_buffer_scaling), 5))
-        scope.setChannelScale(4, round((probe4_vpp * sine_buffer_scaling), 5))
-        # scaling/offset for channel 4 not strictly true but probly good enough
-        scope.setChannelZeroLocation(1, (1/np.pi - 0.5) * probe1_vpp)
-        scope.setChannelZeroLocation(2, (1/np.pi - 0.5) * probe2_vpp)
-        scope.setChannelZeroLocation(4, (1/np.pi - 0.5) * probe4_vpp)
+            scope.setChannelZeroLocation(1, 0) # for trap, symmetric waveform
+            scope.setChannelZeroLocation(2, 0)
+            scope.setChannelZeroLocation(4, 0)
+        else: # Sinusoidal waveform: average value will be 2/pi times peak
+            sine_buffer_scaling = 1.5 # room beyond nominal Vpp for overshooting
+            scope.setChannelScale(1, round((probe1_vpp * sine_buffer_scaling), 5))
+            scope.setChannelScale(2, round((probe2_vpp * sine_buffer_scaling), 5))
+            scope.setChannelScale(4, round((probe4_vpp * sine_buffer_scaling), 5))
+            # scaling/offset for channel 4 not strictly true but probly good enough
+            scope.setChannelZeroLocation(1, (1/np.pi - 0.5) * probe1_vpp)
+            scope.setChannelZeroLocation(2, (1/np.pi - 0.5) * probe2_vpp)
+            scope.setChannelZeroLocation(4, (1/np.pi - 0.5) * probe4_vpp)
         
 """
 Other general activation: LV_supply, arduino, and determining operating condition:
@@ -102,25 +111,22 @@ Other general activation: LV_supply, arduino, and determining operating conditio
     
 def general_LV_supply_activation(LV_supply):
     # For general setup of the LV supply
-    LV_supply.disableMaster()
-    LV_supply.setCH1()
-    LV_supply.setVoltage(12)
-    LV_supply.setCurrent(1.5) # for powering signal chain on power board
-    LV_supply.setCH2()
-    LV_supply.setVoltage(12)
-    LV_supply.setCurrent(2.5) # for powering fans and inductor motors
-    LV_supply.setCH3()
-    LV_supply.setVoltage(5)
-    LV_supply.setCurrent(0) # we're not using channel 3
+    # voltages/currents are only sent if they differ from the last applied values
+    with LV_supply.batch(): # whole setup goes out in one write
+        LV_supply.disableMaster()
+        LV_supply.applyChannel(1, 12, 1.5) # for powering signal chain on power board
+        LV_supply.applyChannel(2, 12, 2.5) # for powering fans and inductor motors
+        LV_supply.applyChannel(3, 5, 0) # we're not using channel 3
 
 def general_arduino_activation(arduino, freq, duty_ref, trap):
     # sets up arduino to run, but doesn't turn gate signals on
-    arduino.disableGateSignals()
-    arduino.setSineFreq(freq*2) # [MHz] twice because of frequency halving in DSP
-    arduino.setSineAmp(5) # just max AD9913 amplitude
-    arduino.setDutyCycleRefValue(duty_ref)
-    if trap: arduino.enableTrapMode()
-    else: arduino.enableSineMode()
+    with arduino.batch(): # one or two frames if the firmware supports them
+        arduino.disableGateSignals()
+        arduino.setSineFreq(freq*2) # [MHz] twice because of frequency halving in DSP
+        arduino.setSineAmp(5) # just max AD9913 amplitude
+        arduino.setDutyCycleRefValue(duty_ref)
+        if trap: arduino.enableTrapMode()
+        else: arduino.enableSineMode()
         
 def arduino_connectivity_check(arduino):
     # checks if the arduino is still connected
@@ -193,8 +199,7 @@ def turn_system_on_minus_fans(HV_supply, LV_supply, arduino, check_power=True):
     # default power checking, but check_HV_power function can override to ignore
     if arduino_connectivity_check(arduino):
         arduino.enableGateSignals()
-        LV_supply.setCH1()
-        LV_supply.enableChannel()
+        LV_supply.enableChannelOutput(1)
         HV_supply.enableMaster()
         time.sleep(0.5) # give fans time to get going and voltage settled
         if check_power:
@@ -206,8 +211,7 @@ def turn_system_on_minus_fans(HV_supply, LV_supply, arduino, check_power=True):
 def turn_system_off_minus_fans(HV_supply, LV_supply, arduino):
     if arduino_connectivity_check(arduino):
         HV_supply.disableMaster()
-        LV_supply.setCH1()
-        LV_supply.disableChannel()
+        LV_supply.disableChannelOutput(1)
         arduino.disableGateSignals()
     else:
         input('Arduino failed connectivity check before turn-on. Press enter to continue or ctrl+c to exit')
@@ -216,8 +220,7 @@ def turn_system_off_minus_fans(HV_supply, LV_supply, arduino):
 def check_HV_power(power_threshold, no_fans, HV_supply, LV_supply, arduino):
     # checks if HV supply is exceeding power_threshold, and gives user option to quit if so
     time.sleep(0.5)
-    volts = HV_supply.readVoltage()
-    amps = HV_supply.readCurrent()
+    [volts, amps] = HV_supply.readVoltageAndCurrent() # one exchange for both
     power = volts*amps
     if power > power_threshold:
         if no_fans:
@@ -240,23 +243,22 @@ Inductor-related functions: calibration, setting inductors, guessing values base
     
 def make_user_calibrate_inductors(LV_supply, arduino):
     input('You will now repeatedly enter the steps for inductor 1 to move until it\'s calibrated at the sharpie mark. Press enter to continue.\n')
-    LV_supply.setCH2()
-    LV_supply.enableChannel()
+    LV_supply.enableChannelOutput(2)
     steps = int(input('Enter number of steps to move inductor 1. Enter 0 when complete: '))
     while steps != 0:
         arduino.calInd(1, steps)
         steps = int(input('Enter number of steps to move inductor 1. Enter 0 when complete.'))
     print('\nThank you for calibrating inductor 1.\n')
-    LV_supply.disableChannel()
+    LV_supply.disableChannelOutput(2)
     
     input('You will now repeatedly enter the steps for inductor 2 to move until it\'s calibrated at the sharpie mark. Press enter to continue.\n')
-    LV_supply.enableChannel()
+    LV_supply.enableChannelOutput(2)
     steps = int(input('Enter number of steps to move inductor 2. Enter 0 when complete: '))
     while steps != 0:
         arduino.calInd(2, steps)
         steps = int(input('Enter number of steps to move inductor 2. Enter 0 when complete.'))
     print('\nThank you for calibrating inductor 2.\n')
-    LV_supply.disableChannel()
+    LV_supply.disableChannelOutput(2)
     
 def set_inductor_positions(LV_supply, arduino, l1_pos, l2_pos, supply_on=False):
     # sets inductor positions based on numbers of steps with current calibration
@@ -290,14 +292,13 @@ def set_inductor_positions(LV_supply, arduino, l1_pos, l2_pos, supply_on=False):
     
     # actually setting the channels
     if not(supply_on):
-        LV_supply.setCH2()
-        LV_supply.enableChannel()
+        LV_supply.enableChannelOutput(2)
     time.sleep(0.5)
     arduino.setIndPos(1, l1_pos)
     arduino.setIndPos(2, l2_pos)
     arduino.waitForInductorsToMove()
     if not(supply_on):
-        LV_supply.disableChannel()
+        LV_supply.disableChannelOutput(2)
     return range_error # so user can decide whether to break the loop above
     
     
@@ -307,14 +308,13 @@ def set_inductor_values(LV_supply, arduino, l1_val, l2_val, supply_on=False):
     # arduino should automatically round out-of-range values to be in-range
     # if supply_on is True, then doesn't modify the LV_supply
     if not(supply_on):
-        LV_supply.setCH2()
-        LV_supply.enableChannel()
+        LV_supply.enableChannelOutput(2)
     time.sleep(0.5)
     arduino.setIndVal(1, l1_val)
     arduino.setIndVal(2, l2_val)
     arduino.waitForInductorsToMove()
     if not(supply_on):
-        LV_supply.disableChannel()
+        LV_supply.disableChannelOutput(2)
     
 def L_guess_trap(freq_MHz, trap_dvdt, cap):
     # Guesses the inductance value to use for a trap, also returns duty cycle
@@ -349,8 +349,7 @@ def inductor_tuning_trap_scope_based(trap_dvdt, probe_cdivs, scope, HV_supply, L
     # Note the indexing is a bit weird because L1 corresponds to Ch2 and vice versa
     
     scope.clearAllMeasItems()
-    LV_supply.setCH2()
-    LV_supply.enableChannel()
+    LV_supply.enableChannelOutput(2)
         # measure_l1_l2_trap_dvdt_errors won't turn on fans anymore so do it here
     
     # Measure initial slope values
@@ -421,20 +420,48 @@ def inductor_tuning_trap_scope_based(trap_dvdt, probe_cdivs, scope, HV_supply, L
     # measure_l1_l2_trap_dvdt_errors won't turn off fans anymore, so do it here
     turn_system_off(HV_supply, LV_supply, arduino)
     
+def capture_averaged(scope, number_of_samples, channels, probe_cdivs=None):
+    # Returns the average of number_of_samples single acquisitions, like captureSingleAveraged
+    # With the scope's acquisition thread running (see scope.runAcquisitionThread), frames are
+    # read from its ring buffer, and each one is processed while the next is still
+    # transferring. Without it, this is just captureSingleAveraged
+    # probe_cdivs: if given, each frame is scaled by scale_scope_data_w_cdivs as it arrives
+        # (channels must then be [1, 2, 3, 4]), so the result is already scaled
+    if not(scope.acquisitionThreadRunning()):
+        scope_data = scope.captureSingleAveraged(number_of_samples, channels)
+        if probe_cdivs is not None:
+            scope_data = scale_scope_data_w_cdivs(scope_data, probe_cdivs)
+        return scope_data
+    columns = [0] + [scope.acquisition_channels.index(channel) + 1 for channel in channels]
+    first = scope.getFrameCount() # only frames captured from now on
+    for index in range(number_of_samples):
+        frame = scope.getFrame(first + index)[:, columns]
+        if probe_cdivs is not None:
+            frame = scale_scope_data_w_cdivs(frame, probe_cdivs)
+        if index == 0:
+            scope_data = frame # time will be the same in all samples, values get summed
+        else:
+            scope_data[:,1:] += frame[:,1:]
+    scope_data[:,1:] = scope_data[:,1:] / number_of_samples # compute average
+    return scope_data
+
 def measure_average_dvdt(scope, channel_index):
     # Returns the average of PSLewrate and NSLewrate for channel_index
-    pslew = abs(scope.queryStatItem("AVERages", "PSLewrate", channel_index))
-    nslew = abs(scope.queryStatItem("AVERages", "NSLewrate", channel_index))
+    items = [["PSLewrate", channel_index], ["NSLewrate", channel_index]]
+    snapshot = scope.queryMeasSnapshot(items, "AVERages") # both in one round trip
+    pslew = abs(snapshot[("PSLewrate", channel_index)])
+    nslew = abs(snapshot[("NSLewrate", channel_index)])
     return (pslew + nslew) / 2
 
 def measure_ch1_ch2_dvdt_w_pause_and_cdiv(scope, probe_cdivs):
     # Returns [ch1_dvdt, ch2_dvdt] with a pause to allow averaging to work well
+    items = [["PSLewrate", 1], ["NSLewrate", 1], ["PSLewrate", 2], ["NSLewrate", 2]]
+    scope.registerMeasSnapshot(items) # turn on measurements if not already on
     scope.resetMeasStats() # restart the averaging
-    measure_average_dvdt(scope, 1) # turn on measurement if not already on
-    measure_average_dvdt(scope, 2)
     time.sleep(3) # wait to allow some averaging to occur
-    ch1_dvdt = measure_average_dvdt(scope, 1) / probe_cdivs[0] # take final measurements
-    ch2_dvdt = measure_average_dvdt(scope, 2) / probe_cdivs[1]
+    snapshot = scope.queryMeasSnapshot(items, "AVERages") # take final measurements, one round trip
+    ch1_dvdt = (abs(snapshot[("PSLewrate", 1)]) + abs(snapshot[("NSLewrate", 1)])) / 2 / probe_cdivs[0]
+    ch2_dvdt = (abs(snapshot[("PSLewrate", 2)]) + abs(snapshot[("NSLewrate", 2)])) / 2 / probe_cdivs[1]
     return [ch1_dvdt, ch2_dvdt]
 
 def measure_l1_l2_trap_dvdt_errors(trap_dvdt, probe_cdivs, scope, HV_supply, LV_supply, arduino):
@@ -520,7 +547,7 @@ def inductor_tuning_sine_corner_find(freq_MHz, scope, HV_supply, LV_supply, ardu
     turn_system_off(HV_supply, LV_supply, arduino)
     
 def measure_vp_vm_periods(scope, fall_time, T):
-    scope_data = scope.readAllChannels()
+    scope_data = scope.captureSingle([1, 2, 3, 4])
     t = scope_data[:,0]
     vp = scope_data[:,1]
     vm = scope_data[:,2]
@@ -553,8 +580,7 @@ def set_half_duty_cycle(scope, LV_supply, arduino, duty_goal, vref_current):
     volts_per_error = 1.5 # adjusts # volts per duty cycle error
     give_up_iterations = 10 # if not met error_tol, gives up after this many tries
     
-    LV_supply.setCH1()
-    LV_supply.enableChannel()
+    LV_supply.enableChannelOutput(1)
     arduino.enableGateSignals()
     duty_current = float(scope.queryMeasItem("PDUTy", 3))*2 # referenced to half period
     error = duty_goal - duty_current
@@ -579,29 +605,33 @@ def set_half_duty_cycle(scope, LV_supply, arduino, duty_goal, vref_current):
     print(' done')
     return vref_current # so caller function knows what duty_vref ended up at
 
-def duty_cycle_tuning_trap(arduino, scope, HV_supply, init_duty_vref):
+def duty_cycle_tuning_trap(arduino, scope, HV_supply, init_duty_vref, telemetry=None):
     # Tunes duty cycle for trap waveform to minimize Vdc supply power
     # start_duty_vref should be about 75% of theoretical D at desired dvdt:
         # Therefore can increment duty_vref up to increase D til ZVS lost
+    # telemetry: optional running SupplyTelemetrySampler. If given, each current is the
+        # mean over the averaging window after the settle time, rather than one reading
         
     print("Tuning duty cycle...\n")
     
     initial_power_exceed_threshold = 1.2 # stops increasing D when this is met
     vref_inc = 0.05 # how much to increment duty_vref by in each iteration
+    settle_time = 1 # [s] allow time for RC duty_vref adjustment
+    averaging_window = 0.5 # [s] current averaged over this after settle_time (telemetry only)
     vref = init_duty_vref
     arduino.setDutyCycleRefValue(vref) # just set in case something has changed
-    time.sleep(1) # allow time for RC duty_vref adjustment
-    supply_currents = [HV_supply.readCurrent()] # keep track of all supply currents
+    supply_currents = [measure_settled_HV_current(HV_supply, telemetry, settle_time, averaging_window)]
     threshold = initial_power_exceed_threshold * supply_currents[0] # [A]
     
     # increase D while measuring current until threshold exceeded or gate signal lost
     while supply_currents[-1] < threshold: # while we seemingly haven't lost ZVS
         vref += vref_inc
         arduino.setDutyCycleRefValue(vref)
-        time.sleep(1) # allow time for RC duty_vref adjustment
+        t_set = time.time()
+        time.sleep(settle_time)
         if not(gate_signal_exists(scope)): # lost gate signal, stop increasing D
             break
-        supply_currents.append(HV_supply.readCurrent()) # add newest current value
+        supply_currents.append(measure_settled_HV_current(HV_supply, telemetry, 0, averaging_window, t_set + settle_time))
     
     # set duty cycle to whatever value gave minimum current (minimum power)
     min_current_index = np.argmin(supply_currents)
@@ -611,6 +641,17 @@ def duty_cycle_tuning_trap(arduino, scope, HV_supply, init_duty_vref):
     print("Duty cycle tuning complete\n")
     return final_duty_vref
 
+def measure_settled_HV_current(HV_supply, telemetry, settle_time, averaging_window, start_time=None):
+    # HV supply current once settled: one reading after sleeping settle_time, or with
+    # telemetry the mean over averaging_window starting settle_time after now
+    # start_time: when the window starts instead, if the settle time has already been waited out
+    if telemetry is None:
+        time.sleep(settle_time)
+        return HV_supply.readCurrent()
+    if start_time is None:
+        start_time = time.time() + settle_time
+    return telemetry.meanAfter('HV_I', start_time, averaging_window)
+
 def duty_cycle_tuning_sine(arduino, scope, init_duty_vref):
     # Tunes the duty cycle for sine waves, just trying to make it as big
         # as possible to minimize reverse diode conduction
@@ -681,21 +722,44 @@ def data_array_time_shift_one_signal(data_array, t_col, d_col, shift):
     # note: to preserve # of points we just copy the first or last value in
         # the data as it shifts away from the edge, so don't trust edge data
     
-    t = data_array[:,t_col]
-    t_new = t + shift # new timebase for signal
-    d = data_array[:,d_col]
-    d_new = np.zeros(len(d)) # new data array that corresponds to OLD timebase
-    for index in range(len(t)):
-        t_val = t[index]
-        if t_val < t_new[0]: # signal shifted right: unknown at early times
-            d_new[index] = d[0] # just copy first value as necessary
-        elif t_val > t_new[-1]: # signal shifted left: unknown later
-            d_new[index] = d[-1] # just cpoy last value as necessary
-        else:
-            d_new[index] = np.interp(t_val, t_new, d) # interpolate value linearly
-    data_array[:,d_col] = d_new
+    time_shift_signal_into(data_array[:,t_col], data_array[:,d_col], shift, data_array[:,d_col])
     return data_array
 
+def time_shift_signal_into(t, d, shift, out):
+    # d shifted by shift (positive shifts right) on timebase t, written into out
+    # out: np.ndarray the size of d the caller keeps around (can be d itself),
+        # eg one buffer reused for every skew of a deskew search
+    # same edge handling as data_array_time_shift_one_signal: the first or last
+        # value of d is held where the shifted signal is unknown
+    np.copyto(out, np.interp(t, t + shift, d)) # np.interp holds d[0]/d[-1] outside t + shift
+    return out
+
+def time_shifts_of_signal(t, d, shifts, indices=None, method='linear'):
+    # d shifted by every shift in shifts (np.ndarray) on timebase t, without a loop over shifts
+    # indices: np.ndarray of the sample indices wanted (eg a deskew window), None for all
+    # method: 'linear' or fractional_delay's 'fft' or 'sinc' (band-limited to the scope
+        # bandwidth, t must be uniform)
+    # returns np.ndarray (len(shifts), len(indices)): for 'linear' row n is exactly
+        # np.interp(t, t + shifts[n], d)[indices], ie time_shift_signal_into for shifts[n]
+    if indices is None:
+        indices = np.arange(len(t))
+    if method != 'linear':
+        return fractional_delay(d, t[1] - t[0], shifts, method)[:, indices]
+    x = t[indices][None, :] # times the shifted signals are wanted at
+    shifts = shifts[:, None]
+    last = len(t) - 1
+    # bracket like np.interp on t + shift: j is the last shifted point at or before x, -1 if none
+    j = np.clip(np.searchsorted(t, x - shifts, side='right') - 1, -1, last)
+    j = j - ((j >= 0) & (t[np.maximum(j, 0)] + shifts > x)) # fix rounding of x - shift
+    j = j + ((j < last) & (t[np.minimum(j + 1, last)] + shifts <= x))
+    jc = np.clip(j, 0, last - 1)
+    t_before = t[jc] + shifts # same values as (t + shift)[jc]
+    slope = (d[jc + 1] - d[jc]) / ((t[jc + 1] + shifts) - t_before)
+    shifted = slope * (x - t_before) + d[jc]
+    shifted = np.where(t_before == x, d[jc], shifted)
+    shifted = np.where(j >= last, d[-1], shifted) # held at the edges
+    return np.where(j < 0, d[0], shifted)
+
 def gaussian_average_specifying_stdev_time(sig, t_res, t_stdev):
     # takes in sig as np.array and does gaussian averaging with t_stdev deviation
     # t_res is the time step associated with the data
@@ -790,6 +854,17 @@ def MSE(vector1, vector2):
     # calculates mean square error between two vectors of the same length
     return np.square(np.subtract(vector1, vector2)).mean()
 
+def skew_sweep_MSE(t, sig, ref, skews, istart, istop, delay_method='linear'):
+    # MSE(sig shifted by skew, ref) over [istart:istop] for every skew, as np.ndarray
+    # same values as shifting with data_array_time_shift_one_signal one skew at a time,
+        # but only the window is shifted, all skews at once
+    # delay_method: time_shifts_of_signal's method
+    # [istart:istop] is a slice like the one-at-a-time loop took, so a negative istart
+        # gives no samples (and a nan MSE for every skew) rather than wrapping around
+    window = np.arange(len(t))[istart:istop]
+    shifted = time_shifts_of_signal(t, sig, skews, window, delay_method)
+    return np.square(np.subtract(shifted, ref[None, window])).mean(axis=1)
+
 def find_deskew_for_min_MSE(scope_data_og, freq, trap_dvdt):
     # Takes in:
         # scope data as a np.ndarray, returns [ch1_deskew, ch2_deskew]
@@ -882,10 +957,16 @@ def find_deskew_for_min_MSE(scope_data_og, freq, trap_dvdt):
     # ignore below; now positive because all deskewing happening in code
     # negative becuase the scope skew polarity is reversed
     
-def find_deskew_MSE_Ediss_hybrid(scope_data_og, freq, trap_dvdt, cref):
+def find_deskew_MSE_Ediss_hybrid(scope_data_og, freq, trap_dvdt, cref, ch1_search='grid', delay_method='linear',
+                                 info=None):
     # takes in:
         # scope_data - scope traces as np.ndarray, returns [ch1_deskew, ch2_deskew]
         # freq in Hz, trap_dvdt as fraction of 1/4 wavelength, cref in F
+        # ch1_search - 'grid' to try every skew step for vout+, 'bounded' to refine a
+            # coarse grid with a bounded scalar minimization (find_ch1_skew_bounded)
+        # delay_method - how the searches shift a channel, see time_shifts_of_signal
+        # info - optional dict, gets 'Ediss evaluations': how many vout+ skews Ediss was
+            # calculated for
     # Minimizes MSE for vout- channel 2 since its ringing should line up with vref well
     # Then sweeps through skews for vout+ to minimize Ediss
     # possible improvement over the purely MSE-based deskewing process
@@ -926,20 +1007,9 @@ def find_deskew_MSE_Ediss_hybrid(scope_data_og, freq, trap_dvdt, cref):
     istop1 = t0_index + round(period_points)
     
     # choose channel 2 skew based on MSE minimization over entire period
-    ch2_skew_mse = []
     skew_points = np.arange(-skew_range, skew_range + skew_step/2, skew_step)
         # skew_step/2 to ensure that +skew_range is included
-    for skew_val in skew_points:
-        # shift channel 2
-        current_data = scope_data.copy() # reset to the original data without any skew
-        current_data = data_array_time_shift_one_signal(current_data, 0, 2, skew_val)
-        ch2_data = current_data[:,2]
-        ch4_data = current_data[:,4]
-        
-        ch2_data = ch2_data[istart1:istop1]
-        ch4_data = ch4_data[istart1:istop1]
-        # calculate and store mean square error
-        ch2_skew_mse.append(MSE(ch2_data, ch4_data))
+    ch2_skew_mse = skew_sweep_MSE(t, scope_data[:,2], scope_data[:,4], skew_points, istart1, istop1, delay_method)
     # find the skew that minimizes MSE for channel 2 (vout-), implement that deskewing
     ch2_min_index = np.argmin(ch2_skew_mse)
     ch2_skew = skew_points[ch2_min_index] # positive because no longer letting scope deskew
@@ -951,15 +1021,18 @@ def find_deskew_MSE_Ediss_hybrid(scope_data_og, freq, trap_dvdt, cref):
     scope_data[:,4] = scope_data[:,4] * ch4_norm
     
     # now find the skew for channel 1 that minimizes Ediss for ideal capacitor
-    ch1_skew_Ediss = []
-    for skew_val in skew_points:
-        current_data = scope_data.copy()
-        current_data = data_array_time_shift_one_signal(current_data, 0, 1, skew_val)
-        current_Ediss = calculate_Ediss_trap(current_data, freq, trap_dvdt, cref)
-        ch1_skew_Ediss.append(abs(current_Ediss)) # want minimum absolute energy level
-        
-    ch1_min_index = np.argmin(ch1_skew_Ediss)
-    ch1_skew = skew_points[ch1_min_index] # positive because no longer letting scope deskew
+    if ch1_search == 'bounded':
+        [ch1_skew, evaluations] = find_ch1_skew_bounded(scope_data, freq, trap_dvdt, cref, skew_range,
+                                                        fine_step=skew_step, delay_method=delay_method)
+    else:
+        ch1_skew_Ediss = np.abs(calculate_Ediss_trap_for_ch1_skews(scope_data, freq, trap_dvdt, cref, skew_points,
+                                                                   delay_method))
+            # want minimum absolute energy level
+        ch1_min_index = np.argmin(ch1_skew_Ediss)
+        ch1_skew = skew_points[ch1_min_index] # positive because no longer letting scope deskew
+        evaluations = len(skew_points)
+    if info is not None:
+        info['Ediss evaluations'] = evaluations
     scope_data = data_array_time_shift_one_signal(scope_data, 0, 1, ch1_skew)
     
     """
@@ -973,6 +1046,140 @@ def find_deskew_MSE_Ediss_hybrid(scope_data_og, freq, trap_dvdt, cref):
     
     return [ch1_skew, ch2_skew]
     
+def find_ch1_skew_bounded(scope_data, freq, trap_dvdt, cref, skew_range, coarse_step=1e-9, tolerance=10e-12,
+                          fine_step=0.1e-9, delay_method='linear'):
+    # skew [s] for channel 1 (vout+) within +/- skew_range that minimizes |Ediss| of an
+        # ideal capacitor capture, returns [ch1_skew, number of Ediss evaluations]
+    # |Ediss| normally falls to one minimum and rises after it, so instead of every
+        # fine_step [s] a coarse_step grid brackets the minimum between the neighbours of
+        # its best point and a bounded Brent search refines it to tolerance [s]
+    # if the coarse |Ediss| isn't like that, the bracket could miss the minimum, so the
+        # search is redone from a fine_step grid
+    coarse_points = np.linspace(-skew_range, skew_range, int(round(2*skew_range/coarse_step)) + 1)
+    coarse_Ediss = np.abs(calculate_Ediss_trap_for_ch1_skews(scope_data, freq, trap_dvdt, cref, coarse_points,
+                                                             delay_method))
+    best_index = np.argmin(coarse_Ediss)
+    unimodal = np.all(np.diff(coarse_Ediss[:best_index + 1]) < 0) and np.all(np.diff(coarse_Ediss[best_index:]) > 0)
+    if not(unimodal) and coarse_step > fine_step:
+        [ch1_skew, evaluations] = find_ch1_skew_bounded(scope_data, freq, trap_dvdt, cref, skew_range, fine_step,
+                                                        tolerance, fine_step, delay_method)
+        return [ch1_skew, len(coarse_points) + evaluations]
+    bounds = (coarse_points[max(best_index - 1, 0)], coarse_points[min(best_index + 1, len(coarse_points) - 1)])
+    result = minimize_scalar(
+        lambda skew: abs(calculate_Ediss_trap_for_ch1_skews(scope_data, freq, trap_dvdt, cref, np.array([skew]),
+                                                            delay_method)[0]),
+        bounds = bounds, method = 'bounded', options = {'xatol': tolerance})
+    return [float(result.x), len(coarse_points) + result.nfev]
+
+def find_deskew_xcorr(scope_data_og, freq, trap_dvdt, interpolation='parabolic'):
+    # Takes in:
+        # scope data as a np.ndarray, returns [ch1_deskew, ch2_deskew]
+        # freq in Hz, trap_dvdt as fraction of a quarter wavelength slope should last
+        # interpolation: 'parabolic' or 'sinc', for the correlation peak between samples
+    # Aligns vout+ and vout- with vref by cross-correlation over the same rising/falling
+    # edge windows as find_deskew_for_min_MSE: every whole-sample lag comes from one FFT,
+    # then the correlation peak is interpolated, so the deskew isn't limited to a skew grid
+    # data is in the format [t, ch1/vout+, ch2/vout-, ch3/vgate, ch4/vref]
+    
+    scope_data = scope_data_og.copy()
+    
+    # normalize the waveforms for comparison
+    scope_data[:,1] = scope_data[:,1] / np.average([abs(x) for x in scope_data[:,1]])
+    scope_data[:,2] = scope_data[:,2] / np.average([abs(x) for x in scope_data[:,2]])
+    scope_data[:,4] = scope_data[:,4] / np.average([abs(x) for x in scope_data[:,4]])
+    
+    # parameters:
+    skew_range = 5e-9 # +/- range to skew vout+ and vout- by to find best alignment
+    # parameters to not edit:
+    t_res = scope_data[1, 0] - scope_data[0, 0]
+    period_points = (1 / freq) / t_res # don't round for better math
+    half_period_points = round(period_points / 2)
+    half_slope_points = round((period_points / 4 * trap_dvdt) / 2) # points in half trap slope
+    max_lag = int(np.ceil(skew_range / t_res)) # lags searched, in samples
+    
+    # use smoothed ch1 to find zero-crossing
+    scope_smooth = scope_data.copy() # to leave scope data alone
+    scope_smooth[:,1] = gaussian_average_specifying_stdev_time(
+        sig = scope_smooth[:,1], t_res = t_res,
+        t_stdev = 1e-9) # smooth channel 1 for t0 search: using 1 ns stdev
+    scope_smooth = data_array_set_t0_at_value_crossing(
+        scope_smooth, 0, 1, 0, True, 6) # find middle of first rising slope
+    scope_data[:,0] = scope_smooth[:,0] # set t0 in the actual data
+    t = scope_data[:,0]
+    t0_index = np.argmax(t >= 0) # index of t=0 point in dataset
+    
+    # correlation window includes only rising/falling slopes, as find_deskew_for_min_MSE
+    istart1 = t0_index - half_slope_points - 1
+    istop1 = t0_index + half_slope_points + 1
+    istart2 = istart1 + half_period_points
+    istop2 = istop1 + half_period_points
+    window = np.zeros(len(t))
+    window[istart1:istop1+1] = 1
+    window[istart2:istop2+1] = 1
+    
+    # vout+ is compared half a period later to line up with vref
+    ch1_data = data_array_time_shift_one_signal(scope_data.copy(), 0, 1, -0.5/freq)[:,1]
+    ch1_lag = xcorr_peak_lag(ch1_data, scope_data[:,4], window, max_lag, interpolation)
+    ch2_lag = xcorr_peak_lag(scope_data[:,2], scope_data[:,4], window, max_lag, interpolation)
+    return [ch1_lag * t_res, ch2_lag * t_res] # positive shifts right, as the other deskews
+
+def xcorr_peak_lag(sig, ref, window, max_lag, interpolation='parabolic'):
+    # lag [samples, fractional] within +/- max_lag that sig has to be shifted right by to
+    # best match ref where window is 1, from the peak of the normalized cross-correlation
+        # sum(window*ref*sig_shifted) / sqrt(sum(window*ref^2) * sum(window*sig_shifted^2))
+    # interpolation: 'parabolic' fits the peak and its 2 neighbors, 'sinc' interpolates
+        # the correlation (band-limited, like the signals) on a 1/100 sample grid first
+    length = 2**int(np.ceil(np.log2(len(sig) + max_lag + 1))) # zero padded: no wrap-around
+    sig_spectrum = np.conj(np.fft.rfft(sig, length))
+    cross = np.fft.irfft(np.fft.rfft(window * ref, length) * sig_spectrum, length)
+        # cross[k] = sum(window*ref*sig shifted right by k), negative k at the end
+    energy = np.fft.irfft(np.fft.rfft(window, length) * np.conj(np.fft.rfft(sig**2, length)), length)
+        # energy[k] = sum(window*(sig shifted right by k)^2)
+    ref_energy = np.sum(window * ref**2)
+    lags = np.arange(-max_lag, max_lag + 1)
+    correlation = cross[lags] / np.sqrt(np.maximum(energy[lags], 1e-300) * ref_energy)
+    peak = np.argmax(correlation)
+    if peak == 0 or peak == len(lags) - 1: # at the end of the search range
+        return float(lags[peak])
+    if interpolation == 'sinc':
+        taps = 16 # correlation values used each side of the peak
+        near = lags[peak] + np.arange(-taps, taps + 1)
+        fine = lags[peak] + np.linspace(-1, 1, 201)
+        x = fine[:, None] - near[None, :] # Blackman windowed sinc, as fractional_delay_sinc
+        kernel = np.sinc(x) * (0.42 + 0.5*np.cos(np.pi*x/(taps + 1)) + 0.08*np.cos(2*np.pi*x/(taps + 1)))
+        kernel = kernel / np.sum(kernel, axis=1)[:, None] # unity gain at DC
+        correlation = (kernel @ cross[near]) / np.sqrt(np.maximum(kernel @ energy[near], 1e-300) * ref_energy)
+        lags = fine
+        peak = np.argmax(correlation)
+        if peak == 0 or peak == len(lags) - 1:
+            return float(lags[peak])
+    elif interpolation != 'parabolic':
+        raise Exception('xcorr interpolation must be \'parabolic\' or \'sinc\', not ' + str(interpolation) + '.')
+    [before, at, after] = correlation[peak - 1 : peak + 2]
+    step = lags[1] - lags[0]
+    return float(lags[peak] + step * 0.5 * (before - after) / (before - 2*at + after))
+
+DESKEW_STRATEGIES = ['mse', 'hybrid', 'hybrid_bounded', 'xcorr']
+
+def find_deskew(scope_data, freq, trap_dvdt, cref, strategy='hybrid', info=None):
+    # [ch1_deskew, ch2_deskew] for a Cideal trap capture by the chosen strategy:
+        # 'mse' - find_deskew_for_min_MSE: both channels by MSE over the edges on a skew grid
+        # 'hybrid' - find_deskew_MSE_Ediss_hybrid: vout- by MSE, vout+ by minimum |Ediss|
+        # 'hybrid_bounded' - as 'hybrid', but vout+ from a coarse grid refined to 10 ps
+            # by bounded scalar minimization (fewer Ediss evaluations, finer skew)
+        # 'xcorr' - find_deskew_xcorr: both channels by cross-correlation over the edges
+    # freq in Hz, trap_dvdt as fraction of 1/4 wavelength, cref in F
+    # info: optional dict the 'hybrid' strategies put their Ediss evaluation count in
+    if strategy == 'mse':
+        return find_deskew_for_min_MSE(scope_data, freq, trap_dvdt)
+    if strategy == 'hybrid':
+        return find_deskew_MSE_Ediss_hybrid(scope_data, freq, trap_dvdt, cref, info=info)
+    if strategy == 'hybrid_bounded':
+        return find_deskew_MSE_Ediss_hybrid(scope_data, freq, trap_dvdt, cref, 'bounded', info=info)
+    if strategy == 'xcorr':
+        return find_deskew_xcorr(scope_data, freq, trap_dvdt)
+    raise Exception('Unknown deskew strategy ' + str(strategy) + ', use one of ' + str(DESKEW_STRATEGIES) + '.')
+    
 """
 Calculating Ediss for trap/sine given saved scope data:
 -------------------------------------------------------------------------------
@@ -996,42 +1203,19 @@ def calculate_Ediss_trap(scope_data_og, freq, trap_dvdt, cref):
     
     scope_data = scope_data_og.copy() # leave scope_data_og alone
     
-    # general parameters we'll need
-    t_res = scope_data[1,0] - scope_data[0,0]
-    period = 1/freq
-    period_points_float = (1 / freq) / t_res # not rounded for better math
-    half_slope_points = round((period_points_float / 4 * trap_dvdt) / 2) # points in half trap slope
-    
-    # set the t=0 point using smoothed version of channel 1:
-        # (better chance of slope center point that way)
-    scope_smooth = scope_data.copy() # to leave scope data alone
-    scope_smooth[:,1] = gaussian_average_specifying_stdev_time(
-        sig = scope_smooth[:,1], t_res = t_res,
-        t_stdev = 1e-9) # smooth channel 1 in scope_smooth dataset
-    scope_smooth = data_array_set_t0_at_value_crossing(
-        scope_smooth, 0, 1, 0, True, 6) # find middle of first rising slope
-    scope_data[:,0] = scope_smooth[:,0] # set t0 in the actual data
+    # set the t=0 point using smoothed version of channel 1 (better chance of slope center
+        # point that way), and find the zeroing and integration windows from it
+    [t0, t0_index, edges, zeroing, search_end] = Ediss_trap_windows(
+        scope_data[:,0], scope_data[:,1][None, :], freq, trap_dvdt)
+    scope_data[:,0] = scope_data[:,0] - t0[0] # set t0 in the actual data
     t = scope_data[:,0]
-    t0_index = np.argmax(t >= 0) # index of t=0 point in dataset
+    edges = edges[:, :, 0] # [[istart1, istop1], [istart2, istop2]]
     
     # zero the vout+, vout-, and vref signals correctly
-    vout_plus_zeroing_start = period * (3/4 - (1/4)*(2/5))
-    vout_plus_zeroing_stop = period * (3/4 + (1/4)*(2/5))
-    vout_minus_zeroing_start = period * (1/4 - (1/4)*(2/5))
-    vout_minus_zeroing_stop = period * (1/4 + (1/4)*(2/5))
-    
-    vout_plus = vector_zero_ac_sig_to_trange_avg(
-        t = t, sig = scope_data[:,1],
-        tstart = vout_plus_zeroing_start, # should be in flat if dvdt < 1/4 wavelength
-        tend = vout_plus_zeroing_stop)
-    vout_minus = vector_zero_ac_sig_to_trange_avg(
-        t = t, sig = scope_data[:,2],
-        tstart = vout_minus_zeroing_start, # should be in flat if dvdt < 1/4 wavelength
-        tend = vout_minus_zeroing_stop)
-    vref = vector_zero_ac_sig_to_trange_avg( # vref has same zeroing window as vout+
-        t = t, sig = scope_data[:,4],
-        tstart = vout_plus_zeroing_start, # should be in flat if dvdt < 1/4 wavelength
-        tend = vout_plus_zeroing_stop)
+        # (in the flats if dvdt < 1/4 wavelength, vref has same zeroing window as vout+)
+    vout_plus = scope_data[:,1] - np.average(scope_data[zeroing[0][0, 0]:zeroing[0][1, 0] + 1, 1])
+    vout_minus = scope_data[:,2] - np.average(scope_data[zeroing[1][0, 0]:zeroing[1][1, 0] + 1, 2])
+    vref = scope_data[:,4] - np.average(scope_data[zeroing[0][0, 0]:zeroing[0][1, 0] + 1, 4])
     
     # determine signals relevant for integration
     vst = vout_plus - vout_minus
@@ -1040,28 +1224,13 @@ def calculate_Ediss_trap(scope_data_og, freq, trap_dvdt, cref):
     qoss = vcref*cref
     qoss = qoss - min(qoss) # zero so it's referenced to DUT not Cref
     
-    # determine QV integration bounds (eg start/stop of rising and falling edges)
-    buffer = 3 # number of extra points to include due to dvdt imperfections
-    istart1 = t0_index - half_slope_points - buffer
-    istop1 = t0_index + half_slope_points + buffer
-    istart2 = t0_index + round(period_points_float/2) - half_slope_points - buffer
-    istop2 = t0_index + round(period_points_float/2) + half_slope_points + buffer
-    
-    # perform integration
-    vdut1 = vdut[istart1:istop1]
-    vdut2 = vdut[istart2:istop2]
-    vdut_int = np.concatenate([vdut1, vdut2])
+    # perform integration over the rising and falling edges
+    vdut_int = np.concatenate([vdut[edges[0][0]:edges[0][1]], vdut[edges[1][0]:edges[1][1]]])
+    qoss_int = np.concatenate([qoss[edges[0][0]:edges[0][1]], qoss[edges[1][0]:edges[1][1]]])
+    t_int = np.concatenate([t[edges[0][0]:edges[0][1]], t[edges[1][0]:edges[1][1]]])
     
-    qoss1 = qoss[istart1:istop1]
-    qoss2 = qoss[istart2:istop2]
-    qoss_int = np.concatenate([qoss1, qoss2])
-    
-    t1 = t[istart1:istop1]
-    t2 = t[istart2:istop2]
-    t_int = np.concatenate([t1, t2])
-    
-    Ediss = np.trapz(y=vdut_int, x=qoss_int)
-    Ediss_cum = integrate.cumtrapz(y=vdut_int, x=qoss_int)
+    Ediss = integrate.trapezoid(y=vdut_int, x=qoss_int)
+    Ediss_cum = integrate.cumulative_trapezoid(y=vdut_int, x=qoss_int)
     
     """
     Optional plotting:
@@ -1081,12 +1250,12 @@ def calculate_Ediss_trap(scope_data_og, freq, trap_dvdt, cref):
     ax2.plot(t, vout_plus, label='vout+')
     ax2.plot(t, vout_minus, label='vout-')
     ax2.plot(t, vref, label='vref')
-    ax2.plot(np.array([1,1])*t[istart1], np.array([fig2_max, fig2_min]), 'r')
-    ax2.plot(np.array([1,1])*t[istop1], np.array([fig2_max, fig2_min]), 'r')
-    ax2.plot(np.array([1,1])*t[istart2], np.array([fig2_max, fig2_min]), 'r')
-    ax2.plot(np.array([1,1])*t[istop2], np.array([fig2_max, fig2_min]), 'r')
-    ax2.plot(np.array([vout_plus_zeroing_start, vout_plus_zeroing_stop]), np.array([-5, -5]), 'b')
-    ax2.plot(np.array([vout_minus_zeroing_start, vout_minus_zeroing_stop]), np.array([-5, -5]), 'b')
+    ax2.plot(np.array([1,1])*t[edges[0][0]], np.array([fig2_max, fig2_min]), 'r')
+    ax2.plot(np.array([1,1])*t[edges[0][-1]], np.array([fig2_max, fig2_min]), 'r')
+    ax2.plot(np.array([1,1])*t[edges[1][0]], np.array([fig2_max, fig2_min]), 'r')
+    ax2.plot(np.array([1,1])*t[edges[1][-1]], np.array([fig2_max, fig2_min]), 'r')
+    ax2.plot(t[zeroing[0][:, 0]], np.array([-5, -5]), 'b')
+    ax2.plot(t[zeroing[1][:, 0]], np.array([-5, -5]), 'b')
     ax2.legend()
     
     # sawyer tower voltage, dut voltage, cref voltage. Red markers for intetration
@@ -1096,10 +1265,10 @@ def calculate_Ediss_trap(scope_data_og, freq, trap_dvdt, cref):
     ax3.plot(t, vst, label = 'vst')
     ax3.plot(t, vdut, label = 'vdut')
     ax3.plot(t, vcref, label = 'vcref')
-    ax3.plot(np.array([1,1])*t[istart1], np.array([fig3_max, fig3_min]), 'r')
-    ax3.plot(np.array([1,1])*t[istop1], np.array([fig3_max, fig3_min]), 'r')
-    ax3.plot(np.array([1,1])*t[istart2], np.array([fig3_max, fig3_min]), 'r')
-    ax3.plot(np.array([1,1])*t[istop2], np.array([fig3_max, fig3_min]), 'r')
+    ax3.plot(np.array([1,1])*t[edges[0][0]], np.array([fig3_max, fig3_min]), 'r')
+    ax3.plot(np.array([1,1])*t[edges[0][-1]], np.array([fig3_max, fig3_min]), 'r')
+    ax3.plot(np.array([1,1])*t[edges[1][0]], np.array([fig3_max, fig3_min]), 'r')
+    ax3.plot(np.array([1,1])*t[edges[1][-1]], np.array([fig3_max, fig3_min]), 'r')
     ax3.legend()
     
     # Cumulative Eoss over an integration period
@@ -1116,6 +1285,143 @@ def calculate_Ediss_trap(scope_data_og, freq, trap_dvdt, cref):
     
     return Ediss
 
+def Ediss_trap_windows(t, vout_plus, freq, trap_dvdt):
+    # t=0 point and windows calculate_Ediss_trap uses, for each row of vout_plus (2-D
+        # np.ndarray of vout+ traces on timebase t, or only their first samples, see search_end)
+    # t=0 is the first rising zero crossing of vout+ smoothed with a 1 ns stdev, found as
+        # data_array_set_t0_at_value_crossing(scope_smooth, 0, 1, 0, True, 6) finds it
+    # returns [t0, t0_index, edges, zeroing, search_end], one value per trace in each:
+        # t0 [s] - time of the crossing on t, so the trace's own timebase is t - t0
+        # t0_index - first index at or after t=0
+        # edges - [rising edge window, falling edge window], each [start, stop] for a slice
+            # [start:stop]; like any slice, a negative start or a stop past the end doesn't
+            # give the whole window (eg a crossing in the first few samples)
+        # zeroing - [vout+/vref window, vout- window], each [start, stop] indices (stop
+            # included) as vector_zero_ac_sig_to_trange_avg picks them
+        # search_end - last index the crossing search needed (the crossing, or the last
+            # sample if there was none): smoothing only the first samples of a trace gives
+            # the same values as smoothing all of it up to a few samples before the last
+    t_res = t[1] - t[0]
+    period = 1/freq
+    period_points_float = (1 / freq) / t_res # not rounded for better math
+    half_slope_points = round((period_points_float / 4 * trap_dvdt) / 2) # points in half trap slope
+    
+    # first rising zero crossing of the smoothed traces, as data_array_set_t0_at_value_crossing
+    smooth = gaussian_average_specifying_stdev_time(
+        sig = vout_plus, t_res = t_res, t_stdev = 1e-9) # smooths each row
+    rows = np.arange(len(vout_plus))
+    columns = np.arange(vout_plus.shape[1])[None, :]
+    ignore_before_index = np.argmax(smooth < 0, axis=1) + 6 # jostle buffer
+    after_ignore = (smooth > 0) & (columns >= ignore_before_index[:, None]) & (columns < vout_plus.shape[1] - 1)
+    found = np.any(after_ignore, axis=1)
+    zero_index = np.where(found, np.argmax(after_ignore, axis=1), ignore_before_index)
+    search_end = np.where(found, zero_index, vout_plus.shape[1] - 1)
+    d_near_cross = [smooth[rows, zero_index - 1], smooth[rows, zero_index]]
+    t_near_cross = [t[zero_index - 1], t[zero_index]]
+    with np.errstate(divide='ignore', invalid='ignore'): # np.interp between the 2 points
+        t0 = (t_near_cross[1] - t_near_cross[0]) / (d_near_cross[1] - d_near_cross[0]) * \
+            (0 - d_near_cross[0]) + t_near_cross[0]
+    # np.interp's ends, in its order (they only come up if there's no rising crossing)
+    t0 = np.where(d_near_cross[0] == 0, t_near_cross[0], t0)
+    t0 = np.where(d_near_cross[1] == 0, t_near_cross[1], t0)
+    t0 = np.where(d_near_cross[0] > 0, t_near_cross[0], t0)
+    t0 = np.where(d_near_cross[1] < 0, t_near_cross[1], t0)
+    t0_index = index_past_time(t, t0, 0, inclusive=True)
+    
+    # zeroing windows: in the flats if dvdt < 1/4 wavelength
+    zeroing = []
+    for center in [3/4, 1/4]: # vout+ (and vref), vout-
+        zeroing.append(np.array([index_past_time(t, t0, period * (center - (1/4)*(2/5))) - 1,
+                                 index_past_time(t, t0, period * (center + (1/4)*(2/5))) - 1]))
+    
+    # integration windows: rising and falling edges
+    buffer = 3 # number of extra points to include due to dvdt imperfections
+    istart1 = t0_index - half_slope_points - buffer
+    istop1 = t0_index + half_slope_points + buffer
+    edges = np.array([[istart1, istop1], [istart1 + round(period_points_float/2), istop1 + round(period_points_float/2)]])
+    return [t0, t0_index, edges, zeroing, search_end]
+
+def index_past_time(t, t0, time, inclusive=False):
+    # for each t0 (np.ndarray), the first index where t - t0 > time (>= if inclusive), 0 if
+        # there is none: np.argmax(t - t0 > time) without making t - t0 for every t0
+    last = len(t) - 1
+    past = (lambda j: t[j] - t0 >= time) if inclusive else (lambda j: t[j] - t0 > time)
+    j = np.searchsorted(t, t0 + time, 'left' if inclusive else 'right')
+    j = j - ((j > 0) & past(np.clip(j - 1, 0, last))) # fix rounding of t0 + time
+    j = j + ((j <= last) & ~past(np.clip(j, 0, last)))
+    return np.where(j <= last, j, 0)
+
+def calculate_Ediss_trap_for_ch1_skews(scope_data, freq, trap_dvdt, cref, skews, delay_method='linear'):
+    # calculate_Ediss_trap of scope_data with channel 1 (vout+) shifted by each skew in
+        # skews (np.ndarray), returned as np.ndarray: same values as shifting and calling
+        # calculate_Ediss_trap one skew at a time (delay_method: time_shifts_of_signal's method)
+    # channel 1 is only shifted where it's needed, all skews at once: from the start of the
+        # capture to the t=0 crossing, then over the zeroing and integration windows
+    # skews whose windows don't all fit in the capture (eg a crossing in the first few
+        # samples) are passed to calculate_Ediss_trap one at a time, for its slicing
+    
+    t = scope_data[:,0]
+    
+    # t=0 for every skew, shifting more of the capture if the crossing search needs it
+    t_stdev_points = 1e-9 / (t[1] - t[0])
+    margin = int(np.ceil(4 * t_stdev_points)) + 2 # end samples smoothed differently from the whole trace
+    [t0, t0_index, edges, zeroing, search_end] = Ediss_trap_windows(
+        t, scope_data[:,1][None, :], freq, trap_dvdt) # unshifted, to guess how far to search
+    search_stop = min(len(t), search_end[0] + int(np.ceil(np.max(np.abs(skews)) / (t[1] - t[0]))) + 2*margin)
+    while True:
+        vout_plus_start = time_shifts_of_signal(t, scope_data[:,1], skews, np.arange(search_stop), delay_method)
+        [t0, t0_index, edges, zeroing, search_end] = Ediss_trap_windows(t, vout_plus_start, freq, trap_dvdt)
+        if search_stop == len(t) or np.all(search_end < search_stop - margin):
+            break
+        search_stop = min(len(t), 2*search_stop)
+    
+    # skews whose windows are all inside the capture, the rest one at a time
+    inside = np.all(edges[:, 0] >= 0, axis=0) & np.all(edges[:, 1] <= len(t), axis=0)
+    for window in zeroing:
+        inside = inside & (window[0] >= 0) & (window[1] < len(t))
+    Ediss = np.zeros(len(skews))
+    for n in np.flatnonzero(~inside):
+        shifted = scope_data.copy()
+        shifted[:,1] = time_shifts_of_signal(t, scope_data[:,1], skews[n:n + 1], method=delay_method)[0]
+        Ediss[n] = calculate_Ediss_trap(shifted, freq, trap_dvdt, cref)
+    if not(np.any(inside)):
+        return Ediss
+    skews = skews[inside]
+    edges = edges[:, :, inside]
+    zeroing = [window[:, inside] for window in zeroing]
+    rows = np.arange(len(skews))[:, None]
+    integration = np.concatenate([edges[0][0][:, None] + np.arange(edges[0][1][0] - edges[0][0][0])[None, :],
+                                  edges[1][0][:, None] + np.arange(edges[1][1][0] - edges[1][0][0])[None, :]], axis=1)
+    
+    # shifted channel 1 over the zeroing and integration windows of all skews
+    first = min(np.min(integration), np.min(zeroing[0]))
+    needed = np.arange(first, max(np.max(integration), np.max(zeroing[0])) + 1)
+    vout_plus = time_shifts_of_signal(t, scope_data[:,1], skews, needed, delay_method)
+    
+    # zeroing averages: few distinct windows across skews
+    averages = []
+    for [sig, [start_index, end_index]] in [[vout_plus, zeroing[0]], [scope_data[:,2], zeroing[1]],
+                                            [scope_data[:,4], zeroing[0]]]:
+        average = np.zeros(len(skews))
+        for [start, end] in np.unique(np.column_stack([start_index, end_index]), axis=0):
+            same_window = (start_index == start) & (end_index == end)
+            if sig.ndim == 1:
+                average[same_window] = np.average(sig[start:end + 1])
+            else:
+                average[same_window] = np.average(sig[same_window, start - first:end - first + 1], axis=1)
+        averages.append(average[:, None])
+    
+    # qoss is zeroed to its minimum over the whole capture
+    vout_minus = scope_data[:,2][None, :] - averages[1]
+    vref = scope_data[:,4][None, :] - averages[2]
+    qoss = (vref - vout_minus)*cref
+    qoss_min = np.min(qoss, axis=1)[:, None]
+    
+    vdut_int = (vout_plus[rows, integration - first] - averages[0]) - vref[rows, integration]
+    qoss_int = qoss[rows, integration] - qoss_min
+    Ediss[inside] = integrate.trapezoid(y=vdut_int, x=qoss_int, axis=1)
+    return Ediss
+
 """
 File read/write stuff:
 -------------------------------------------------------------------------------
@@ -10,12 +10,15 @@ Used for running both trap and sine operating points alone and in sweeps
 """
 
 import os
+import asyncio
 import numpy as np
 from helper_code.helper_functions import *
+from helper_code.equipment_control.supply_telemetry import SupplyTelemetrySampler
+from helper_code.equipment_control.async_equipment import make_async_devices, run_on_devices, run_coroutine
 
 def run_operating_points_Cideal(freq, v_pp, trap, trap_dvdt, probe_cdivs, cref, cideal,
                            run_doc_folder, run_comments, operating_condition,
-                           scope, HV_supply, LV_supply, arduino):
+                           scope, HV_supply, LV_supply, arduino, deskew_strategy='hybrid'):
     # Runs the operating point(s) with Cideal in place for loss calibration:
         # verifies that this run name doesn't exist already, errors if not to avoid overwrite
         # writes the summary file with user comments
@@ -32,6 +35,7 @@ def run_operating_points_Cideal(freq, v_pp, trap, trap_dvdt, probe_cdivs, cref,
             file.write(run_comments + '\n')
             file.write('Trapezoid run with sweep type: ' + print_sweep_type(operating_condition) + '\n')
             file.write('Trap dVdt [fraction of quarter-wavelength]: ' + str(trap_dvdt) + '\n')
+            file.write('Deskew strategy: ' + deskew_strategy + '\n')
         else:
             file.write('Sinusoid run with sweep type: ' + print_sweep_type(operating_condition) + '\n')
         file.write('Frequency [MHz]: ' + str(freq) + '\n')
@@ -52,7 +56,7 @@ def run_operating_points_Cideal(freq, v_pp, trap, trap_dvdt, probe_cdivs, cref,
             run_operating_point_Cideal_trap(freq, v_pp, trap_dvdt, probe_cdivs, cref, c_trap,
                                        Cideal_folder + 'single_operating_point.txt',
                                        Cideal_folder + 'single_operating_point.csv',
-                                       scope, HV_supply, LV_supply, arduino)
+                                       scope, HV_supply, LV_supply, arduino, deskew_strategy)
         else:
             run_operating_point_Cideal_sine(freq, v_pp, probe_cdivs, cref, c_sine,
                                         Cideal_folder + 'single_operating_point.txt',
@@ -64,7 +68,7 @@ def run_operating_points_Cideal(freq, v_pp, trap, trap_dvdt, probe_cdivs, cref,
                 run_operating_point_Cideal_trap(f, v_pp, trap_dvdt, probe_cdivs, cref, c_trap,
                                            Cideal_folder + 'freq_' + str(f) + 'MHz.txt',
                                            Cideal_folder + 'freq_' + str(f) + 'MHz.csv',
-                                           scope, HV_supply, LV_supply, arduino)
+                                           scope, HV_supply, LV_supply, arduino, deskew_strategy)
         else:
             for f in freq:
                 run_operating_point_Cideal_sine(f, v_pp, probe_cdivs, cref, c_sine,
@@ -77,7 +81,7 @@ def run_operating_points_Cideal(freq, v_pp, trap, trap_dvdt, probe_cdivs, cref,
                 run_operating_point_Cideal_trap(freq, v, trap_dvdt, probe_cdivs, cref, c_trap,
                                            Cideal_folder + 'v_pp_' + str(v) + 'V.txt',
                                            Cideal_folder + 'v_pp_' + str(v) + 'V.csv',
-                                           scope, HV_supply, LV_supply, arduino)
+                                           scope, HV_supply, LV_supply, arduino, deskew_strategy)
         else:
             for v in v_pp:
                 run_operating_point_Cideal_sine(freq, v, probe_cdivs, cref, c_sine,
@@ -89,7 +93,7 @@ def run_operating_points_Cideal(freq, v_pp, trap, trap_dvdt, probe_cdivs, cref,
             run_operating_point_Cideal_trap(freq, v_pp, d, probe_cdivs, cref, c_trap,
                                        Cideal_folder + 'trap_dvdt_' + str(d) + '.txt',
                                        Cideal_folder + 'trap_dvdt_' + str(d) + '.csv',
-                                       scope, HV_supply, LV_supply, arduino)
+                                       scope, HV_supply, LV_supply, arduino, deskew_strategy)
             
 def run_operating_points_DUT(freq, v_pp, trap, trap_dvdt, probe_cdivs, cref,
                              run_doc_folder, operating_condition,
@@ -169,30 +173,62 @@ def check_if_run_doc_dir_exists(run_doc_folder):
         if os.path.isdir(run_doc_folder):
             raise Exception('Run terminated to avoid overwriting previous run with the same name. Rename the run and try again.\n')    
 
+async def setup_operating_point_async(freq, v_pp, trap, probe_cdivs, duty_vref, l1, l2, l_positions,
+                                      scope, HV_supply, LV_supply, arduino, zero_deskews=True):
+    # Sets up everything at the start of an operating point, the scope alongside the rest:
+        # scope: window for the waveform, then zero channel deskews if zero_deskews
+        # LV supply, then the HV supply voltage for trap (v_pp/2) or sine (v_pp/2/pi)
+            # alongside inductors followed by the arduino, as HV was set right after
+            # the LV supply before and neither of those waits on it
+    # so setup takes as long as the slowest of these rather than their sum
+    # the scope only watches, so windowing it can't change what the supplies see
+    # l1, l2 are inductor positions if l_positions, else inductor values [uH]
+    [scope_a, HV_a, LV_a, arduino_a] = make_async_devices(scope, HV_supply, LV_supply, arduino)
+    HV_voltage = v_pp/2 if trap else v_pp/2/np.pi # resonant sine bump is pi times DC voltage
+    set_inductors = set_inductor_positions if l_positions else set_inductor_values
+    
+    async def scope_setup():
+        await run_on_devices([scope_a], window_scope, freq, v_pp, trap, probe_cdivs, scope)
+        if zero_deskews:
+            await run_on_devices([scope_a], set_channel_deskews, scope, 0, 0, 0, 0)
+        
+    async def inductors_arduino_setup():
+        await run_on_devices([LV_a, arduino_a], set_inductors, LV_supply, arduino, l1, l2)
+        await run_on_devices([arduino_a], general_arduino_activation, arduino, freq, duty_vref, trap)
+        
+    async def supplies_inductors_arduino_setup():
+        await run_on_devices([LV_a], general_LV_supply_activation, LV_supply)
+        await asyncio.gather(HV_a.setVoltage(HV_voltage), inductors_arduino_setup())
+        
+    await asyncio.gather(scope_setup(), supplies_inductors_arduino_setup())
+    
+def setup_operating_point(freq, v_pp, trap, probe_cdivs, duty_vref, l1, l2, l_positions,
+                          scope, HV_supply, LV_supply, arduino, zero_deskews=True):
+    # blocking call to setup_operating_point_async, for the operating point functions below
+    run_coroutine(setup_operating_point_async(freq, v_pp, trap, probe_cdivs, duty_vref, l1, l2, l_positions,
+                                              scope, HV_supply, LV_supply, arduino, zero_deskews))
+    
 def run_operating_point_Cideal_trap(freq, v_pp, trap_dvdt, probe_cdivs, cref, c_trap,
-                                    op_point_file, data_save_file, scope, HV_supply, LV_supply, arduino):
+                                    op_point_file, data_save_file, scope, HV_supply, LV_supply, arduino,
+                                    deskew_strategy='hybrid'):
     # Runs a Cideal trapezoidal operating point:
         # Guesses initial inductor values based on c_trap resonant node capacitance estimate
         # Guesses initial duty_vref based on dvdt (conservatively to avoid losing ZVS):
             # set duty cycle by just measuring it to avoid frequency-dependence
         # tune inductors to hit desired dvdt
         # tune duty cycle to minimize energy
-        # tune deskew to minimize energy
+        # tune deskew to minimize energy, by deskew_strategy (see find_deskew)
         # store operating conditions in operating point file for DUT reference
     print('Running Cideal operating point:\n  ' + str(freq) + ' Mhz' + \
           '\n  ' + str(v_pp) + ' Vpp' + \
           '\n  ' + str(trap_dvdt) + ' trap_dvdt')
         
-    window_scope(freq, v_pp, True, probe_cdivs, scope) # set scope window up
-    set_channel_deskews(scope, 0, 0, 0, 0) # reset channel deskews to zero
-    general_LV_supply_activation(LV_supply)
-    HV_supply.setVoltage(v_pp/2)
-    
     # set up initial inductor positions and duty cycle using formula guess
     [Lguess, duty] = L_guess_trap(freq, trap_dvdt, c_trap)
-    set_inductor_values(LV_supply, arduino, Lguess, Lguess)
     initial_duty_vref = 2.5
-    general_arduino_activation(arduino, freq, initial_duty_vref, True)
+    # window scope and zero deskews while setting supplies, inductors and arduino
+    setup_operating_point(freq, v_pp, True, probe_cdivs, initial_duty_vref, Lguess, Lguess, False,
+                          scope, HV_supply, LV_supply, arduino)
     duty_vref_rough = set_half_duty_cycle(scope, LV_supply, arduino, duty*0.75, initial_duty_vref)
         # smaller duty cycle to avoid losing ZVS: initial Lguess is just rough
     
@@ -206,20 +242,20 @@ def run_operating_point_Cideal_trap(freq, v_pp, trap_dvdt, probe_cdivs, cref, c_
     
     # duty cycle tuning - minimizing energy seems to improve waveform quality
     turn_system_on(HV_supply, LV_supply, arduino)
-    duty_vref_final = duty_cycle_tuning_trap(arduino, scope, HV_supply, duty_vref_rough)
+    with SupplyTelemetrySampler(HV_supply) as telemetry: # averaged supply current per duty step
+        duty_vref_final = duty_cycle_tuning_trap(arduino, scope, HV_supply, duty_vref_rough, telemetry)
     
     # read the waveform (which has now been somewhat optimized with Cideal)
     print('Reading channels for skew calculation...')
-    time.sleep(5) # for AC channels to settle out I guess
-    scope_data = scope.readAllChannelsAveraged(5)
+    with scope.runAcquisitionThread([1, 2, 3, 4]): # thread start-up overlaps the settling
+        time.sleep(5) # for AC channels to settle out I guess
+        scope_data = capture_averaged(scope, 5, [1, 2, 3, 4], probe_cdivs) # cdiv scaled per frame
     print(' done')
     turn_system_off(HV_supply, LV_supply, arduino)
     
-    # Deskew vout+ and vout- relative to vref by minimizing mean square error
-    scope_data = scale_scope_data_w_cdivs(scope_data, probe_cdivs) # scale traces by cdiv
-    # [ch1_deskew, ch2_deskew] = find_deskew_for_min_MSE(scope_data, freq*1e6, trap_dvdt)
-    [ch1_deskew, ch2_deskew] = find_deskew_MSE_Ediss_hybrid(
-        scope_data, freq*1e6, trap_dvdt, cref*1e-12)
+    # Deskew vout+ and vout- relative to vref ('mse', 'hybrid', 'hybrid_bounded' or 'xcorr', see find_deskew)
+    [ch1_deskew, ch2_deskew] = find_deskew(
+        scope_data, freq*1e6, trap_dvdt, cref*1e-12, deskew_strategy)
     
     Ediss = calculate_Ediss_trap(scope_data, freq*1e6, trap_dvdt, cref*1e-12) # may as well calculate
     
@@ -252,18 +288,15 @@ def run_operating_point_Cideal_sine(freq, v_pp, probe_cdivs, cref, c_sine,
     print('Running Cideal operating point:\n  ' + str(freq) + ' Mhz' + \
           '\n  ' + str(v_pp) + ' Vpp')
         
-    window_scope(freq, v_pp, False, probe_cdivs, scope) # set scope window up
-    set_channel_deskews(scope, 0, 0, 0, 0) # reset channel deskews to zero
-    general_LV_supply_activation(LV_supply)
-    HV_supply.setVoltage(v_pp/2/np.pi) # since resonant bump will be pi times DC voltage
-    
     # set up initial inductor positions
     Lguess = L_guess_sine(freq, c_sine)
-    set_inductor_values(LV_supply, arduino, Lguess, Lguess)
+    initial_duty_vref = 2.5
+    # window scope and zero deskews while setting supplies, inductors and arduino
+    # (HV voltage is v_pp/2/pi since resonant bump will be pi times DC voltage)
+    setup_operating_point(freq, v_pp, False, probe_cdivs, initial_duty_vref, Lguess, Lguess, False,
+                          scope, HV_supply, LV_supply, arduino)
     
     # set duty cycle to be large, hopefully over 40%
-    initial_duty_vref = 2.5
-    general_arduino_activation(arduino, freq, initial_duty_vref, False)
     [duty_vref_final, duty_cycle] = duty_cycle_tuning_sine(arduino, scope, init_duty_vref)
     
     # fine-tune the inductors to get a good sine wave approximation
@@ -275,13 +308,13 @@ def run_operating_point_Cideal_sine(freq, v_pp, probe_cdivs, cref, c_sine,
     # read the waveform (which has now been somewhat optimized with Cideal)
     turn_system_on(HV_supply, LV_supply, arduino)
     print('Reading channels for skew calculation...')
-    time.sleep(5) # for AC channels to settle out I guess
-    scope_data = scope.readAllChannelsAveraged(5)
+    with scope.runAcquisitionThread([1, 2, 3, 4]): # thread start-up overlaps the settling
+        time.sleep(5) # for AC channels to settle out I guess
+        scope_data = capture_averaged(scope, 5, [1, 2, 3, 4], probe_cdivs) # cdiv scaled per frame
     print(' done')
     turn_system_off(HV_supply, LV_supply, arduino)
     
     # Deskew vout+ and vout- relative to vref by minimizing mean square error
-    scope_data = scale_scope_data_w_cdivs(scope_data, probe_cdivs) # scale traces by cdiv
     # [ch1_deskew, ch2_deskew] = find_deskew_for_min_MSE(scope_data, freq*1e6, trap_dvdt)
     """
     No need to calculate deskewing for sine since we don't use it anyway, so do this instead:
@@ -327,10 +360,6 @@ def run_operating_point_DUT_trap(freq, v_pp, trap_dvdt, probe_cdivs, cref,
          '\n  ' + str(v_pp) + ' Vpp' + \
          '\n  ' + str(trap_dvdt) + ' trap_dvdt')
    
-   window_scope(freq, v_pp, True, probe_cdivs, scope) # set scope window
-   general_LV_supply_activation(LV_supply)
-   HV_supply.setVoltage(v_pp/2)
-   
    # read values from cideal file
    [l1_pos_cideal, l2_pos_cideal, duty_vref_cideal,
         ch1_deskew_cideal, ch2_deskew_cideal, a, b, c, d] = read_colon_file(cideal_file)
@@ -341,8 +370,9 @@ def run_operating_point_DUT_trap(freq, v_pp, trap_dvdt, probe_cdivs, cref,
    ch2_deskew_cideal = float(ch2_deskew_cideal)
    
    # conservatively set duty cycle for ZVS, also set cideal L-vals and skews
-   set_inductor_positions(LV_supply, arduino, l1_pos_cideal, l2_pos_cideal)
-   general_arduino_activation(arduino, freq, duty_vref_cideal, True)
+   # window scope while setting supplies, cideal inductors and arduino
+   setup_operating_point(freq, v_pp, True, probe_cdivs, duty_vref_cideal, l1_pos_cideal, l2_pos_cideal, True,
+                         scope, HV_supply, LV_supply, arduino, zero_deskews=False)
    [Lguess_wrong, duty] = L_guess_trap(freq, trap_dvdt, 1e-12)
    duty_vref_rough = set_half_duty_cycle(scope, LV_supply, arduino, duty*0.75, duty_vref_cideal)
    set_channel_deskews(scope, 0, 0, 0, 0) # don't deskew on scope; 500ps minimum skew interval
@@ -357,17 +387,18 @@ def run_operating_point_DUT_trap(freq, v_pp, trap_dvdt, probe_cdivs, cref,
    
    # duty cycle tuning - minimizing energy seems to improve waveform quality
    turn_system_on(HV_supply, LV_supply, arduino)
-   duty_vref_final = duty_cycle_tuning_trap(arduino, scope, HV_supply, duty_vref_rough)
+   with SupplyTelemetrySampler(HV_supply) as telemetry: # averaged supply current per duty step
+       duty_vref_final = duty_cycle_tuning_trap(arduino, scope, HV_supply, duty_vref_rough, telemetry)
    
    # read the waveform (which has now been somewhat optimized with Cideal)
    print('Reading channels for Ediss calculation...')
-   time.sleep(5) # for AC channels to settle out I guess
-   scope_data = scope.readAllChannelsAveraged(5)
+   with scope.runAcquisitionThread([1, 2, 3, 4]): # thread start-up overlaps the settling
+      time.sleep(5) # for AC channels to settle out I guess
+      scope_data = capture_averaged(scope, 5, [1, 2, 3, 4], probe_cdivs) # cdiv scaled per frame
    print(' done')
    turn_system_off(HV_supply, LV_supply, arduino)
    
    # Calculate Ediss
-   scope_data = scale_scope_data_w_cdivs(scope_data, probe_cdivs) # cdiv scaling
    scope_data_deskewed = scope_data.copy() # to leave scope_data alone during saving
    scope_data_deskewed = data_array_time_shift_one_signal(
        scope_data_deskewed, 0, 1, ch1_deskew_cideal)
@@ -406,10 +437,6 @@ def run_operating_point_DUT_sine(freq, v_pp, probe_cdivs, cref,
    print('Running DUT operating point:\n  ' + str(freq) + ' Mhz' + \
          '\n  ' + str(v_pp) + ' Vpp')
    
-   window_scope(freq, v_pp, False, probe_cdivs, scope) # set scope window
-   general_LV_supply_activation(LV_supply)
-   HV_supply.setVoltage(v_pp/2/np.pi)
-   
    # read values from cideal file
    [l1_pos_cideal, l2_pos_cideal, duty_vref_cideal,
         ch1_deskew_cideal, ch2_deskew_cideal, a, b, c, d] = read_colon_file(cideal_file)
@@ -420,9 +447,9 @@ def run_operating_point_DUT_sine(freq, v_pp, probe_cdivs, cref,
    ch2_deskew_cideal = float(ch2_deskew_cideal)
    
    # conservatively set duty cycle for ZVS, also set cideal L-vals and skews
-   set_inductor_positions(LV_supply, arduino, l1_pos_cideal, l2_pos_cideal)
-   general_arduino_activation(arduino, freq, duty_vref_cideal, False)
-   arduino.setDutyCycleRefValue(duty_vref_cideal)
+   # window scope while setting supplies, cideal inductors and arduino
+   setup_operating_point(freq, v_pp, False, probe_cdivs, duty_vref_cideal, l1_pos_cideal, l2_pos_cideal, True,
+                         scope, HV_supply, LV_supply, arduino, zero_deskews=False)
    set_channel_deskews(scope, 0, 0, 0, 0) # don't deskew on scope; 500ps minimum skew interval
    
    # fine-tune the inductors to get a good sine wave approximation
@@ -434,13 +461,13 @@ def run_operating_point_DUT_sine(freq, v_pp, probe_cdivs, cref,
    # read the waveform (which has now been somewhat optimized with Cideal)
    turn_system_on(HV_supply, LV_supply, arduino)
    print('Reading channels for Ediss calculation...')
-   time.sleep(5) # for AC channels to settle out I guess
-   scope_data = scope.readAllChannelsAveraged(5)
+   with scope.runAcquisitionThread([1, 2, 3, 4]): # thread start-up overlaps the settling
+      time.sleep(5) # for AC channels to settle out I guess
+      scope_data = capture_averaged(scope, 5, [1, 2, 3, 4], probe_cdivs) # cdiv scaled per frame
    print(' done')
    turn_system_off(HV_supply, LV_supply, arduino)
    
    # Calculate Ediss
-   scope_data = scale_scope_data_w_cdivs(scope_data, probe_cdivs) # cdiv scaling
    scope_data_deskewed = scope_data.copy() # to leave scope_data alone during saving
    scope_data_deskewed = data_array_time_shift_one_signal(
        scope_data_deskewed, 0, 1, ch1_deskew_cideal)
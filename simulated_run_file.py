@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Runs user_run_file.py style operating points on the simulated bench
+(helper_code/equipment_control/simulated_equipment.py), no hardware needed.
+
+The same Cideal + DUT run is repeated with the driver options the bench runs have
+picked up over time, and the wall time of each is printed next to the original:
+    original - commands paced by CMD_DELAY, serial ports opened per command
+    + serial sessions - HV supply and arduino keep their serial ports open
+    + OPC sync - scope and LV supply wait on *OPC? instead of CMD_DELAY
+Setting up each operating point runs the instruments concurrently in all of them.
+
+Settling sleeps in the helpers (fans, AC coupling...) are the same in every
+configuration and are there for the hardware, so they are shortened by
+helper_sleep_scale to keep the comparison about instrument time.
+"""
+
+import time
+import tempfile
+import numpy as np
+from helper_code.equipment_control.simulated_equipment import SimulatedBench, SimulatedMSO5000, SimulatedDP832, \
+    SimulatedGENH600, SimulatedPOWAM_MICRO
+from helper_code.equipment_control.sawyer_tower_synthesizer import gan_coss_curve
+import helper_code.helper_functions as helper_functions
+import running_operating_points
+from running_operating_points import *
+
+"""
+-------------------------------------------------------------------------------
+BEGIN USER-DEFINED VARIABLES:
+-------------------------------------------------------------------------------
+"""
+
+freq = 2 # [MHz] output waveform frequency
+v_pp = 450 # [V] Sawyer Tower voltage pp amplitude
+cref = 516 # [pF] Reference capacitor value (under DUT in ST circuit)
+cideal = 204 # [pF] Ideal capacitor used for loss calibrations
+dut_coss = gan_coss_curve(c_zero=500e-12, c_high=100e-12, v_knee=40) # simulated DUT Coss(V) [F]
+dut_hysteresis = 0.02 # simulated DUT loss, see SawyerTowerSynthesizer
+trap = True # True for trapezoidal waveform, False for sinusoidal
+trap_dvdt = 0.5 # Fraction of a quarter-wavelength trap transition should last, or a list to sweep
+deskew_strategy = 'hybrid' # 'mse', 'hybrid', 'hybrid_bounded' or 'xcorr', see find_deskew
+
+latency_scale = 1.0 # 1 for instruments as slow as the defaults in simulated_equipment, 0 for instant
+helper_sleep_scale = 0.1 # settling sleeps in the helpers are shortened by this
+probe_attenuations = [20, 20, 10, 20]
+probe_cdivs = [0.1, 0.1, 0.1] # the simulated bench's probe cdivs
+
+configurations = [ # [name, scope/LV sync_mode, HV/arduino persistent_session]
+    ['original', 'DELAY', False],
+    ['+ serial sessions', 'DELAY', True],
+    ['+ OPC sync', 'OPC', True],
+]
+
+"""
+-------------------------------------------------------------------------------
+END USER-DEFINED VARIABLES
+-------------------------------------------------------------------------------
+"""
+
+class ScaledSleepTime:
+    # stands in for the time module in the helpers, with sleep shortened by scale
+
+    def __init__(self, scale):
+        self.scale = scale
+
+    def sleep(self, seconds):
+        time.sleep(seconds * self.scale)
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+def run_simulated(sync_mode, persistent_session, run_doc_folder):
+    # runs Cideal then DUT operating points on a fresh simulated bench
+    # returns [wall time [s], Ediss values, ground truth Ediss of the last point]
+    bench = SimulatedBench(latency_scale=latency_scale, cref=cref*1e-12, c_dut=cideal*1e-12,
+                           probe_cdivs=probe_cdivs)
+    t_start = time.time()
+    scope = SimulatedMSO5000(bench, sync_mode=sync_mode)
+    HV_supply = SimulatedGENH600(bench, persistent_session=persistent_session)
+    LV_supply = SimulatedDP832(bench, sync_mode=sync_mode)
+    arduino = SimulatedPOWAM_MICRO(bench, persistent_session=persistent_session)
+    general_LV_supply_activation(LV_supply) # inductors start at the calibration marks on the bench
+    general_scope_activation(scope, probe_attenuations)
+    operating_condition = determine_operating_condition(freq, v_pp, trap, trap_dvdt)
+    run_operating_points_Cideal(freq, v_pp, trap, trap_dvdt, probe_cdivs, cref, cideal,
+                                run_doc_folder, 'Simulated run, ' + sync_mode + ' sync, serial sessions: ' + \
+                                str(persistent_session), operating_condition,
+                                scope, HV_supply, LV_supply, arduino, deskew_strategy)
+    bench.installCapacitor(dut_coss, dut_hysteresis) # replace the ideal capacitor with the DUT
+    Ediss_values = run_operating_points_DUT(freq, v_pp, trap, trap_dvdt, probe_cdivs, cref,
+                                            run_doc_folder, operating_condition,
+                                            scope, HV_supply, LV_supply, arduino)
+    wall_time = time.time() - t_start
+    turn_system_on(HV_supply, LV_supply, arduino, check_power=False) # operating point the run ended on
+    bench.updateSynthesizer()
+    ground_truth = bench.synthesizer.groundTruthEdiss()
+    turn_system_off(HV_supply, LV_supply, arduino)
+    return [wall_time, Ediss_values, ground_truth]
+
+helper_functions.time = ScaledSleepTime(helper_sleep_scale)
+running_operating_points.time = helper_functions.time
+plt.switch_backend('Agg') # plots from the deskew search are not needed here
+
+results = []
+with tempfile.TemporaryDirectory() as run_folder:
+    for [name, sync_mode, persistent_session] in configurations:
+        print('\n---- ' + name + ' ----')
+        [wall_time, Ediss_values, ground_truth] = run_simulated(sync_mode, persistent_session,
+                                                                run_folder + '/' + str(len(results)) + '/')
+        plt.close('all')
+        results.append([name, wall_time, Ediss_values, ground_truth])
+
+print('\nconfiguration        wall time [s]  saved vs original [s]  Ediss [nJ]  (last point true Ediss [nJ])')
+for [name, wall_time, Ediss_values, ground_truth] in results:
+    print(name.ljust(21) + str(round(wall_time, 1)).ljust(15) + \
+          str(round(results[0][1] - wall_time, 1)).ljust(23) + str(np.round(np.array(Ediss_values)*1e9, 2)) + \
+          '  (' + str(round(ground_truth*1e9, 2)) + ')')
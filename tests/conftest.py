@@ -0,0 +1,6 @@
+# tests run against the simulated bench (helper_code/equipment_control/simulated_equipment.py)
+# from the repo root, which the scripts import everything relative to
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,44 @@
+# POWAM_MICRO batches against the mock firmware (arduino_coss_mock): frames are only used when asked for
+import pytest
+from helper_code.equipment_control.arduino_coss_communication import POWAM_MICRO
+from helper_code.equipment_control.arduino_coss_mock import MockPOWAMFirmware, make_mock_powam
+
+
+def activate(arduino):
+    # like general_arduino_activation, then an absolute inductor move
+    with arduino.batch():
+        arduino.disableGateSignals()
+        arduino.setSineFreq(4)
+        arduino.setSineAmp(5)
+        arduino.setDutyCycleRefValue(3.5)
+        arduino.enableTrapMode()
+    arduino.setIndPos(1, 500)
+
+
+@pytest.mark.parametrize('framing, persistent_session, framing_probe', [
+    [True, True, True], # frames
+    [False, True, True], # probe, but old firmware
+    [True, True, False], # firmware takes frames, but the host doesn't ask
+    [True, False, True], # no session, so no frames
+])
+def test_batches_leave_the_board_in_the_same_state(framing, persistent_session, framing_probe):
+    [reference, reference_firmware] = make_mock_powam(persistent_session=False, framing=False, framing_probe=False)
+    activate(reference)
+    [arduino, firmware] = make_mock_powam(persistent_session=persistent_session, framing=framing,
+                                          framing_probe=framing_probe)
+    activate(arduino)
+    skip_tests = lambda firmware: [cmd for cmd in firmware.received if cmd != 'z'] # connection tests and probe
+    assert skip_tests(firmware) == skip_tests(reference_firmware)
+    assert [firmware.sine_freq, firmware.duty_ref, arduino.l1_pos] == \
+        [reference_firmware.sine_freq, reference_firmware.duty_ref, reference.l1_pos]
+    assert arduino.framing == (framing and persistent_session and framing_probe)
+    assert (firmware.frames_received > 0) == arduino.framing
+
+
+def test_no_framing_probe_by_default():
+    firmware = MockPOWAMFirmware(framing=True)
+    class MockPOWAM_MICRO(POWAM_MICRO):
+        SERIAL_CLASS = firmware.openSerial
+    arduino = MockPOWAM_MICRO('MOCK', persistent_session=True) # like user_run_file
+    assert firmware.frames_received == 0
+    assert not(arduino.framing)
@@ -0,0 +1,25 @@
+# POWAM_MICRO's stepper model (predictMoveTime) calibrated from timed moves on the mock firmware
+import pytest
+from helper_code.equipment_control.arduino_coss_mock import make_mock_powam
+
+
+def test_motion_model_calibrates_to_the_motor_speed():
+    [arduino, firmware] = make_mock_powam()
+    arduino.MOTION_POLL_MAX_INTERVAL = arduino.MOTION_POLL_INTERVAL # fine timing for the test
+    assert arduino.STEPS_PER_SECOND > firmware.STEPS_PER_SECOND # starting guess errs fast
+    for steps in [100, 200, 300]:
+        arduino.moveInd(1, steps)
+        arduino.waitForInductorsToMove()
+    assert len(arduino.motion_history) == 3 # early predictions: every move was timed
+    assert arduino.STEPS_PER_SECOND == pytest.approx(firmware.STEPS_PER_SECOND, rel=0.1)
+    assert arduino.predictMoveTime(200) == pytest.approx(200 / firmware.STEPS_PER_SECOND, abs=0.05)
+
+
+def test_calibration_needs_moves_of_different_lengths():
+    [arduino, firmware] = make_mock_powam()
+    arduino.motion_history = [[100, 0.25], [100, 0.26], [100, 0.24]]
+    assert not(arduino.calibrateMotion())
+    arduino.motion_history = [[100, 0.30], [200, 0.55], [300, 0.80]]
+    assert arduino.calibrateMotion()
+    assert arduino.STEPS_PER_SECOND == pytest.approx(400)
+    assert arduino.MOTION_START_DELAY == pytest.approx(0.05)
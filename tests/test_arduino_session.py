@@ -0,0 +1,104 @@
+# POWAM_MICRO session mode against the mock firmware (arduino_coss_mock): one port for every command,
+# paced commands with no reply, and what is and isn't resent after a serial error
+import time
+import pytest
+import serial
+from helper_code.equipment_control.arduino_coss_communication import POWAM_MICRO
+from helper_code.equipment_control.arduino_coss_mock import MockPOWAMFirmware, MockSerial
+
+
+class FlakySerial(MockSerial):
+    # a MockSerial whose next write fails if fail_next_write, before the firmware sees it
+    fail_next_write = False
+
+    def write(self, data):
+        if FlakySerial.fail_next_write:
+            FlakySerial.fail_next_write = False
+            raise serial.SerialException('write failed')
+        return MockSerial.write(self, data)
+
+
+def make_session_powam(framing=False, framing_probe=False):
+    # returns [arduino, firmware, ports opened, [time.time(), line] of every line the firmware got]
+    firmware = MockPOWAMFirmware(framing)
+    ports = []
+    lines = []
+    handle_line = firmware.handleLine
+    def timed_handle_line(line):
+        lines.append([time.time(), line])
+        return handle_line(line)
+    firmware.handleLine = timed_handle_line
+    def open_serial(*args, **kwargs):
+        ports.append(FlakySerial(firmware, *args, **kwargs))
+        return ports[-1]
+    class MockPOWAM_MICRO(POWAM_MICRO):
+        SERIAL_CLASS = staticmethod(open_serial)
+    arduino = MockPOWAM_MICRO('MOCK', persistent_session=True, framing_probe=framing_probe)
+    return [arduino, firmware, ports, lines]
+
+
+def test_session_uses_one_port():
+    [arduino, firmware, ports, lines] = make_session_powam()
+    arduino.setSineFreq(4)
+    arduino.setDutyCycleRefValue(3.5)
+    assert arduino.checkAlive()
+    assert len(ports) == 1 and ports[0].is_open
+    assert ports[0].dtr == False # opening the port mustn't reset the board
+    arduino.closeSession()
+    assert not(ports[0].is_open)
+    arduino.setSineAmp(5) # back to a port per command
+    assert len(ports) == 2 and not(ports[1].is_open)
+    assert firmware.received == ['z', 'ax10', 'af4000000', 'i13.5', 'z', 'aa0.005']
+
+
+@pytest.mark.parametrize('framing, framing_probe', [
+    [False, False], # no frames asked for
+    [False, True], # probe, but old firmware
+])
+def test_commands_with_no_reply_are_paced(framing, framing_probe):
+    [arduino, firmware, ports, lines] = make_session_powam(framing, framing_probe)
+    start = len(lines)
+    with arduino.batch(): # goes out a command at a time
+        arduino.disableGateSignals()
+        arduino.setSineFreq(4)
+        arduino.setSineAmp(5)
+        arduino.setDutyCycleRefValue(3.5)
+    arduino.setIndPos(1, 500)
+    assert arduino.queryCMD('w1') == '500\n'
+    assert [line.strip('\'') for [line_time, line] in lines[start:]] == \
+        ['e0', 'ax10', 'af4000000', 'aa0.005', 'i13.5', 'p1500', 'w1', 'w2', 'w1']
+    for [[line_time, line], [next_time, next_line]] in zip(lines[start:-1], lines[start + 1:]):
+        if line.strip('\'')[0] not in ['z', 'r', 'w']: # no reply to say the firmware has read it
+            assert next_time - line_time >= POWAM_MICRO.SESSION_WRITE_GAP
+    assert firmware.frames_received == 0
+
+
+def test_frames_are_not_paced():
+    [arduino, firmware, ports, lines] = make_session_powam(framing=True, framing_probe=True)
+    frames_received = firmware.frames_received # the framing probe
+    start = time.time()
+    for n in range(5):
+        with arduino.batch():
+            arduino.setSineFreq(4)
+            arduino.setDutyCycleRefValue(3.5)
+    assert firmware.frames_received - frames_received == 5
+    assert time.time() - start < 5*POWAM_MICRO.SESSION_WRITE_GAP # acknowledged, so no gap needed
+
+
+def test_absolute_command_resent_after_serial_error():
+    [arduino, firmware, ports, lines] = make_session_powam()
+    FlakySerial.fail_next_write = True
+    arduino.setIndPos(1, 500)
+    assert len(ports) == 2 # reopened
+    assert firmware.received == ['z', 'p1500', 'w1', 'w2']
+
+
+def test_relative_move_not_resent_after_serial_error():
+    [arduino, firmware, ports, lines] = make_session_powam()
+    FlakySerial.fail_next_write = True
+    with pytest.raises(serial.SerialException):
+        arduino.moveInd(1, 100)
+    assert len(ports) == 2 # reopened for the next command
+    assert firmware.received == ['z']
+    arduino.moveInd(1, 100)
+    assert firmware.received == ['z', 'm1100', 'w1', 'w2']
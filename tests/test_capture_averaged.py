@@ -0,0 +1,32 @@
+# capture_averaged with and without the scope's acquisition thread
+import numpy as np
+import pytest
+from helper_code.equipment_control.simulated_equipment import SimulatedBench, SimulatedMSO5000
+from helper_code.helper_functions import capture_averaged, scale_scope_data_w_cdivs
+
+probe_cdivs = [0.1, 0.1, 0.1]
+
+
+def make_scope():
+    bench = SimulatedBench(latency_scale=0, noise=[0, 0, 0, 0])
+    return SimulatedMSO5000(bench, sync_mode='OPC')
+
+
+def test_thread_capture_matches_serial_capture():
+    scope = make_scope()
+    serial = capture_averaged(scope, 3, [1, 2, 3, 4], probe_cdivs)
+    with scope.runAcquisitionThread([1, 2, 3, 4]):
+        threaded = capture_averaged(scope, 3, [1, 2, 3, 4], probe_cdivs)
+        unscaled = capture_averaged(scope, 3, [1, 2, 3, 4])
+    assert not(scope.acquisitionThreadRunning())
+    assert np.allclose(threaded, serial)
+    assert np.allclose(scale_scope_data_w_cdivs(unscaled, probe_cdivs), threaded)
+
+
+def test_thread_stops_when_the_block_raises():
+    scope = make_scope()
+    with pytest.raises(ValueError):
+        with scope.runAcquisitionThread([1, 2]):
+            raise ValueError('processing failed')
+    assert not(scope.acquisitionThreadRunning())
+    assert scope.getTriggerStatus() != 'STOP' # left running
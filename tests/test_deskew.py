@@ -0,0 +1,61 @@
+# find_deskew's Ediss evaluation count and find_ch1_skew_bounded against finer skew grids
+import numpy as np
+import matplotlib
+matplotlib.use('Agg') # find_deskew_MSE_Ediss_hybrid plots
+import matplotlib.pyplot as plt
+import helper_code.helper_functions as helper_functions
+from helper_code.equipment_control.sawyer_tower_synthesizer import SawyerTowerSynthesizer
+from helper_code.helper_functions import find_deskew, find_ch1_skew_bounded, calculate_Ediss_trap_for_ch1_skews, \
+    L_guess_trap, scale_scope_data_w_cdivs
+
+freq = 2e6 # [Hz]
+cref = 516e-12 # [F]
+probe_cdivs = [0.1, 0.1, 0.1]
+tolerance = 10e-12 # [s] find_ch1_skew_bounded's
+
+
+def cideal_capture(trap_dvdt):
+    # [t, ch1, ch2, ch3, ch4] of 3 periods of an ideal capacitor, skewed and AC coupled
+    synthesizer = SawyerTowerSynthesizer(cref, 204e-12, 0, probe_cdivs=probe_cdivs,
+                                         channel_skews=[0.5e-9, -0.3e-9, 0, 0.2e-9], seed=1)
+    synthesizer.setOperatingPoint(freq, 225, 0.5, 1e-6, 1e-6)
+    [L, duty] = L_guess_trap(freq/1e6, trap_dvdt, synthesizer.node_capacitance*1e12)
+    synthesizer.setOperatingPoint(freq, 225, duty, L*1e-6, L*1e-6)
+    t = (np.arange(1000) - 500) * (3/freq/1000)
+    data = np.column_stack([t, np.mean(synthesizer.frames(t, 3), axis=0).T])
+    for column in [1, 2, 4]: # AC coupled
+        data[:, column] -= np.mean(data[:, column])
+    return scale_scope_data_w_cdivs(data, probe_cdivs)
+
+
+def test_hybrid_strategies_report_their_Ediss_evaluations(capsys):
+    data = cideal_capture(0.5)
+    grid_info = {}
+    bounded_info = {}
+    grid_deskews = find_deskew(data, freq, 0.5, cref, 'hybrid', grid_info)
+    bounded_deskews = find_deskew(data, freq, 0.5, cref, 'hybrid_bounded', bounded_info)
+    plt.close('all')
+    assert grid_info == {'Ediss evaluations': 101}
+    assert bounded_info['Ediss evaluations'] < 101
+    assert bounded_deskews[1] == grid_deskews[1] # same vout- search
+    assert capsys.readouterr().out == ''
+
+
+def test_bounded_search_finds_the_fine_grid_minimum():
+    for trap_dvdt in [0.3, 0.5, 0.7]:
+        data = cideal_capture(trap_dvdt)
+        [skew, evaluations] = find_ch1_skew_bounded(data, freq, trap_dvdt, cref, 5e-9)
+        fine_skews = np.arange(-5e-9, 5e-9 + tolerance/2, tolerance)
+        fine_Ediss = np.abs(calculate_Ediss_trap_for_ch1_skews(data, freq, trap_dvdt, cref, fine_skews))
+        assert abs(skew - fine_skews[np.argmin(fine_Ediss)]) <= tolerance
+        assert evaluations < 101
+
+
+def test_bounded_search_falls_back_to_the_fine_grid(monkeypatch):
+    # |Ediss| with its minimum at 0.35 ns, and a dip at 3 ns the coarse grid sees as lower
+    def Ediss_with_a_dip(scope_data, freq, trap_dvdt, cref, skews, delay_method='linear'):
+        return np.minimum(np.abs(skews - 0.35e-9), 0.2e-9 + 10*np.abs(skews - 3e-9))
+    monkeypatch.setattr(helper_functions, 'calculate_Ediss_trap_for_ch1_skews', Ediss_with_a_dip)
+    [skew, evaluations] = find_ch1_skew_bounded(None, freq, 0.5, cref, 5e-9)
+    assert abs(skew - 0.35e-9) <= tolerance
+    assert evaluations > 11 + 101 - 1 # coarse grid, then the fine one
@@ -0,0 +1,74 @@
+# xcorr_peak_lag and find_deskew_xcorr against known lags and channel skews, and find_deskew's
+# choice of strategy
+import numpy as np
+import pytest
+import matplotlib
+matplotlib.use('Agg') # find_deskew_MSE_Ediss_hybrid plots
+import matplotlib.pyplot as plt
+from helper_code.equipment_control.sawyer_tower_synthesizer import SawyerTowerSynthesizer
+from helper_code.helper_functions import xcorr_peak_lag, find_deskew_xcorr, find_deskew, find_deskew_for_min_MSE, \
+    find_deskew_MSE_Ediss_hybrid, L_guess_trap, scale_scope_data_w_cdivs
+
+freq = 2e6 # [Hz]
+cref = 516e-12 # [F]
+probe_cdivs = [0.1, 0.1, 0.1]
+t_step = 1.5e-9
+lag_tolerances = {'parabolic': 0.002, 'sinc': 0.01} # [samples] sinc's peak is on a 1/100 sample grid
+deskew_tolerance = 50e-12 # [s] a thirtieth of a sample, with the synthesizer's noise
+
+
+def tone(t):
+    # well inside the scope bandwidth, like test_fractional_delay's
+    return np.sin(2*np.pi*5e6*t) + 0.3*np.cos(2*np.pi*17e6*t)
+
+
+def cideal_capture(channel_skews, trap_dvdt):
+    # [t, ch1, ch2, ch3, ch4] of 3 periods of an ideal capacitor, averaged over 5 noisy frames, AC coupled
+    synthesizer = SawyerTowerSynthesizer(cref, 204e-12, 0, probe_cdivs=probe_cdivs, channel_skews=channel_skews,
+                                         noise=[0.05, 0.05, 0.02, 0.05], seed=1)
+    synthesizer.setOperatingPoint(freq, 225, 0.5, 1e-6, 1e-6)
+    [L, duty] = L_guess_trap(freq/1e6, trap_dvdt, synthesizer.node_capacitance*1e12)
+    synthesizer.setOperatingPoint(freq, 225, duty, L*1e-6, L*1e-6)
+    t = (np.arange(1000) - 500) * (3/freq/1000)
+    data = np.column_stack([t, np.mean(synthesizer.frames(t, 5), axis=0).T])
+    for column in [1, 2, 4]: # AC coupled
+        data[:, column] -= np.mean(data[:, column])
+    return scale_scope_data_w_cdivs(data, probe_cdivs)
+
+
+@pytest.mark.parametrize('interpolation', ['parabolic', 'sinc'])
+def test_peak_lag_of_a_delayed_tone(interpolation):
+    t = t_step*np.arange(1000)
+    window = np.zeros(len(t))
+    window[300:700] = 1
+    for lag in [0, 0.37, -2.71, 4.2, 1.5]:
+        sig = tone(t + lag*t_step) # lag samples early: has to be shifted right by lag
+        assert abs(xcorr_peak_lag(sig, tone(t), window, 5, interpolation) - lag) < lag_tolerances[interpolation]
+    assert xcorr_peak_lag(tone(t + 7*t_step), tone(t), window, 5, interpolation) == 5 # end of the search range
+
+
+def test_unknown_interpolation_raises():
+    t = t_step*np.arange(1000)
+    with pytest.raises(Exception):
+        xcorr_peak_lag(tone(t + 0.37*t_step), tone(t), np.ones(len(t)), 5, 'cubic')
+
+
+@pytest.mark.parametrize('interpolation', ['parabolic', 'sinc'])
+@pytest.mark.parametrize('channel_skews', [[0.5e-9, -0.3e-9, 0, 0.2e-9], [0.37e-9, -0.81e-9, 0, 0.13e-9],
+                                           [-1.23e-9, 0.64e-9, 0, -0.2e-9]])
+def test_deskews_undo_the_channel_skews(channel_skews, interpolation):
+    expected = np.array([channel_skews[3] - channel_skews[0], channel_skews[3] - channel_skews[1]])
+    for trap_dvdt in [0.3, 0.5, 0.7]:
+        deskews = find_deskew_xcorr(cideal_capture(channel_skews, trap_dvdt), freq, trap_dvdt, interpolation)
+        assert np.all(np.abs(np.array(deskews) - expected) < deskew_tolerance)
+
+
+def test_strategies_dispatch():
+    data = cideal_capture([0.37e-9, -0.81e-9, 0, 0.13e-9], 0.5)
+    assert find_deskew(data, freq, 0.5, cref, 'mse') == find_deskew_for_min_MSE(data, freq, 0.5)
+    assert find_deskew(data, freq, 0.5, cref, 'xcorr') == find_deskew_xcorr(data, freq, 0.5)
+    assert find_deskew(data, freq, 0.5, cref, 'hybrid') == find_deskew_MSE_Ediss_hybrid(data, freq, 0.5, cref)
+    assert find_deskew(data, freq, 0.5, cref) == find_deskew(data, freq, 0.5, cref, 'hybrid') # the default
+    plt.close('all')
+    with pytest.raises(Exception, match='Unknown deskew strategy'):
+        find_deskew(data, freq, 0.5, cref, 'minimum')
@@ -0,0 +1,71 @@
+# DP832 on the simulated LV supply: channels addressed directly, applyChannel only sent when its
+# values change, output toggles one command each
+from helper_code.equipment_control.simulated_equipment import SimulatedBench, SimulatedDP832
+from helper_code.helper_functions import general_LV_supply_activation
+
+
+def recording_supply():
+    # [bench, LV_supply, commands written to the supply, ';'-joined writes split up]
+    bench = SimulatedBench(latency_scale=0)
+    commands = []
+    write = bench.LV_resource.write
+    def recording_write(cmd):
+        commands.extend([command.strip().lstrip(':') for command in cmd.split(';') if command.strip()])
+        return write(cmd)
+    bench.LV_resource.write = recording_write
+    LV_supply = SimulatedDP832(bench, sync_mode='OPC')
+    del commands[:] # *IDN?
+    return [bench, LV_supply, commands]
+
+
+def without_opc(commands):
+    return [command for command in commands if command != '*OPC?']
+
+
+def test_repeated_activation_sends_nothing_new():
+    [bench, LV_supply, commands] = recording_supply()
+    general_LV_supply_activation(LV_supply)
+    assert without_opc(commands) == ['OUTP CH1,OFF', 'OUTP CH2,OFF', 'OUTP CH3,OFF', 'APPL CH1,12.000,1.500',
+                                     'APPL CH2,12.000,2.500', 'APPL CH3,5.000,0.000']
+    assert [bench.LV[channel]['voltage'] for channel in [1, 2, 3]] == [12, 12, 5]
+    assert [bench.LV[channel]['current_limit'] for channel in [1, 2, 3]] == [1.5, 2.5, 0]
+    del commands[:]
+    general_LV_supply_activation(LV_supply)
+    assert without_opc(commands) == ['OUTP CH1,OFF', 'OUTP CH2,OFF', 'OUTP CH3,OFF'] # outputs always sent
+    del commands[:]
+    LV_supply.applyChannel(2, 12, 3)
+    assert without_opc(commands) == ['APPL CH2,12.000,3.000']
+
+
+def test_outputs_toggle_without_selecting_a_channel():
+    [bench, LV_supply, commands] = recording_supply()
+    LV_supply.enableChannelOutput(2)
+    assert bench.LV[2]['output'] and not(bench.LV[1]['output'])
+    LV_supply.disableChannelOutput(2)
+    assert not(bench.LV[2]['output'])
+    assert without_opc(commands) == ['OUTP CH2,ON', 'OUTP CH2,OFF']
+
+
+def test_selected_channel_setters_invalidate_the_cache():
+    [bench, LV_supply, commands] = recording_supply()
+    LV_supply.applyChannel(1, 12, 1.5)
+    with LV_supply.batch():
+        LV_supply.setCH1()
+        LV_supply.setVoltage(10)
+    assert bench.LV[1]['voltage'] == 10
+    LV_supply.applyChannel(1, 12, 1.5) # the cache can't know what setVoltage changed
+    assert bench.LV[1]['voltage'] == 12
+    LV_supply.invalidate() # eg after the front panel
+    del commands[:]
+    LV_supply.applyChannel(1, 12, 1.5)
+    assert without_opc(commands) == ['APPL CH1,12.000,1.500']
+
+
+def test_channel_measured_without_selecting_it():
+    [bench, LV_supply, commands] = recording_supply()
+    general_LV_supply_activation(LV_supply)
+    LV_supply.enableChannelOutput(1)
+    del commands[:]
+    [volts, amps] = LV_supply.readChannelVoltageAndCurrent(1)
+    assert [volts, amps] == [12, 0.3] # signal chain only, gates off
+    assert commands == ['MEAS:ALL? CH1']
@@ -0,0 +1,169 @@
+# calculate_Ediss_trap, calculate_Ediss_trap_for_ch1_skews and find_deskew_MSE_Ediss_hybrid against
+# the original loop implementations, including captures whose first crossing is in the first samples
+import numpy as np
+import pytest
+import matplotlib
+matplotlib.use('Agg') # find_deskew_MSE_Ediss_hybrid plots
+import matplotlib.pyplot as plt
+from scipy import integrate
+import helper_code.helper_functions as helper_functions
+from helper_code.equipment_control.sawyer_tower_synthesizer import SawyerTowerSynthesizer, gan_coss_curve
+from helper_code.helper_functions import calculate_Ediss_trap, calculate_Ediss_trap_for_ch1_skews, \
+    find_deskew_MSE_Ediss_hybrid, L_guess_trap, scale_scope_data_w_cdivs, gaussian_average_specifying_stdev_time, \
+    data_array_set_t0_at_value_crossing, vector_zero_ac_sig_to_trange_avg, MSE
+
+freq = 2e6 # [Hz]
+cref = 516e-12 # [F]
+probe_cdivs = [0.1, 0.1, 0.1]
+skews = np.concatenate([np.arange(-5e-9, 5e-9 + 0.05e-9, 0.5e-9), np.random.default_rng(0).uniform(-5e-9, 5e-9, 5)])
+rolls = [0, 21, 30, 37, 42, 100, 250] # 21 to 42 put the first crossing in the first ~20 samples at trap_dvdt 0.5
+
+
+def reference_time_shift(data_array, t_col, d_col, shift):
+    # data_array_time_shift_one_signal as it was, one np.interp call per sample
+    t = data_array[:,t_col]
+    t_new = t + shift
+    d = data_array[:,d_col]
+    d_new = np.zeros(len(d))
+    for index in range(len(t)):
+        t_val = t[index]
+        if t_val < t_new[0]:
+            d_new[index] = d[0]
+        elif t_val > t_new[-1]:
+            d_new[index] = d[-1]
+        else:
+            d_new[index] = np.interp(t_val, t_new, d)
+    data_array[:,d_col] = d_new
+    return data_array
+
+
+def reference_Ediss_trap(scope_data_og, freq, trap_dvdt, cref):
+    # calculate_Ediss_trap as it was (integrating with integrate.trapezoid, the same sum as np.trapz)
+    scope_data = scope_data_og.copy()
+    t_res = scope_data[1,0] - scope_data[0,0]
+    period = 1/freq
+    period_points_float = (1 / freq) / t_res
+    half_slope_points = round((period_points_float / 4 * trap_dvdt) / 2)
+    scope_smooth = scope_data.copy()
+    scope_smooth[:,1] = gaussian_average_specifying_stdev_time(sig = scope_smooth[:,1], t_res = t_res, t_stdev = 1e-9)
+    scope_smooth = data_array_set_t0_at_value_crossing(scope_smooth, 0, 1, 0, True, 6)
+    scope_data[:,0] = scope_smooth[:,0]
+    t = scope_data[:,0]
+    t0_index = np.argmax(t >= 0)
+    vout_plus = vector_zero_ac_sig_to_trange_avg(t, scope_data[:,1], period * (3/4 - (1/4)*(2/5)),
+                                                 period * (3/4 + (1/4)*(2/5)))
+    vout_minus = vector_zero_ac_sig_to_trange_avg(t, scope_data[:,2], period * (1/4 - (1/4)*(2/5)),
+                                                  period * (1/4 + (1/4)*(2/5)))
+    vref = vector_zero_ac_sig_to_trange_avg(t, scope_data[:,4], period * (3/4 - (1/4)*(2/5)),
+                                            period * (3/4 + (1/4)*(2/5)))
+    vdut = vout_plus - vref
+    qoss = (vref - vout_minus)*cref
+    qoss = qoss - min(qoss)
+    buffer = 3
+    istart1 = t0_index - half_slope_points - buffer
+    istop1 = t0_index + half_slope_points + buffer
+    istart2 = t0_index + round(period_points_float/2) - half_slope_points - buffer
+    istop2 = t0_index + round(period_points_float/2) + half_slope_points + buffer
+    vdut_int = np.concatenate([vdut[istart1:istop1], vdut[istart2:istop2]])
+    qoss_int = np.concatenate([qoss[istart1:istop1], qoss[istart2:istop2]])
+    return integrate.trapezoid(y=vdut_int, x=qoss_int)
+
+
+def reference_deskew_MSE_Ediss_hybrid(scope_data_og, freq, trap_dvdt, cref):
+    # find_deskew_MSE_Ediss_hybrid as it was, copying and shifting the capture for each skew
+    scope_data = scope_data_og.copy()
+    ch1_norm = np.average([abs(x) for x in scope_data[:,1]])
+    ch2_norm = np.average([abs(x) for x in scope_data[:,2]])
+    ch4_norm = np.average([abs(x) for x in scope_data[:,4]])
+    scope_data[:,1] = scope_data[:,1] / ch1_norm
+    scope_data[:,2] = scope_data[:,2] / ch2_norm
+    scope_data[:,4] = scope_data[:,4] / ch4_norm
+    skew_step = 0.1e-9
+    skew_range = 5e-9
+    t_res = scope_data[1, 0] - scope_data[0, 0]
+    period_points = (1 / freq) / t_res
+    half_slope_points = round((period_points / 4 * trap_dvdt) / 2)
+    scope_smooth = scope_data.copy()
+    scope_smooth[:,1] = gaussian_average_specifying_stdev_time(sig = scope_smooth[:,1], t_res = t_res, t_stdev = 1e-9)
+    scope_smooth = data_array_set_t0_at_value_crossing(scope_smooth, 0, 1, 0, True, 6)
+    scope_data[:,0] = scope_smooth[:,0]
+    t0_index = np.argmax(scope_data[:,0] >= 0)
+    istart1 = t0_index - half_slope_points - 1
+    istop1 = t0_index + round(period_points)
+    ch2_skew_mse = []
+    skew_points = np.arange(-skew_range, skew_range + skew_step/2, skew_step)
+    for skew_val in skew_points:
+        current_data = reference_time_shift(scope_data.copy(), 0, 2, skew_val)
+        ch2_skew_mse.append(MSE(current_data[istart1:istop1, 2], current_data[istart1:istop1, 4]))
+    ch2_skew = skew_points[np.argmin(ch2_skew_mse)]
+    scope_data = reference_time_shift(scope_data, 0, 2, ch2_skew)
+    scope_data[:,1] = scope_data[:,1] * ch1_norm
+    scope_data[:,2] = scope_data[:,2] * ch2_norm
+    scope_data[:,4] = scope_data[:,4] * ch4_norm
+    ch1_skew_Ediss = []
+    for skew_val in skew_points:
+        current_data = reference_time_shift(scope_data.copy(), 0, 1, skew_val)
+        ch1_skew_Ediss.append(abs(reference_Ediss_trap(current_data, freq, trap_dvdt, cref)))
+    return [skew_points[np.argmin(ch1_skew_Ediss)], ch2_skew]
+
+
+def synthesized_capture(coss, hysteresis, trap_dvdt, roll=0):
+    # [t, ch1, ch2, ch3, ch4] of 3 periods of skewed, noisy channels, rolled by roll samples
+    synthesizer = SawyerTowerSynthesizer(cref, coss, hysteresis, probe_cdivs=probe_cdivs,
+                                         channel_skews=[0.5e-9, -0.3e-9, 0, 0.2e-9], seed=1)
+    synthesizer.setOperatingPoint(freq, 225, 0.5, 1e-6, 1e-6)
+    [L, duty] = L_guess_trap(freq/1e6, trap_dvdt, synthesizer.node_capacitance*1e12)
+    synthesizer.setOperatingPoint(freq, 225, duty, L*1e-6, L*1e-6)
+    t = (np.arange(1000) - 500) * (3/freq/1000)
+    data = np.column_stack([t, np.mean(synthesizer.frames(t, 3), axis=0).T])
+    for column in [1, 2, 4]: # AC coupled
+        data[:, column] -= np.mean(data[:, column])
+    data[:, 1:] = np.roll(data[:, 1:], roll, axis=0)
+    return scale_scope_data_w_cdivs(data, probe_cdivs)
+
+
+def reference_skews(data, trap_dvdt):
+    return np.array([reference_Ediss_trap(reference_time_shift(data.copy(), 0, 1, skew), freq, trap_dvdt, cref)
+                     for skew in skews])
+
+
+@pytest.mark.parametrize('roll', rolls)
+def test_Ediss_matches_the_original(roll):
+    data = synthesized_capture(204e-12, 0, 0.5, roll)
+    assert calculate_Ediss_trap(data, freq, 0.5, cref) == reference_Ediss_trap(data, freq, 0.5, cref)
+
+
+@pytest.mark.parametrize('roll', rolls)
+def test_skews_match_the_original(roll):
+    data = synthesized_capture(204e-12, 0, 0.5, roll)
+    assert np.array_equal(calculate_Ediss_trap_for_ch1_skews(data, freq, 0.5, cref, skews), reference_skews(data, 0.5))
+
+
+@pytest.mark.parametrize('trap_dvdt', [0.3, 0.7])
+@pytest.mark.parametrize('coss, hysteresis', [(204e-12, 0), (gan_coss_curve(), 0.02)])
+def test_skews_match_the_original_across_operating_points(trap_dvdt, coss, hysteresis):
+    data = synthesized_capture(coss, hysteresis, trap_dvdt)
+    Ediss = calculate_Ediss_trap_for_ch1_skews(data, freq, trap_dvdt, cref, skews)
+    assert np.array_equal(Ediss, reference_skews(data, trap_dvdt))
+
+
+@pytest.mark.filterwarnings('ignore::RuntimeWarning') # no MSE samples when the first crossing is that early
+@pytest.mark.parametrize('roll', [0, 30, 37])
+def test_hybrid_deskew_matches_the_original(roll):
+    data = synthesized_capture(204e-12, 0, 0.5, roll)
+    deskews = find_deskew_MSE_Ediss_hybrid(data, freq, 0.5, cref)
+    plt.close('all')
+    assert deskews == reference_deskew_MSE_Ediss_hybrid(data, freq, 0.5, cref)
+
+
+@pytest.mark.parametrize('roll', [0, 100, 250])
+def test_only_the_windows_are_shifted(monkeypatch, roll):
+    data = synthesized_capture(204e-12, 0, 0.5, roll)
+    shifted_samples = []
+    time_shifts_of_signal = helper_functions.time_shifts_of_signal
+    def counting_time_shifts(t, d, shifts, indices=None, method='linear'):
+        shifted_samples.append(len(t) if indices is None else len(indices))
+        return time_shifts_of_signal(t, d, shifts, indices, method)
+    monkeypatch.setattr(helper_functions, 'time_shifts_of_signal', counting_time_shifts)
+    calculate_Ediss_trap_for_ch1_skews(data, freq, 0.5, cref, skews)
+    assert sum(shifted_samples) < len(data)
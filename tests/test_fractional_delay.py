@@ -0,0 +1,37 @@
+# fractional_delay's methods against an analytically delayed tone, and time_shifts_of_signal's use of them
+import numpy as np
+import pytest
+from helper_code.fractional_delay import fractional_delay
+from helper_code.helper_functions import time_shifts_of_signal
+
+t_step = 1.5e-9
+t = t_step*np.arange(1000)
+delays = np.array([0, 0.37e-9, -2.71e-9, 4.2e-9])
+
+
+def tone(t):
+    # well inside the scope bandwidth, so band limiting leaves it alone
+    return np.sin(2*np.pi*5e6*t) + 0.3*np.cos(2*np.pi*17e6*t)
+
+
+@pytest.mark.parametrize('method', ['fft', 'sinc'])
+def test_delays_match_the_delayed_tone(method):
+    delayed = fractional_delay(tone(t), t_step, delays, method)
+    assert delayed.shape == (len(delays), len(t))
+    interior = slice(100, -100) # edges are held, don't trust them
+    for [row, delay] in zip(delayed, delays):
+        assert np.max(np.abs(row[interior] - tone(t - delay)[interior])) < 1e-3
+
+
+@pytest.mark.parametrize('method', ['fft', 'sinc'])
+def test_time_shifts_of_signal_uses_the_method(method):
+    indices = np.arange(200, 700)
+    shifted = time_shifts_of_signal(t, tone(t), delays, indices, method)
+    assert np.array_equal(shifted, fractional_delay(tone(t), t_step, delays, method)[:, indices])
+    linear = time_shifts_of_signal(t, tone(t), delays, indices)
+    assert np.max(np.abs(shifted - linear)) < 0.02 # linear interpolation error between samples
+
+
+def test_unknown_method_raises():
+    with pytest.raises(Exception):
+        fractional_delay(tone(t), t_step, delays, 'cubic')
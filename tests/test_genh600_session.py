@@ -0,0 +1,75 @@
+# GENH600 on the simulated HV supply: a session keeps one port open and reads each reply up to its '\r',
+# however long the supply takes, and voltage and current come back from one exchange
+import serial
+from helper_code.equipment_control.simulated_equipment import SimulatedBench, SimulatedGENH600, LatencyModel
+
+
+def counting_bench(HV_latency=None):
+    # [bench, ports opened, lines the supply got], HV_latency replaces the supply's LatencyModel
+    bench = SimulatedBench(latencies=None if HV_latency is None else {'HV': HV_latency},
+                           latency_scale=0 if HV_latency is None else 1)
+    ports = []
+    lines = []
+    open_HV_serial = bench.openHVSerial
+    def counting_open(*args, **kwargs):
+        ports.append(open_HV_serial(*args, **kwargs))
+        handle_line = ports[-1].handleLine
+        def recording_handle_line(line):
+            lines.append(line)
+            return handle_line(line)
+        ports[-1].handleLine = recording_handle_line
+        return ports[-1]
+    bench.openHVSerial = counting_open
+    return [bench, ports, lines]
+
+
+def test_session_uses_one_port():
+    [bench, ports, lines] = counting_bench()
+    HV_supply = SimulatedGENH600(bench, persistent_session=True)
+    assert HV_supply.connected
+    HV_supply.setVoltage(100)
+    HV_supply.enableMaster()
+    assert HV_supply.readVoltage() == 100
+    assert len(ports) == 1 and ports[0].is_open
+    HV_supply.closeSession()
+    assert not(ports[0].is_open)
+    assert HV_supply.readVoltage() == 100 # back to a port per command
+    assert len(ports) == 2 and not(ports[1].is_open)
+
+
+def test_slow_replies_are_read_whole():
+    # the supply takes longer than CMD_DELAY: a session waits for the '\r', a port per command
+    # reads what has arrived after CMD_DELAY, which is nothing
+    slow = LatencyModel(per_command=1.5*SimulatedGENH600.CMD_DELAY)
+    [bench, ports, lines] = counting_bench(slow)
+    HV_supply = SimulatedGENH600(bench, persistent_session=True)
+    assert HV_supply.connected
+    HV_supply.setVoltage(225)
+    HV_supply.enableMaster()
+    assert HV_supply.readVoltage() == 225
+    HV_supply.closeSession()
+    assert HV_supply.readVoltage() is None
+
+
+def test_voltage_and_current_from_one_exchange():
+    [bench, ports, lines] = counting_bench()
+    HV_supply = SimulatedGENH600(bench, persistent_session=True)
+    HV_supply.setVoltage(100)
+    HV_supply.enableMaster()
+    start = len(lines)
+    [volts, amps] = HV_supply.readVoltageAndCurrent()
+    assert lines[start:] == ['DVC?']
+    assert volts == 100
+    assert amps == 0 # gates aren't running, so nothing's drawn
+
+
+def test_command_resent_after_serial_error():
+    [bench, ports, lines] = counting_bench()
+    HV_supply = SimulatedGENH600(bench, persistent_session=True)
+    def failing_write(data):
+        raise serial.SerialException('write failed')
+    ports[0].write = failing_write
+    HV_supply.setVoltage(150)
+    assert len(ports) == 2 # reopened
+    assert bench.HV['voltage'] == 150
+    assert lines[-1] == 'PV 150.000' # on the new port
@@ -0,0 +1,69 @@
+# TrafficRecorder / TrafficReplay round trip on the simulated bench
+import os
+import numpy as np
+import pytest
+from helper_code.equipment_control.simulated_equipment import SimulatedBench, SimulatedMSO5000, SimulatedDP832, \
+    SimulatedGENH600, SimulatedPOWAM_MICRO
+from helper_code.equipment_control.instrument_traffic import TrafficRecorder, TrafficReplay, load_traffic, \
+    traffic_summary
+
+
+def session(scope, LV_supply, HV_supply, arduino):
+    # a few typical exchanges on each instrument, returns what came back
+    with scope.batch():
+        scope.setTimeScale(1.5e-6)
+        scope.setChannelScale(1, 31.5)
+    results = [scope.readChannel(1)[:, 1]]
+    with LV_supply.batch():
+        LV_supply.applyChannel(1, 12, 1.5)
+        LV_supply.enableChannelOutput(1)
+    results.append(LV_supply.readChannelVoltageAndCurrent(1))
+    HV_supply.setVoltage(225)
+    results.append(HV_supply.readVoltageAndCurrent())
+    with arduino.batch():
+        arduino.setDutyCycleRefValue(3.1)
+        arduino.setSineFreq(2)
+    arduino.setIndPos(1, 40)
+    arduino.waitForInductorsToMove()
+    results.append(arduino.queryCMD('w1'))
+    return results
+
+
+def record_session(log_file):
+    bench = SimulatedBench(latency_scale=0)
+    with TrafficRecorder(log_file) as recorder:
+        scope = recorder.record(SimulatedMSO5000(bench, sync_mode='OPC'), 'scope')
+        LV_supply = recorder.record(SimulatedDP832(bench, sync_mode='OPC'), 'LV_supply')
+        HV_supply = recorder.record(SimulatedGENH600(bench, persistent_session=True), 'HV_supply')
+        arduino = recorder.record(SimulatedPOWAM_MICRO(bench, persistent_session=True), 'arduino')
+        recorded = session(scope, LV_supply, HV_supply, arduino)
+    return recorded
+
+
+def test_replay_returns_the_recorded_results(tmp_path):
+    log_file = str(tmp_path / 'traffic.jsonl.gz')
+    recorded = record_session(log_file)
+    [headers, records] = load_traffic(log_file)
+    assert sorted(headers) == ['HV_supply', 'LV_supply', 'arduino', 'scope']
+    assert set([key[0] for key in traffic_summary(records)]) == set(headers)
+    replay = TrafficReplay(log_file)
+    replayed = session(replay.device('scope'), replay.device('LV_supply'), replay.device('HV_supply'),
+                       replay.device('arduino'))
+    assert np.array_equal(recorded[0], replayed[0])
+    assert recorded[1:] == replayed[1:]
+    for name in headers:
+        assert replay.remaining(name) == 0
+
+
+def test_recorder_puts_the_drivers_back_after_an_error(tmp_path):
+    log_file = str(tmp_path / 'traffic.jsonl')
+    bench = SimulatedBench(latency_scale=0)
+    scope = SimulatedMSO5000(bench, sync_mode='OPC')
+    with pytest.raises(ValueError):
+        with TrafficRecorder(log_file) as recorder:
+            recorder.record(scope, 'scope')
+            scope.run()
+            raise ValueError('run failed')
+    assert '__write_cmd__' not in vars(scope) and 'queryCMD' not in vars(scope)
+    [headers, records] = load_traffic(log_file) # log is complete up to the error
+    assert [record['c'] for record in records] == ['RUN']
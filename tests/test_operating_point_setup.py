@@ -0,0 +1,36 @@
+# setup_operating_point on the simulated bench: the HV supply voltage is set once the LV supply is
+# activated, alongside the inductors and the arduino rather than after them
+import threading
+from helper_code.equipment_control.simulated_equipment import SimulatedBench, SimulatedMSO5000, SimulatedDP832, \
+    SimulatedGENH600, SimulatedPOWAM_MICRO
+import running_operating_points
+
+
+def test_HV_voltage_set_alongside_the_arduino(monkeypatch):
+    bench = SimulatedBench(latency_scale=0)
+    scope = SimulatedMSO5000(bench, sync_mode='OPC')
+    LV_supply = SimulatedDP832(bench, sync_mode='OPC')
+    HV_supply = SimulatedGENH600(bench, persistent_session=True)
+    arduino = SimulatedPOWAM_MICRO(bench, persistent_session=True)
+    HV_set = threading.Event()
+    LV_at_HV = []
+    set_voltage = HV_supply.setVoltage
+    def recording_set_voltage(voltage):
+        LV_at_HV.append([bench.LV[channel]['voltage'] for channel in [1, 2, 3]])
+        set_voltage(voltage)
+        HV_set.set()
+    monkeypatch.setattr(HV_supply, 'setVoltage', recording_set_voltage)
+    HV_set_during_arduino = []
+    general_arduino_activation = running_operating_points.general_arduino_activation
+    def waiting_arduino_activation(*args):
+        # if HV were set after the arduino, this would time out
+        HV_set_during_arduino.append(HV_set.wait(timeout=5))
+        general_arduino_activation(*args)
+    monkeypatch.setattr(running_operating_points, 'general_arduino_activation', waiting_arduino_activation)
+    running_operating_points.setup_operating_point(2, 100, True, [0.1, 0.1, 0.1], 3.5, 20, 20, True,
+                                                   scope, HV_supply, LV_supply, arduino)
+    assert LV_at_HV == [[12, 12, 5]] # LV supply already activated
+    assert HV_set_during_arduino == [True]
+    assert bench.HV['voltage'] == 50
+    firmware = bench.firmware
+    assert [firmware.sine_freq, firmware.duty_ref, firmware.trap_mode, arduino.l1_pos] == [4e6, 3.5, True, 20]
@@ -0,0 +1,69 @@
+# SawyerTowerSynthesizer's ground truth Ediss against the hysteresis loop worked out by hand, and
+# calculate_Ediss_trap on its waveforms against that ground truth
+import numpy as np
+import pytest
+from helper_code.equipment_control.sawyer_tower_synthesizer import SawyerTowerSynthesizer, gan_coss_curve
+from helper_code.helper_functions import calculate_Ediss_trap, L_guess_trap, scale_scope_data_w_cdivs
+
+freq = 2e6 # [Hz]
+cref = 516e-12 # [F]
+probe_cdivs = [0.1, 0.1, 0.1]
+duts = [(204e-12, 0), (204e-12, 0.02), (gan_coss_curve(), 0), (gan_coss_curve(), 0.02)]
+
+
+def trap_synthesizer(coss, hysteresis, trap_dvdt, channel_skews=[0, 0, 0, 0]):
+    # noise-free synthesizer at 225V, inductors and duty from L_guess_trap like a Cideal run
+    synthesizer = SawyerTowerSynthesizer(cref, coss, hysteresis, probe_cdivs=probe_cdivs,
+                                         channel_skews=channel_skews)
+    synthesizer.setOperatingPoint(freq, 225, 0.5, 1e-6, 1e-6)
+    [L, duty] = L_guess_trap(freq/1e6, trap_dvdt, synthesizer.node_capacitance*1e12)
+    synthesizer.setOperatingPoint(freq, 225, duty, L*1e-6, L*1e-6)
+    return synthesizer
+
+
+def Eoss(synthesizer):
+    # [J] energy stored in the DUT at the top of its swing, to scale tolerances by
+    return synthesizer.Q_grid[-1] * synthesizer.vd_grid[-1] / 2
+
+
+@pytest.mark.parametrize('coss, hysteresis', duts)
+def test_ground_truth_is_the_loop_area(coss, hysteresis):
+    # discharge branch holds hysteresis*Qmax*sin(pi*V/Vmax) more charge than the charge branch,
+    # so the loop encloses hysteresis*Qmax*Vmax * integral of -(pi x) cos(pi x) dx over [0, 1] = 2/pi of that
+    for trap_dvdt in [0.3, 0.5, 0.7]:
+        synthesizer = trap_synthesizer(coss, hysteresis, trap_dvdt)
+        loop_area = 2/np.pi * hysteresis * synthesizer.Q_grid[-1] * synthesizer.vd_grid[-1]
+        assert abs(synthesizer.groundTruthEdiss() - loop_area) < 1e-6 * Eoss(synthesizer)
+
+
+@pytest.mark.parametrize('coss, hysteresis', duts)
+def test_Ediss_measured_from_the_waveforms(coss, hysteresis):
+    for trap_dvdt in [0.3, 0.5, 0.7]:
+        synthesizer = trap_synthesizer(coss, hysteresis, trap_dvdt)
+        t = (np.arange(1000) - 500) * (3/freq/1000)
+        data = np.column_stack([t, synthesizer.frame(t).T])
+        for column in [1, 2, 4]: # AC coupled
+            data[:, column] -= np.mean(data[:, column])
+        data = scale_scope_data_w_cdivs(data, probe_cdivs)
+        Ediss = calculate_Ediss_trap(data, freq, trap_dvdt, cref)
+        assert abs(Ediss - synthesizer.groundTruthEdiss()) < 2e-3 * Eoss(synthesizer)
+
+
+def test_channel_skews_delay_each_channel():
+    skews = [0.5e-9, -0.3e-9, 0, 0.2e-9]
+    skewed = trap_synthesizer(204e-12, 0.02, 0.5, skews)
+    t = (np.arange(1000) - 500) * 1.5e-9
+    frame = skewed.frame(t)
+    for channel in range(4):
+        assert np.allclose(frame[channel], skewed.frame(t - skews[channel], -np.array(skews))[channel])
+    assert np.array_equal(skewed.frame(t, [1e-9, 0, 0, 0])[0], skewed.frame(t - 1e-9)[0])
+
+
+def test_noise_is_added_per_frame():
+    synthesizer = SawyerTowerSynthesizer(cref, 204e-12, noise=[0.05, 0.05, 0.02, 0.05], seed=3)
+    synthesizer.setOperatingPoint(freq, 225, 0.75, 4e-6, 4e-6)
+    t = (np.arange(1000) - 500) * 1.5e-9
+    frames = synthesizer.frames(t, 50)
+    assert frames.shape == (50, 4, len(t))
+    residual = frames - synthesizer.frame(t)[None, :, :]
+    assert np.std(residual, axis=(0, 2)) == pytest.approx([0.05, 0.05, 0.02, 0.05], rel=0.05)
@@ -0,0 +1,25 @@
+# :SINGle acquisitions on the simulated scope: waitForAcquisition only accepts a STOP after the scope armed
+import time
+import pytest
+from helper_code.equipment_control.simulated_equipment import SimulatedBench, SimulatedMSO5000
+
+
+def test_wait_for_acquisition_waits_for_the_new_acquisition():
+    bench = SimulatedBench(latency_scale=0, acquisition_time=0.05)
+    scope = SimulatedMSO5000(bench, sync_mode='OPC')
+    scope.stop()
+    assert scope.getTriggerStatus() == 'STOP' # left over, not the acquisition below
+    t_start = time.time()
+    status = scope.singleStatus()
+    assert status == 'WAIT'
+    scope.waitForAcquisition(status=status)
+    assert time.time() - t_start >= bench.acquisition_time
+    assert scope.getTriggerStatus() == 'STOP'
+
+
+def test_wait_for_acquisition_rejects_stale_stop():
+    bench = SimulatedBench(latency_scale=0)
+    scope = SimulatedMSO5000(bench, sync_mode='OPC')
+    scope.stop() # never armed, so the STOP can't be a new acquisition
+    with pytest.raises(Exception, match='did not arm'):
+        scope.waitForAcquisition(timeout=0.05)
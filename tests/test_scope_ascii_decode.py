@@ -0,0 +1,38 @@
+# MSO5000.asciiToVector: the header length comes from the block header, and replies without one still parse
+import numpy as np
+import pytest
+from helper_code.equipment_control.simulated_equipment import SimulatedBench, SimulatedMSO5000
+
+
+@pytest.fixture
+def scope():
+    return SimulatedMSO5000(SimulatedBench(latency_scale=0), wav_format='ASCii', sync_mode='OPC')
+
+
+def ascii_block(values, digits):
+    # WAV:DATA? ASCii reply for values with a header of digits length digits, as the scope sends it
+    data = ','.join(['%.6e' % value for value in values]) + ','
+    return '#' + str(digits) + str(len(data)).zfill(digits) + data + '\n'
+
+
+@pytest.mark.parametrize('digits', [2, 4, 9]) # the fixed 11-character slice only handled 9
+def test_header_length_from_the_header(scope, digits):
+    values = [-0.1, 0.025, 3.5]
+    assert np.array_equal(scope.asciiToVector(ascii_block(values, digits)), values)
+
+
+def test_reply_without_header(scope):
+    assert np.array_equal(scope.asciiToVector('1.5e-01,-2.0e-02,3.0e+00,\n'), [0.15, -0.02, 3])
+
+
+def test_nothing_past_the_block_is_parsed(scope):
+    # a stale second reply on the line mustn't end up in the waveform
+    reply = ascii_block([1, 2], 9) + ascii_block([3, 4], 9)
+    assert np.array_equal(scope.asciiToVector(reply), [1, 2])
+
+
+def test_ascii_read_from_the_scope(scope):
+    data = scope.readChannel(2)
+    assert data.shape == (scope.SCREEN_POINTS, 2)
+    assert np.all(np.isfinite(data[:, 1]))
+    assert scope.last_transfer_bytes > 10 * scope.SCREEN_POINTS # '%.6e,' per point
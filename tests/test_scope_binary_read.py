@@ -0,0 +1,57 @@
+# MSO5000 BYTE/WORD waveform transfer on the simulated scope: blocks decoded with the preamble scaling
+# give the same waveform as ASCii, in a fraction of the bytes
+import numpy as np
+import pytest
+from helper_code.equipment_control.simulated_equipment import SimulatedBench, SimulatedMSO5000
+
+
+def stopped_scope():
+    # [bench, scope] with channel 1 at 8V full screen and one acquisition to read in every format
+    bench = SimulatedBench(latency_scale=0)
+    scope = SimulatedMSO5000(bench, sync_mode='OPC')
+    scope.setChannelScale(1, 8)
+    scope.setChannelZeroLocation(1, 0.5)
+    scope.stop()
+    return [bench, scope]
+
+
+@pytest.mark.parametrize('wav_format, bytes_per_point', [['BYTE', 1], ['WORD', 2]])
+def test_binary_read_matches_ascii(wav_format, bytes_per_point):
+    [bench, scope] = stopped_scope()
+    scope.setWaveformFormat('ASCii')
+    ascii_read = scope.readChannel(1)
+    ascii_bytes = scope.last_transfer_bytes
+    scope.setWaveformFormat(wav_format)
+    binary_read = scope.readChannel(1)
+    data_bytes = bytes_per_point*bench.screen_points
+    assert scope.last_transfer_bytes == len('#' + str(len(str(data_bytes))) + str(data_bytes)) + data_bytes + len('\n')
+    assert scope.last_transfer_bytes < ascii_bytes / 5
+    assert np.array_equal(binary_read[:, 0], ascii_read[:, 0])
+    y_inc = scope.getPreamble()[7]
+    assert np.max(np.abs(binary_read[:, 1] - ascii_read[:, 1])) <= y_inc # within one ADC code
+
+
+def test_block_decoding_uses_the_preamble():
+    [bench, scope] = stopped_scope()
+    preamble = [0, 0, 3, 1, 1e-9, 0, 0, 0.1, -20, 128] # yinc 0.1, yorigin -20, yref 128
+    scope.setWaveformFormat('BYTE')
+    assert np.allclose(scope.binaryToVector(b'#13' + bytes([0, 108, 255]) + b'\n', preamble), [-10.8, 0, 14.7])
+    scope.setWaveformFormat('WORD')
+    preamble[9] = 32768
+    block = b'#16' + np.array([0, 32748, 65535], dtype='<u2').tobytes() + b'\n'
+    assert np.allclose(scope.binaryToVector(block, preamble), [-3274.8, 0, 3278.7])
+
+
+def test_block_header_lengths():
+    [bench, scope] = stopped_scope()
+    assert scope.blockHeaderLengths(b'#9000001000' + bytes(1000)) == [11, 1000]
+    assert scope.blockHeaderLengths(b'#13abc') == [3, 3]
+    assert scope.blockHeaderLengths('#41234' + 'x'*1234) == [6, 1234]
+    with pytest.raises(Exception):
+        scope.blockHeaderLengths(b'1.0,2.0')
+
+
+def test_unknown_format_raises():
+    [bench, scope] = stopped_scope()
+    with pytest.raises(Exception):
+        scope.setWaveformFormat('FLOAT')
@@ -0,0 +1,82 @@
+# MSO5000 measurement snapshots on the simulated bench: items are added to the screen once, and all
+# their values come back from one round trip
+import pytest
+from helper_code.equipment_control.simulated_equipment import SimulatedBench, SimulatedMSO5000, SimulatedDP832, \
+    SimulatedGENH600, SimulatedPOWAM_MICRO
+from helper_code.helper_functions import turn_system_on
+from running_operating_points import setup_operating_point
+
+items = [['PSLewrate', 1], ['NSLewrate', 1], ['PSLewrate', 2], ['NSLewrate', 2], ['PDUTy', 3]]
+
+
+def running_bench():
+    # [bench, scope, commands written to the scope, ';'-joined writes split up] with the converter running
+    bench = SimulatedBench(latency_scale=0)
+    commands = []
+    write = bench.scope_resource.write
+    def recording_write(cmd):
+        commands.append([command.strip().lstrip(':') for command in cmd.split(';') if command.strip()])
+        return write(cmd)
+    bench.scope_resource.write = recording_write
+    scope = SimulatedMSO5000(bench, sync_mode='OPC')
+    HV_supply = SimulatedGENH600(bench, persistent_session=True)
+    LV_supply = SimulatedDP832(bench, sync_mode='OPC')
+    arduino = SimulatedPOWAM_MICRO(bench, persistent_session=True)
+    setup_operating_point(2, 100, True, [0.1, 0.1, 0.1], 2.5, 20, 20, True, scope, HV_supply, LV_supply, arduino)
+    turn_system_on(HV_supply, LV_supply, arduino, check_power=False)
+    del commands[:]
+    return [bench, scope, commands]
+
+
+def test_snapshot_in_one_round_trip():
+    [bench, scope, commands] = running_bench()
+    snapshot = scope.queryMeasSnapshot(items)
+    added = [command for write in commands for command in write if command.startswith('MEASure:STATistic:ITEM ')]
+    assert len(added) == len(items)
+    queries = [write for write in commands if write[0].startswith('MEASure:ITEM?')]
+    assert len(queries) == 1 and len(queries[0]) == len(items)
+    assert snapshot[('PDUTy', 3)] == pytest.approx(0.25)
+    assert snapshot[('PSLewrate', 1)] > 0 and snapshot[('NSLewrate', 1)] < 0
+    del commands[:]
+    scope.queryMeasSnapshot(items, 'AVERages')
+    queries = [command for write in commands for command in write]
+    assert len(queries) == len(items) # already on the screen: just the queries
+    assert all([query.startswith('MEASure:STATistic:ITEM? AVERages') for query in queries])
+    assert len(commands) == 2 # longer queries, so two writes of at most MAX_BATCH_LENGTH
+
+
+def test_single_items_use_the_snapshot_registration():
+    [bench, scope, commands] = running_bench()
+    scope.registerMeasSnapshot(items)
+    del commands[:]
+    assert scope.queryMeasItem('PDUTy', 3) == pytest.approx(0.25)
+    assert scope.queryStatItem('AVERages', 'PSLewrate', 2) > 0
+    assert [command for write in commands for command in write if 'ITEM ' in command] == [] # not added again
+
+
+def test_oldest_item_replaced_past_the_screen_limit():
+    [bench, scope, commands] = running_bench()
+    scope.registerMeasSnapshot([['VMAX', channel] for channel in [1, 2, 3, 4]] +
+                               [['VMIN', channel] for channel in [1, 2, 3, 4]] + items)
+    assert len(scope.meas_items) == scope.MAX_MEAS_ITEMS
+    assert ['VMAX', 1] not in scope.meas_items and ['PDUTy', 3] in scope.meas_items
+    scope.clearAllMeasItems()
+    del commands[:]
+    scope.queryMeasSnapshot(items[:1])
+    assert commands[0] == ['MEASure:STATistic:ITEM PSLewrate,CHANnel1'] # added again after clearing
+
+
+def test_one_query_at_a_time_if_joined_queries_go_unanswered():
+    [bench, scope, commands] = running_bench()
+    scope.registerMeasSnapshot(items)
+    write = bench.scope_resource.write
+    def first_query_only_write(cmd):
+        # firmware that only answers the first of several ';'-joined queries
+        if '?' in cmd and ';' in cmd:
+            return write(cmd.split(';')[0])
+        return write(cmd)
+    bench.scope_resource.write = first_query_only_write
+    snapshot = scope.queryMeasSnapshot(items)
+    assert not(scope.joined_meas_queries)
+    assert snapshot[('PDUTy', 3)] == pytest.approx(0.25)
+    assert len(snapshot) == len(items)
@@ -0,0 +1,70 @@
+# MSO5000's cached waveform preamble on the simulated scope: one :WAV:PREamble? per source, shared
+# timebase, and asked again after anything that changes the scaling
+import numpy as np
+from helper_code.equipment_control.simulated_equipment import SimulatedBench, SimulatedMSO5000
+
+
+def recording_scope(wav_format='BYTE'):
+    # [scope, commands written to the scope, ';'-joined writes split up]
+    bench = SimulatedBench(latency_scale=0)
+    commands = []
+    write = bench.scope_resource.write
+    def recording_write(cmd):
+        commands.extend([command.strip().lstrip(':') for command in cmd.split(';') if command.strip()])
+        return write(cmd)
+    bench.scope_resource.write = recording_write
+    scope = SimulatedMSO5000(bench, wav_format, sync_mode='OPC')
+    return [scope, commands]
+
+
+def preamble_queries(commands):
+    return commands.count('WAV:PREamble?')
+
+
+def test_one_preamble_per_source():
+    [scope, commands] = recording_scope()
+    scope.readAllChannels()
+    assert preamble_queries(commands) == 4 # y scaling differs per channel
+    scope.readAllChannels()
+    assert preamble_queries(commands) == 4
+    assert not([command for command in commands if command.startswith('WAV:X')]) # timebase from the preamble
+
+
+def test_ascii_reads_share_one_timebase():
+    [scope, commands] = recording_scope('ASCii')
+    scope.readAllChannels()
+    scope.readAllChannels()
+    assert preamble_queries(commands) == 1 # ASCii needs no y scaling
+
+
+def test_timebase_changes_ask_again():
+    [scope, commands] = recording_scope()
+    before = scope.readChannel(1)
+    scope.setTimeScale(3e-6)
+    after = scope.readChannel(1)
+    assert preamble_queries(commands) == 2
+    assert np.allclose(after[:, 0], before[:, 0] * 3e-6 / 1e-6) # simulated scope starts at 0.1 us/div
+    scope.setTimeScale(3e-6) # unchanged, cache kept
+    scope.setTimeZeroLocation(1e-7)
+    scope.readChannel(1)
+    assert preamble_queries(commands) == 3
+    for change in [lambda: scope.setMemoryDepth('10k'), lambda: scope.setDataAcquisitionType('AVERages'),
+                   lambda: scope.setDataAcquisitionAverage(16)]:
+        change()
+        scope.readChannel(1)
+    assert preamble_queries(commands) == 6
+
+
+def test_channel_changes_only_ask_for_that_channel():
+    [scope, commands] = recording_scope()
+    scope.readChannel(1)
+    scope.readChannel(2)
+    scope.setChannelScale(2, 16)
+    scope.readChannel(1)
+    assert preamble_queries(commands) == 2
+    scope.readChannel(2)
+    assert preamble_queries(commands) == 3
+    scope.setAttenuationFactor(1, 10)
+    scope.readChannel(2)
+    scope.readChannel(1)
+    assert preamble_queries(commands) == 4
@@ -0,0 +1,27 @@
+# readChannelRaw moves WAV:STARt/WAV:STOP per chunk, NORMal reads after it must still get the whole screen
+import numpy as np
+from helper_code.equipment_control.simulated_equipment import SimulatedBench, SimulatedMSO5000
+
+
+def test_normal_read_after_raw_read_returns_full_screen():
+    bench = SimulatedBench(latency_scale=0)
+    scope = SimulatedMSO5000(bench, sync_mode='OPC')
+    before = scope.readChannel(1)
+    assert len(before) == bench.screen_points
+    scope.stop()
+    # several chunks, so the last one leaves STARt well past the screen length
+    [values, x_increment, x_origin] = scope.readChannelRaw(1, chunk_points=bench.raw_points // 3)
+    assert len(values) == bench.raw_points
+    assert np.all(np.isfinite(values))
+    after = scope.readChannel(1)
+    assert len(after) == bench.screen_points
+    assert np.allclose(after[:,0], before[:,0])
+
+
+def test_raw_read_chunks_match_single_transfer():
+    bench = SimulatedBench(latency_scale=0)
+    scope = SimulatedMSO5000(bench, sync_mode='OPC')
+    scope.stop()
+    [whole, x_increment, x_origin] = scope.readChannelRaw(2)
+    [chunked, x_increment, x_origin] = scope.readChannelRaw(2, chunk_points=777)
+    assert np.array_equal(whole, chunked)
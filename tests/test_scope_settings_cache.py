@@ -0,0 +1,73 @@
+# MSO5000's shadow copy of its settings on the simulated scope: unchanged settings aren't written again
+# until invalidate()
+from helper_code.equipment_control.simulated_equipment import SimulatedBench, SimulatedMSO5000
+from helper_code.helper_functions import window_scope
+
+
+def recording_scope():
+    # [bench, scope, commands written to the scope, ';'-joined writes split up]
+    bench = SimulatedBench(latency_scale=0)
+    commands = []
+    write = bench.scope_resource.write
+    def recording_write(cmd):
+        commands.extend([command.strip().lstrip(':') for command in cmd.split(';') if command.strip()])
+        return write(cmd)
+    bench.scope_resource.write = recording_write
+    scope = SimulatedMSO5000(bench, sync_mode='OPC')
+    del commands[:] # *IDN?
+    return [bench, scope, commands]
+
+
+def settings_written(commands):
+    return [command for command in commands if command != '*OPC?']
+
+
+def test_second_window_scope_writes_nothing():
+    [bench, scope, commands] = recording_scope()
+    window_scope(2, 100, True, [0.1, 0.1, 0.1], scope)
+    assert len(settings_written(commands)) > 10
+    assert bench.scope_resource.settings['CHANNEL1:SCALE'] == '0.875' # 1.4 times the expected 5V, over 8 divisions
+    del commands[:]
+    window_scope(2, 100, True, [0.1, 0.1, 0.1], scope)
+    assert settings_written(commands) == []
+    window_scope(2, 200, True, [0.1, 0.1, 0.1], scope) # only the channel scales change
+    assert sorted(settings_written(commands)) == ['CHANnel1:SCALe 1.75', 'CHANnel2:SCALe 1.75', 'CHANnel4:SCALe 1.75']
+
+
+def test_invalidate_writes_everything_again():
+    [bench, scope, commands] = recording_scope()
+    window_scope(2, 100, True, [0.1, 0.1, 0.1], scope)
+    written = settings_written(commands)
+    del commands[:]
+    scope.invalidate() # eg after hardware_setup_generation
+    window_scope(2, 100, True, [0.1, 0.1, 0.1], scope)
+    assert settings_written(commands) == written
+
+
+def test_invalidate_one_channel():
+    [bench, scope, commands] = recording_scope()
+    for channel in [1, 2]:
+        scope.setChannelScale(channel, 8)
+        scope.setChannelDeskew(channel, 0)
+    del commands[:]
+    scope.invalidate(':CHANnel2:')
+    for channel in [1, 2]:
+        scope.setChannelScale(channel, 8)
+        scope.setChannelDeskew(channel, 0)
+    assert settings_written(commands) == ['CHANnel2:VERNier ON', 'CHANnel2:SCALe 1.0', 'CHANnel2:TCALibrate 0']
+
+
+def test_setting_not_cached_if_the_write_fails():
+    [bench, scope, commands] = recording_scope()
+    write = bench.scope_resource.write
+    def failing_write(cmd):
+        raise OSError('USB unplugged')
+    bench.scope_resource.write = failing_write
+    try:
+        scope.setChannelDeskew(1, 1e-9)
+    except OSError:
+        pass
+    bench.scope_resource.write = write
+    del commands[:]
+    scope.setChannelDeskew(1, 1e-9)
+    assert settings_written(commands) == ['CHANnel1:TCALibrate 1e-09']
@@ -0,0 +1,58 @@
+# sync modes and command batching of the SCPI drivers (MSO5000, DP832), shared through SCPIMixin
+import pytest
+from helper_code.equipment_control.simulated_equipment import SimulatedBench, SimulatedMSO5000, SimulatedDP832
+
+
+@pytest.mark.parametrize('sync_mode', ['DELAY', 'OPC', 'WAI'])
+def test_supply_settings_reach_the_bench(sync_mode):
+    bench = SimulatedBench(latency_scale=0)
+    LV_supply = SimulatedDP832(bench, sync_mode=sync_mode)
+    LV_supply.CMD_DELAY = 0.001 # the bench answers straight away
+    LV_supply.applyChannel(2, 12.0, 0.5)
+    LV_supply.enableChannelOutput(2)
+    [volts, amps] = LV_supply.readChannelVoltageAndCurrent(2)
+    assert volts == pytest.approx(12.0)
+
+
+@pytest.mark.parametrize('sync_mode', ['DELAY', 'OPC', 'WAI'])
+def test_scope_writes_follow_sync_mode(sync_mode):
+    bench = SimulatedBench(latency_scale=0)
+    scope = SimulatedMSO5000(bench, sync_mode=sync_mode)
+    scope.CMD_DELAY = 0.001
+    resource = scope.inst
+    commands = resource.commands_received
+    scope.sendCMD(':CHANnel2:SCALe 0.5')
+    # WAI appends *WAI to the write, OPC follows it with an *OPC? query
+    assert resource.commands_received - commands == (1 if sync_mode == 'DELAY' else 2)
+    assert float(scope.queryCMD(':CHANnel2:SCALe?')) == 0.5
+
+
+def test_unknown_sync_mode_is_rejected():
+    bench = SimulatedBench(latency_scale=0)
+    with pytest.raises(Exception, match='Sync mode'):
+        SimulatedDP832(bench, sync_mode='FAST')
+
+
+def test_batched_commands_share_writes():
+    bench = SimulatedBench(latency_scale=0)
+    LV_supply = SimulatedDP832(bench, sync_mode='OPC')
+    resource = LV_supply.inst
+    writes = resource.writes_received
+    with LV_supply.batch():
+        for channel in [1, 2, 3]:
+            LV_supply.applyChannel(channel, 5.0 + channel, 0.5)
+        assert resource.writes_received == writes # nothing sent inside the block
+    assert resource.writes_received - writes == 2 # one ';'-joined write, one *OPC?
+    assert [bench.LV[channel]['voltage'] for channel in [1, 2, 3]] == [6.0, 7.0, 8.0]
+
+
+def test_batch_splits_long_writes():
+    bench = SimulatedBench(latency_scale=0)
+    scope = SimulatedMSO5000(bench, sync_mode='WAI')
+    resource = scope.inst
+    writes = resource.writes_received
+    with scope.batch():
+        for n in range(40):
+            scope.sendCMD(':CHANnel1:OFFSet ' + str(n))
+    assert resource.writes_received - writes > 1 # 40 commands don't fit in MAX_BATCH_LENGTH
+    assert float(scope.queryCMD(':CHANnel1:OFFSet?')) == 39
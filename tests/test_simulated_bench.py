@@ -0,0 +1,61 @@
+# the simulated bench (simulated_equipment) driven through the real drivers: supplies, control board
+# and scope follow each other like on the bench, and the motion model has to be calibrated to its motors
+import numpy as np
+import pytest
+from helper_code.equipment_control.arduino_coss_communication import POWAM_MICRO
+from helper_code.equipment_control.simulated_equipment import SimulatedBench, SimulatedMSO5000, SimulatedDP832, \
+    SimulatedGENH600, SimulatedPOWAM_MICRO
+from helper_code.helper_functions import turn_system_on, turn_system_off
+from running_operating_points import setup_operating_point
+
+
+def simulated_instruments(bench):
+    # [scope, HV_supply, LV_supply, arduino] on bench, in the fast modes
+    return [SimulatedMSO5000(bench, sync_mode='OPC'), SimulatedGENH600(bench, persistent_session=True),
+            SimulatedDP832(bench, sync_mode='OPC'), SimulatedPOWAM_MICRO(bench, persistent_session=True)]
+
+
+def test_bench_runs_once_everything_is_on():
+    bench = SimulatedBench(latency_scale=0)
+    [scope, HV_supply, LV_supply, arduino] = simulated_instruments(bench)
+    setup_operating_point(2, 100, True, [0.1, 0.1, 0.1], 2.5, 200, 200, True, scope, HV_supply, LV_supply, arduino)
+    assert bench.unpowered_moves == 0 # set_inductor_positions powers the motors first
+    assert HV_supply.readCurrent() == 0 # nothing on yet
+    assert scope.queryMeasItem('FREQuency', 3) == 9.9e37
+    turn_system_on(HV_supply, LV_supply, arduino, check_power=False)
+    assert scope.queryMeasItem('FREQuency', 3) == 2e6
+    assert scope.queryMeasItem('PDUTy', 3) == pytest.approx(0.25) # duty vref 2.5: half of half a period
+    assert HV_supply.readCurrent() > 0
+    assert LV_supply.readChannelVoltageAndCurrent(1)[0] == 12
+    data = scope.readAllChannels()
+    assert data.shape == (bench.screen_points, 5)
+    assert np.ptp(data[:, 1]) == pytest.approx(50 * 0.1, rel=0.2) # HV of v_pp/2 through the probe cdiv
+    turn_system_off(HV_supply, LV_supply, arduino)
+    assert HV_supply.readCurrent() == 0
+
+
+def test_moves_without_motor_power_are_counted():
+    bench = SimulatedBench(latency_scale=0)
+    arduino = SimulatedPOWAM_MICRO(bench, persistent_session=True)
+    arduino.setIndPos(1, 10)
+    arduino.waitForInductorsToMove()
+    assert bench.unpowered_moves == 1
+
+
+def test_inductance_follows_the_inductor_position():
+    bench = SimulatedBench(latency_scale=0, inductance_gain=1.1, inductance_offset=0.2e-6)
+    arduino = SimulatedPOWAM_MICRO(bench, persistent_session=True)
+    arduino.setIndVal(1, 4) # the 'l' characterization doesn't know about gain and offset
+    arduino.waitForInductorsToMove()
+    assert bench.inductance(1) == pytest.approx(0.2e-6 + 1.1 * 4e-6)
+
+
+def test_motion_model_calibrates_to_the_simulated_motors():
+    bench = SimulatedBench(latency_scale=0)
+    arduino = SimulatedPOWAM_MICRO(bench, persistent_session=True)
+    assert arduino.STEPS_PER_SECOND == POWAM_MICRO.STEPS_PER_SECOND # the driver's guess, not the firmware's
+    arduino.MOTION_POLL_MAX_INTERVAL = arduino.MOTION_POLL_INTERVAL # fine timing for the test
+    for steps in [100, 200, 300]:
+        arduino.moveInd(1, steps)
+        arduino.waitForInductorsToMove()
+    assert arduino.STEPS_PER_SECOND == pytest.approx(bench.firmware.STEPS_PER_SECOND, rel=0.1)
@@ -0,0 +1,18 @@
+# SupplyTelemetrySampler on the simulated HV supply: polls go over a persistent session
+import time
+import pytest
+from helper_code.equipment_control.simulated_equipment import SimulatedBench, SimulatedGENH600
+from helper_code.equipment_control.supply_telemetry import SupplyTelemetrySampler
+
+
+@pytest.mark.parametrize('persistent_session', [False, True])
+def test_sampler_polls_over_a_session(persistent_session):
+    bench = SimulatedBench(latency_scale=0)
+    HV_supply = SimulatedGENH600(bench, persistent_session=persistent_session)
+    HV_supply.setVoltage(100)
+    with SupplyTelemetrySampler(HV_supply, period=0.01) as telemetry:
+        assert HV_supply.ser is not None # opened for the sampler if it wasn't already
+        t0 = time.time()
+        telemetry.meanAfter('HV_V', t0, 0.05) # waits for the window
+        assert len(telemetry.getSamples('HV_V', t0, t0 + 0.05)[1]) > 1
+    assert (HV_supply.ser is not None) == persistent_session # left as it was
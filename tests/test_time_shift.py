@@ -0,0 +1,63 @@
+# the vectorised time shifts against data_array_time_shift_one_signal's original per-sample loop
+import numpy as np
+import pytest
+from helper_code.equipment_control.sawyer_tower_synthesizer import SawyerTowerSynthesizer
+from helper_code.helper_functions import data_array_time_shift_one_signal, time_shift_signal_into, \
+    time_shifts_of_signal
+
+t_step = 1.5e-9
+shifts = [0, t_step, -3*t_step, 0.37e-9, -2.71e-9, 1e-6, -5e-6] # exact samples, fractions, past the edges
+shifts += list(np.random.default_rng(0).uniform(-5e-9, 5e-9, 30))
+
+
+def reference_time_shift(data_array, t_col, d_col, shift):
+    # data_array_time_shift_one_signal as it was, one np.interp call per sample
+    t = data_array[:,t_col]
+    t_new = t + shift
+    d = data_array[:,d_col]
+    d_new = np.zeros(len(d))
+    for index in range(len(t)):
+        t_val = t[index]
+        if t_val < t_new[0]:
+            d_new[index] = d[0]
+        elif t_val > t_new[-1]:
+            d_new[index] = d[-1]
+        else:
+            d_new[index] = np.interp(t_val, t_new, d)
+    data_array[:,d_col] = d_new
+    return data_array
+
+
+def synthesized_capture():
+    # [t, ch1, ch2, ch3, ch4] of one noisy synthesized frame, like a scope capture
+    synthesizer = SawyerTowerSynthesizer(516e-12, 204e-12, 0, probe_cdivs=[0.1, 0.1, 0.1], seed=1)
+    synthesizer.setOperatingPoint(2e6, 225, 0.5, 4e-6, 4e-6)
+    t = -750e-9 + t_step*np.arange(1000)
+    return np.column_stack([t, synthesizer.frames(t, 1)[0].T])
+
+
+@pytest.mark.parametrize('shift', shifts)
+def test_shifts_match_the_per_sample_loop(shift):
+    data = synthesized_capture()
+    buffer = np.empty(len(data))
+    for column in [1, 2, 4]:
+        expected = reference_time_shift(data.copy(), 0, column, shift)
+        assert np.array_equal(data_array_time_shift_one_signal(data.copy(), 0, column, shift), expected)
+        time_shift_signal_into(data[:, 0], data[:, column], shift, buffer)
+        assert np.array_equal(buffer, expected[:, column])
+
+
+def test_many_shifts_match_the_per_sample_loop():
+    data = synthesized_capture()
+    indices = np.arange(200, 700)
+    expected = np.array([reference_time_shift(data.copy(), 0, 1, shift)[:, 1] for shift in shifts])
+    assert np.array_equal(time_shifts_of_signal(data[:, 0], data[:, 1], np.array(shifts)), expected)
+    assert np.array_equal(time_shifts_of_signal(data[:, 0], data[:, 1], np.array(shifts), indices),
+                          expected[:, indices])
+
+
+def test_shift_in_place():
+    data = synthesized_capture()
+    expected = reference_time_shift(data.copy(), 0, 2, 0.37e-9)
+    time_shift_signal_into(data[:, 0], data[:, 2], 0.37e-9, data[:, 2])
+    assert np.array_equal(data, expected)